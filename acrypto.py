@@ -0,0 +1,205 @@
+# acrypto.py
+"""
+Bản asyncio của crypto.py: cùng API (get_cg_prices, get_binance_price,
+check_arbitrage_one, fetch_quotes, format_prices_for_msg) nhưng không block event loop.
+  - 1 httpx.AsyncClient dùng chung (keep-alive, connection pool)
+  - CG và Binance gọi song song (asyncio.gather)
+  - timeout cho từng lần gọi + retry/backoff bằng asyncio.sleep
+  - dùng chung PRICE_CACHE với bản sync (gộp request đang bay)
+"""
+from __future__ import annotations
+import asyncio
+import json
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+
+import metrics
+from upstream import UpstreamError, guard_for
+from crypto import (
+    COINGECKO, BINANCE, PRICE_CACHE, Quote, SpreadScan,
+    normalize_to_cg_ids, map_to_binance, _parse_cg, _parse_binance, _make_quote, format_quotes,
+    _chunks, _listing, rank_spreads,
+)
+
+T = TypeVar("T")
+
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+def _client() -> httpx.AsyncClient:
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = httpx.AsyncClient(
+            headers={"User-Agent": "rotchain-auto/1.0"},
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+            timeout=10.0,
+        )
+    return _CLIENT
+
+async def aclose() -> None:
+    """Đóng client dùng chung (gọi khi bot shutdown)."""
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+async def _get(url: str, params: Optional[Dict] = None, timeout: float = 10, cost: float = 1.0) -> httpx.Response:
+    guard = guard_for(url)
+    await guard.abefore(cost)
+    t0 = time.perf_counter()
+    r: Optional[httpx.Response] = None
+    try:
+        r = await _client().get(url, params=params, timeout=timeout)
+    finally:
+        # Mọi lối ra đều kết thúc lượt của breaker: lỗi mạng, timeout, bị wait_for huỷ = failure
+        if r is None:
+            metrics.observe_http(url, time.perf_counter() - t0, True)
+            guard.failure()
+    metrics.observe_http(url, time.perf_counter() - t0, r.status_code >= 400)
+    guard.observe(r.status_code, r.headers.get("Retry-After"))
+    return r
+
+async def _with_retry(
+    fn: Callable[[], Awaitable[T]],
+    attempts: int = 2,
+    delay: float = 0.6,
+    timeout: float = 10.0,
+) -> T:
+    """
+    Gọi `fn` tối đa `attempts` lần, mỗi lần giới hạn `timeout` giây.
+    Backoff luỹ thừa có jitter giữa các lần; hết lượt thì raise lỗi cuối cùng.
+    """
+    last_exc: Optional[BaseException] = None
+    for i in range(attempts):
+        try:
+            return await asyncio.wait_for(fn(), timeout)
+        except UpstreamError:
+            raise               # breaker open / hết quota: fail fast
+        except httpx.HTTPStatusError as e:
+            last_exc = e
+            code = e.response.status_code
+            if 400 <= code < 500:
+                break           # 429 đã mở breaker theo Retry-After, retry ngay cũng vô ích
+        except (asyncio.TimeoutError, httpx.HTTPError, ValueError, KeyError) as e:
+            last_exc = e
+        if i + 1 < attempts:
+            await asyncio.sleep(delay * (2 ** i) * random.uniform(0.8, 1.2))
+    assert last_exc is not None
+    raise last_exc
+
+async def get_cg_prices(symbols: List[str], vs: str = "usd", timeout: float = 10) -> Dict[str, float]:
+    return await _cg_prices(tuple(sorted(set(normalize_to_cg_ids(symbols)))), vs, timeout)
+
+async def _cg_prices(ids: Tuple[str, ...], vs: str, timeout: float) -> Dict[str, float]:
+    if not ids:
+        return {}
+
+    async def _call():
+        r = await _get(COINGECKO, params={"ids": ",".join(ids), "vs_currencies": vs}, timeout=timeout)
+        r.raise_for_status()
+        return _parse_cg(r.json(), vs)
+
+    try:
+        return await PRICE_CACHE.aget_or_fetch(("cg", vs, ids), lambda: _with_retry(_call, timeout=timeout))
+    except Exception:
+        return {}
+
+async def get_binance_price(symbol: str = "BTCUSDT", timeout: float = 10) -> Optional[float]:
+    pair = symbol.upper()
+
+    async def _call():
+        r = await _get(BINANCE, params={"symbol": pair}, timeout=timeout, cost=2)
+        r.raise_for_status()
+        return float(r.json()["price"])
+
+    try:
+        val = await PRICE_CACHE.aget_or_fetch(("bn", pair), lambda: _with_retry(_call, timeout=timeout))
+    except Exception:
+        return None
+    return float(val) if val is not None else None
+
+async def get_binance_prices(pairs: List[str], timeout: float = 10) -> Dict[str, float]:
+    wanted = sorted({p.upper() for p in pairs if p})
+    if not wanted:
+        return {}
+
+    async def _call():
+        r = await _get(BINANCE, params={"symbols": json.dumps(wanted, separators=(",", ":"))}, timeout=timeout, cost=4)
+        if r.status_code == 400:
+            r = await _get(BINANCE, timeout=timeout, cost=4)
+        r.raise_for_status()
+        return _parse_binance(r.json(), set(wanted))
+
+    try:
+        return await PRICE_CACHE.aget_or_fetch(("bn", tuple(wanted)), lambda: _with_retry(_call, timeout=timeout))
+    except Exception:
+        return {}
+
+async def fetch_quotes(
+    symbols: List[str],
+    vs: str = "usd",
+    timeout: float = 10,
+    binance: Optional[Dict[str, float]] = None,
+) -> List[Quote]:
+    """
+    binance: giá Binance có sẵn (vd. từ PriceStream) -> chỉ gọi CG cho phần còn lại.
+    """
+    syms = [s.strip() for s in symbols if s and s.strip()]
+    if not syms:
+        return []
+    cg_ids = normalize_to_cg_ids(syms)
+    pairs  = [map_to_binance(s) for s in syms]
+
+    if binance is not None and all(p in binance for p in pairs):
+        cg_prices, bn_prices = await get_cg_prices(cg_ids, vs, timeout=timeout), binance
+    else:
+        cg_prices, bn_prices = await asyncio.gather(
+            get_cg_prices(cg_ids, vs, timeout=timeout),
+            get_binance_prices(pairs, timeout=timeout),
+        )
+    return [
+        _make_quote(sym, cg_id, pair, cg_prices.get(cg_id), bn_prices.get(pair))
+        for sym, cg_id, pair in zip(syms, cg_ids, pairs)
+    ]
+
+async def check_arbitrage_one(symbol: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    quotes = await fetch_quotes([symbol], "usd")
+    if not quotes:
+        return (None, None, None)
+    q = quotes[0]
+    return (q.cg, q.bn, q.diff_pct)
+
+async def format_prices_for_msg(symbols: List[str]) -> str:
+    return format_quotes(await fetch_quotes(symbols))
+
+async def get_cg_snapshot(ids: List[str], vs: str = "usd", chunk: int = 250, timeout: float = 10) -> Dict[str, float]:
+    """Giá CG cho rất nhiều id: các lô `chunk` id gọi song song."""
+    out: Dict[str, float] = {}
+    for part in await asyncio.gather(*(_cg_prices(p, vs, timeout) for p in _chunks(ids, chunk))):
+        out.update(part)
+    return out
+
+async def get_binance_all(timeout: float = 10) -> Dict[str, float]:
+    async def _call():
+        r = await _get(BINANCE, timeout=timeout, cost=4)
+        r.raise_for_status()
+        return _parse_binance(r.json())
+
+    try:
+        return await PRICE_CACHE.aget_or_fetch(("bn", "*"), lambda: _with_retry(_call, timeout=timeout))
+    except Exception:
+        return {}
+
+async def scan_spreads(
+    top: int = 10,
+    vs: str = "usd",
+    max_abs_pct: float = 50.0,
+    chunk: int = 250,
+    timeout: float = 10,
+) -> SpreadScan:
+    """Bảng ticker Binance + snapshot CG (vài request song song), rồi xếp hạng Δ% trong 1 lượt NumPy."""
+    _, ids, _ = _listing()
+    cg, bn = await asyncio.gather(get_cg_snapshot(ids, vs, chunk, timeout), get_binance_all(timeout))
+    return rank_spreads(cg, bn, top, max_abs_pct)
@@ -0,0 +1,404 @@
+# alerts.py
+"""
+Cảnh báo giá theo từng user (/watch, /unwatch):
+  - mức giá: "btc above 70k", "btc below 60k" -> bắn 1 lần rồi tự xoá
+  - % trong cửa sổ: "eth -5% 1h", "sol +8% 4h" -> bắn rồi nghỉ hết 1 cửa sổ mới xét lại
+  - mỗi (symbol, loại, cửa sổ) là 1 danh sách ngưỡng đã sort: mỗi tick chỉ cần bisect để lấy
+    đúng đoạn bị vượt, không duyệt hết subscription (100k sub vẫn vài µs / symbol)
+  - lưu SQLite; subscription tạo từ process khác (shard) được nạp thêm mỗi tick
+  - chống gửi trùng: chỉ gửi khi xoá / đánh dấu được bản ghi trong DB (ai xoá trước thì thôi),
+    các cảnh báo cùng chat trong 1 tick gộp thành 1 tin
+"""
+from __future__ import annotations
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import metrics
+from storage import connect
+
+log = logging.getLogger("rotchain.alerts")
+
+ABOVE, BELOW, UP, DOWN = "above", "below", "up", "down"
+KINDS = (ABOVE, BELOW, UP, DOWN)
+MAX_WINDOW = 24 * 3600
+MIN_WINDOW = 5 * 60
+
+class Subscription(NamedTuple):
+    id: int
+    user_id: int
+    chat_id: int
+    symbol: str
+    kind: str
+    threshold: float          # giá (above/below) hoặc % (up > 0, down < 0)
+    window: int               # giây; 0 với above/below
+    created: float
+
+class Fired(NamedTuple):
+    sub: Subscription
+    price: float
+    change_pct: Optional[float]
+
+class WatchError(ValueError):
+    """Cú pháp /watch sai hoặc vượt giới hạn."""
+
+# ====== Parse ======
+_NUM = re.compile(r"^([0-9]*\.?[0-9]+)([km]?)$")
+_PCT = re.compile(r"^([+-])?([0-9]*\.?[0-9]+)%$")
+_WIN = re.compile(r"^([0-9]+)([mhd])$")
+_SYM = re.compile(r"^[a-z0-9][a-z0-9-]{0,29}$")
+_OPS = {"above": ABOVE, ">": ABOVE, ">=": ABOVE, "over": ABOVE, "trên": ABOVE,
+        "below": BELOW, "<": BELOW, "<=": BELOW, "under": BELOW, "dưới": BELOW}
+
+def _number(s: str) -> float:
+    m = _NUM.match(s.lower().replace(",", ""))
+    if not m:
+        raise WatchError(f"không hiểu giá '{s}'")
+    return float(m.group(1)) * {"": 1, "k": 1e3, "m": 1e6}[m.group(2)]
+
+def _window(s: str) -> int:
+    m = _WIN.match(s.lower())
+    if not m:
+        raise WatchError(f"không hiểu cửa sổ '{s}' (vd 30m, 1h, 4h, 1d)")
+    sec = int(m.group(1)) * {"m": 60, "h": 3600, "d": 86400}[m.group(2)]
+    if not MIN_WINDOW <= sec <= MAX_WINDOW:
+        raise WatchError("cửa sổ phải từ 5m tới 1d")
+    return sec
+
+def parse_watch(args: List[str]) -> Tuple[str, str, float, int]:
+    """
+    ["btc", "above", "70k"] | ["btc", ">", "70000"] | ["eth", "-5%", "1h"] | ["sol", "+8%"]
+    -> (symbol, kind, threshold, window)
+    """
+    if len(args) < 2:
+        raise WatchError("thiếu tham số")
+    sym = args[0].lower().lstrip("$")
+    if not _SYM.match(sym):
+        raise WatchError(f"symbol không hợp lệ '{args[0]}'")
+    op = args[1].lower()
+    if op in _OPS:
+        if len(args) < 3:
+            raise WatchError("thiếu mức giá")
+        price = _number(args[2])
+        if price <= 0:
+            raise WatchError("giá phải > 0")
+        return sym, _OPS[op], price, 0
+    m = _PCT.match(op)
+    if not m:
+        raise WatchError(f"không hiểu điều kiện '{args[1]}'")
+    pct = float(m.group(2))
+    if not 0 < pct <= 1000:
+        raise WatchError("% phải trong (0, 1000]")
+    kind = DOWN if m.group(1) == "-" else UP
+    window = _window(args[2]) if len(args) > 2 else 3600
+    return sym, kind, pct if kind == UP else -pct, window
+
+def describe(sub: Subscription) -> str:
+    if sub.kind in (ABOVE, BELOW):
+        return f"{sub.symbol.upper()} {'≥' if sub.kind == ABOVE else '≤'} {sub.threshold:g}"
+    w = sub.window
+    span = f"{w // 86400}d" if w % 86400 == 0 else f"{w // 3600}h" if w % 3600 == 0 else f"{w // 60}m"
+    return f"{sub.symbol.upper()} {sub.threshold:+g}% / {span}"
+
+# ====== Danh sách ngưỡng đã sort ======
+class Thresholds:
+    """List (ngưỡng, id) đã sort. pop_le / pop_ge lấy ra cả đoạn bị vượt bằng 1 lần bisect."""
+
+    __slots__ = ("items",)
+
+    def __init__(self):
+        self.items: List[Tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, threshold: float, sub_id: int) -> None:
+        insort(self.items, (threshold, sub_id))
+
+    def extend(self, items: Iterable[Tuple[float, int]]) -> None:
+        """Nạp hàng loạt: nối rồi sort 1 lần (insort từng cái là O(n²) khi khởi động với 100k sub)."""
+        self.items.extend(items)
+        self.items.sort()
+
+    def remove(self, threshold: float, sub_id: int) -> bool:
+        i = bisect_left(self.items, (threshold, sub_id))
+        if i < len(self.items) and self.items[i] == (threshold, sub_id):
+            del self.items[i]
+            return True
+        return False
+
+    def pop_le(self, x: float) -> List[int]:
+        """Mọi ngưỡng <= x (giá đã lên tới / % đã tăng tới)."""
+        k = bisect_right(self.items, (x, math.inf))
+        if not k:
+            return []
+        out = [sid for _, sid in self.items[:k]]
+        del self.items[:k]
+        return out
+
+    def pop_ge(self, x: float) -> List[int]:
+        """Mọi ngưỡng >= x (giá đã xuống tới / % đã giảm tới)."""
+        k = bisect_left(self.items, (x, -math.inf))
+        if k == len(self.items):
+            return []
+        out = [sid for _, sid in self.items[k:]]
+        del self.items[k:]
+        return out
+
+class _History:
+    """Giá gần đây của 1 symbol (ts tăng dần) để tính % thay đổi theo cửa sổ."""
+
+    __slots__ = ("ts", "px")
+
+    def __init__(self):
+        self.ts: List[float] = []
+        self.px: List[float] = []
+
+    def add(self, ts: float, price: float, keep: float) -> None:
+        self.ts.append(ts)
+        self.px.append(price)
+        cut = bisect_left(self.ts, ts - keep) - 1     # giữ lại 1 điểm ngay trước mốc
+        if cut > 0:
+            del self.ts[:cut]
+            del self.px[:cut]
+
+    def change_pct(self, window: float, now: float) -> Optional[float]:
+        """% so với điểm cuối cùng ở/trước now - window (thiếu lịch sử thì so với điểm cũ nhất)."""
+        if len(self.px) < 2:
+            return None
+        j = max(bisect_right(self.ts, now - window) - 1, 0)
+        ref = self.px[j]
+        return (self.px[-1] - ref) / ref * 100.0 if ref > 0 else None
+
+# ====== Sổ subscription ======
+class AlertBook:
+    def __init__(self, db_path: str, max_per_user: int = 20):
+        self.conn = connect(db_path)
+        self.max_per_user = max_per_user
+        # Gọi từ thread offload: RLock giữ cả SQLite lẫn index trong RAM (evaluate -> load/_commit lồng nhau)
+        self._lock = threading.RLock()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, chat_id INTEGER NOT NULL,"
+                " symbol TEXT NOT NULL, kind TEXT NOT NULL, threshold REAL NOT NULL, window_sec INTEGER NOT NULL,"
+                " created REAL NOT NULL, fired_at REAL,"
+                " UNIQUE(user_id, symbol, kind, threshold, window_sec))"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS alerts_user ON alerts(user_id)")
+        self._subs: Dict[int, Subscription] = {}
+        self._books: Dict[Tuple[str, str, int], Thresholds] = {}
+        self._windows: Dict[str, Set[int]] = {}            # symbol -> các cửa sổ % đang có
+        self._cooldown: List[Tuple[float, int]] = []       # heap (re-arm lúc, id) cho cảnh báo %
+        self._hist: Dict[str, _History] = {}
+        self._last_id = 0
+        self.load()
+
+    # ---- index trong RAM ----
+    def _book(self, sub: Subscription) -> Thresholds:
+        key = (sub.symbol, sub.kind, sub.window)
+        book = self._books.get(key)
+        if book is None:
+            book = self._books[key] = Thresholds()
+            if sub.window:
+                self._windows.setdefault(sub.symbol, set()).add(sub.window)
+        return book
+
+    def _arm(self, sub: Subscription) -> None:
+        self._book(sub).add(sub.threshold, sub.id)
+
+    def _drop(self, sub: Subscription) -> None:
+        self._subs.pop(sub.id, None)
+        book = self._books.get((sub.symbol, sub.kind, sub.window))
+        if book is not None:
+            book.remove(sub.threshold, sub.id)     # đang cooldown thì không có trong book: heap tự bỏ qua
+
+    @staticmethod
+    def _row(r) -> Subscription:
+        return Subscription(r["id"], r["user_id"], r["chat_id"], r["symbol"], r["kind"],
+                            r["threshold"], r["window_sec"], r["created"])
+
+    def load(self) -> int:
+        """Nạp subscription mới (id > id lớn nhất đã thấy) – cả của process khác."""
+        with self._lock:
+            return self._load()
+
+    def _load(self) -> int:
+        rows = self.conn.execute("SELECT * FROM alerts WHERE id > ? ORDER BY id", (self._last_id,)).fetchall()
+        if not rows:
+            return 0
+        now = time.time()
+        batch: Dict[int, Tuple[Thresholds, List[Tuple[float, int]]]] = {}
+        for r in rows:
+            sub = self._row(r)
+            self._subs[sub.id] = sub
+            fired_at = r["fired_at"]
+            if sub.window and fired_at and fired_at + sub.window > now:
+                heapq.heappush(self._cooldown, (fired_at + sub.window, sub.id))
+                continue
+            book = self._book(sub)
+            batch.setdefault(id(book), (book, []))[1].append((sub.threshold, sub.id))
+        for book, items in batch.values():
+            book.extend(items)
+        self._last_id = rows[-1]["id"]
+        return len(rows)
+
+    def __len__(self) -> int:
+        return len(self._subs)
+
+    def symbols(self) -> Set[str]:
+        """Symbol cần lấy giá mỗi tick (kể cả cảnh báo % đang nghỉ: vẫn phải giữ lịch sử giá)."""
+        with self._lock:
+            out = {key[0] for key, book in self._books.items() if book}
+            out.update(self._subs[i].symbol for _, i in self._cooldown if i in self._subs)
+        return out
+
+    # ---- /watch, /unwatch ----
+    def add(self, user_id: int, chat_id: int, symbol: str, kind: str, threshold: float, window: int = 0) -> Subscription:
+        if kind not in KINDS:
+            raise WatchError(f"unknown kind: {kind}")
+        now = time.time()
+        with self._lock, self.conn:
+            n = self.conn.execute("SELECT COUNT(*) FROM alerts WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if n >= self.max_per_user:
+                raise WatchError(f"tối đa {self.max_per_user} cảnh báo mỗi người, /unwatch bớt nhé")
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO alerts (user_id, chat_id, symbol, kind, threshold, window_sec, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, symbol, kind, threshold, window, now),
+            )
+            if not cur.rowcount:
+                raise WatchError("cảnh báo này đã có rồi")
+        with self._lock:
+            self._load()     # nạp cả bản ghi vừa thêm lẫn bản ghi process khác thêm trước đó
+            return self._subs[cur.lastrowid]
+
+    def for_user(self, user_id: int) -> List[Subscription]:
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM alerts WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        return [self._row(r) for r in rows]
+
+    def remove(self, user_id: int, target: str) -> int:
+        """target: id, symbol hoặc "all". Trả về số cảnh báo đã xoá."""
+        if target == "all":
+            where, arg = "user_id = ?", ()
+        elif target.isdigit():
+            where, arg = "user_id = ? AND id = ?", (int(target),)
+        else:
+            where, arg = "user_id = ? AND symbol = ?", (target.lower(),)
+        with self._lock, self.conn:
+            ids = [r[0] for r in self.conn.execute(f"SELECT id FROM alerts WHERE {where}", (user_id, *arg))]
+            self.conn.executemany("DELETE FROM alerts WHERE id = ?", [(i,) for i in ids])
+            for i in ids:
+                sub = self._subs.get(i)
+                if sub is not None:
+                    self._drop(sub)
+        return len(ids)
+
+    # ---- mỗi tick ----
+    def evaluate(self, prices: Dict[str, float], now: Optional[float] = None) -> List[Fired]:
+        """
+        prices: symbol -> giá mới. Trả về cảnh báo cần gửi (đã xoá / đánh dấu trong DB).
+        Chi phí ~ O(số symbol x số cửa sổ x log n + số cảnh báo bắn).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._evaluate(prices, now)
+
+    def _evaluate(self, prices: Dict[str, float], now: float) -> List[Fired]:
+        self._load()
+        while self._cooldown and self._cooldown[0][0] <= now:
+            _, sid = heapq.heappop(self._cooldown)
+            sub = self._subs.get(sid)
+            if sub is not None:
+                self._arm(sub)
+
+        hits: List[Tuple[int, float, Optional[float]]] = []
+        for sym, price in prices.items():
+            if not price or price <= 0 or math.isnan(price):
+                continue
+            windows = self._windows.get(sym)
+            if windows:
+                h = self._hist.get(sym)
+                if h is None:
+                    h = self._hist[sym] = _History()
+                h.add(now, price, max(windows))
+            for kind, pop in ((ABOVE, "pop_le"), (BELOW, "pop_ge")):
+                book = self._books.get((sym, kind, 0))
+                if book:
+                    hits.extend((sid, price, None) for sid in getattr(book, pop)(price))
+            for w in windows or ():
+                chg = h.change_pct(w, now)
+                if chg is None:
+                    continue
+                for kind, pop in ((UP, "pop_le"), (DOWN, "pop_ge")):
+                    book = self._books.get((sym, kind, w))
+                    if book:
+                        hits.extend((sid, price, chg) for sid in getattr(book, pop)(chg))
+        return self._commit(hits, now) if hits else []
+
+    def _commit(self, hits: List[Tuple[int, float, Optional[float]]], now: float) -> List[Fired]:
+        """Mức giá: xoá; %: ghi fired_at + vào cooldown. Bản ghi đã bị xoá nơi khác -> không gửi."""
+        fired: List[Fired] = []
+        with self._lock, self.conn:
+            for sid, price, chg in hits:
+                sub = self._subs.get(sid)
+                if sub is None:
+                    continue
+                if sub.window:
+                    ok = self.conn.execute("UPDATE alerts SET fired_at = ? WHERE id = ?", (now, sid)).rowcount
+                else:
+                    ok = self.conn.execute("DELETE FROM alerts WHERE id = ?", (sid,)).rowcount
+                if not ok:
+                    self._subs.pop(sid, None)
+                    continue
+                if sub.window:
+                    heapq.heappush(self._cooldown, (now + sub.window, sid))
+                else:
+                    self._subs.pop(sid, None)
+                fired.append(Fired(sub, price, chg))
+        metrics.incr("alerts_fired", len(fired))
+        return fired
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "subscriptions": len(self._subs),
+            "armed": sum(len(b) for b in self._books.values()),
+            "cooldown": len(self._cooldown),
+            "symbols": len(self.symbols()),
+        }
+
+    def close(self) -> None:
+        self.conn.close()
+
+def group_by_chat(fired: Iterable[Fired]) -> Dict[int, List[Fired]]:
+    out: Dict[int, List[Fired]] = {}
+    for f in fired:
+        out.setdefault(f.sub.chat_id, []).append(f)
+    return out
+
+def format_fired(items: List[Fired]) -> str:
+    lines = ["🔔 Cảnh báo giá:"]
+    for f in items:
+        s = f.sub
+        if s.kind in (ABOVE, BELOW):
+            lines.append(f"• <b>{s.symbol.upper()}</b> <code>{f.price:.6g}</code> đã "
+                         f"{'vượt' if s.kind == ABOVE else 'xuống dưới'} {s.threshold:g} (đã tắt)")
+        else:
+            lines.append(f"• <b>{s.symbol.upper()}</b> <code>{f.price:.6g}</code> "
+                         f"<b>{f.change_pct:+.2f}%</b> (ngưỡng {describe(s).split(' ', 1)[1]})")
+    return "\n".join(lines)
+
+def format_list(subs: List[Subscription]) -> str:
+    if not subs:
+        return ("Bạn chưa có cảnh báo nào.\n"
+                "Ví dụ: /watch btc above 70k · /watch eth below 3000 · /watch sol -5% 1h")
+    lines = ["🔔 Cảnh báo của bạn:"]
+    lines += [f"<code>#{s.id}</code> {describe(s)}" for s in subs]
+    lines.append("Xoá: /unwatch &lt;id|symbol|all&gt;")
+    return "\n".join(lines)
@@ -0,0 +1,341 @@
+# bench.py
+"""
+Benchmark offline (không cần mạng / token):
+  python bench.py quick_reply --keywords 5000 --messages 2000
+  python bench.py startup --budget-ms 1500 --profile 20
+  python bench.py suite --updates 500 --latency-ms 50 --error-rate 0.01 --save bench.json
+  python bench.py suite --compare bench.json --tolerance 0.25     # exit 1 nếu p99 / updates/s tệ hơn ngưỡng
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# ====== quick_reply: vòng lặp cũ vs Aho–Corasick ======
+_SYLLABLES = [
+    "gia", "giá", "mua", "bán", "airdrop", "claim", "ví", "nạp", "rút", "phí", "token", "coin",
+    "kèo", "lệnh", "hello", "price", "wallet", "bonus", "ref", "mint", "привет", "цена", "价格", "空投",
+]
+
+def _legacy_quick_reply(keywords: Dict[str, str], text: str) -> Optional[str]:
+    t = (text or "").lower().strip()
+    for k, v in keywords.items():
+        if k in t:
+            return v
+    return None
+
+def _gen_keywords(n: int, rng: random.Random) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    while len(out) < n:
+        k = " ".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 2)))
+        k = f"{k}{rng.choice(string.ascii_lowercase)}{rng.randint(0, 999)}"
+        out[k] = f"reply {len(out)}"
+    return out
+
+def _gen_messages(n: int, keywords: List[str], rng: random.Random, hit_ratio: float) -> List[str]:
+    msgs = []
+    for _ in range(n):
+        words = [rng.choice(_SYLLABLES) for _ in range(rng.randint(5, 40))]
+        if rng.random() < hit_ratio:
+            words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        msgs.append(" ".join(words))
+    return msgs
+
+def _time(fn: Callable[[str], object], msgs: List[str]) -> float:
+    t0 = time.perf_counter()
+    for m in msgs:
+        fn(m)
+    return time.perf_counter() - t0
+
+def bench_quick_reply(n_keywords: int, n_messages: int, hit_ratio: float, seed: int) -> None:
+    from matcher import build_matcher
+
+    rng = random.Random(seed)
+    keywords = _gen_keywords(n_keywords, rng)
+    msgs = _gen_messages(n_messages, list(keywords), rng, hit_ratio)
+
+    t0 = time.perf_counter()
+    matcher = build_matcher(keywords)
+    build_s = time.perf_counter() - t0
+
+    legacy_s = _time(lambda m: _legacy_quick_reply(keywords, m), msgs)
+    ac_s = _time(matcher.match, msgs)
+
+    print(f"keywords={n_keywords} messages={n_messages} hit_ratio={hit_ratio}")
+    print(f"  build automaton : {build_s * 1000:8.1f} ms ({len(matcher._goto)} nodes)")
+    print(f"  legacy loop     : {legacy_s / n_messages * 1e6:8.1f} µs/msg")
+    print(f"  aho-corasick    : {ac_s / n_messages * 1e6:8.1f} µs/msg  (x{legacy_s / max(ac_s, 1e-9):.1f})")
+
+# ====== startup: cold start tới lúc Application sẵn sàng (chưa gọi mạng) ======
+_STARTUP_CODE = (
+    "import time; t0 = time.perf_counter(); import main; main.bootstrap(); main.build_application(); "
+    "print(f'READY {(time.perf_counter() - t0) * 1000:.1f}')"
+)
+
+def _startup_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "1:bench")
+    env.setdefault("TELEGRAM_CHAT_ID", "1")
+    env["STATE_DB"] = os.path.join(tempfile.gettempdir(), "rotchain-bench-state.db")
+    return env
+
+def _run_startup(importtime: bool) -> Tuple[float, float, str]:
+    """1 process mới: (wall ms gồm cả khởi động interpreter, ms từ import main tới READY, stderr)."""
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", _STARTUP_CODE]
+    t0 = time.perf_counter()
+    p = subprocess.run(cmd, capture_output=True, text=True, env=_startup_env(),
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = (time.perf_counter() - t0) * 1000
+    if p.returncode != 0:
+        raise SystemExit(f"startup failed:\n{p.stderr[-2000:]}")
+    ready = next((float(l.split()[1]) for l in p.stdout.splitlines() if l.startswith("READY ")), float("nan"))
+    return wall, ready, p.stderr
+
+def _parse_importtime(stderr: str) -> List[Tuple[int, int, str]]:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(self_us), int(cum_us), name.rstrip()))
+    return rows
+
+def bench_startup(runs: int, budget_ms: float, profile: int) -> int:
+    walls, readies = [], []
+    for _ in range(runs):
+        wall, ready, _ = _run_startup(importtime=False)
+        walls.append(wall)
+        readies.append(ready)
+    wall_p50 = statistics.median(walls)
+    print(f"startup runs={runs}")
+    print(f"  process wall : p50 {wall_p50:7.1f} ms  max {max(walls):7.1f} ms")
+    print(f"  import→ready : p50 {statistics.median(readies):7.1f} ms")
+
+    if profile:
+        rows = _parse_importtime(_run_startup(importtime=True)[2])
+        top = [r for r in rows if not r[2].startswith("    ")]      # module nạp trực tiếp (depth <= 1)
+        print(f"  top {profile} imports by cumulative time:")
+        for self_us, cum_us, name in sorted(top, key=lambda r: -r[1])[:profile]:
+            print(f"    {cum_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f})  {name.strip()}")
+
+    if budget_ms and wall_p50 > budget_ms:
+        print(f"  FAIL: p50 {wall_p50:.1f} ms > budget {budget_ms:.0f} ms")
+        return 1
+    if budget_ms:
+        print(f"  OK: within budget {budget_ms:.0f} ms")
+    return 0
+
+# ====== suite: handler thật của main.py chạy với Telegram / CoinGecko / Binance giả lập ======
+SCENARIOS = ("prices", "airdrop", "quick_reply")
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    vals = sorted(values)
+    return vals[min(len(vals) - 1, int(q * len(vals)))]
+
+def _seed_texts(path: str, rng: random.Random) -> List[str]:
+    """Text tin nhắn lấy từ file JSONL (requests.jsonl); không có file thì sinh ngẫu nhiên."""
+    if os.path.exists(path):
+        from webhook import load_updates
+
+        texts = [u["message"]["text"] for u in load_updates(path) if u.get("message", {}).get("text")]
+        if texts:
+            return texts
+    return _gen_messages(200, ["hello", "giá", "airdrop"], rng, 0.5)
+
+def _gen_updates(scenario: str, n: int, texts: List[str], rng: random.Random, chats: int, start_id: int) -> List[Dict[str, Any]]:
+    from webhook import synth_update
+
+    out = []
+    for i in range(n):
+        chat = rng.randint(1, chats)
+        if scenario == "prices":
+            text = "/prices"
+        elif scenario == "airdrop":
+            text = " ".join(x for x in ("/airdrop", rng.choice(["", "open", "all", "upcoming"]), str(rng.randint(1, 3))) if x)
+        else:
+            text = rng.choice(texts)
+            if rng.random() < 0.3:          # chèn từ khoá chắc chắn khớp
+                text = f"{text} {rng.choice(['hello', 'giá', 'alo'])}"
+        out.append(synth_update(start_id + i, text, chat_id=chat, user_id=chat))
+    return out
+
+async def _drive(app, updates: List[Dict[str, Any]], concurrency: int) -> Tuple[List[float], float]:
+    """Đẩy update qua app.process_update với `concurrency` worker; trả (latency từng update, wall)."""
+    from telegram import Update
+
+    it = iter(updates)
+    lat: List[float] = []
+
+    async def worker():
+        for raw in it:
+            upd = Update.de_json(raw, app.bot)
+            t0 = time.perf_counter()
+            await app.process_update(upd)
+            lat.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return lat, time.perf_counter() - t0
+
+async def _suite(args) -> Dict[str, Dict[str, float]]:
+    from fakes import start_http_fakes
+
+    rng = random.Random(args.seed)
+    tg, cg, bn = await start_http_fakes(
+        args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate,
+        telegram_latency=args.telegram_latency_ms / 1000, seed=args.seed,
+    )
+    # Settings đọc env lúc import config -> phải set trước khi import main
+    tmp = tempfile.mkdtemp(prefix="rotchain-bench-")
+    os.environ.update({
+        "BOT_TOKEN": "123:bench", "TELEGRAM_CHAT_ID": "1", "BOT_MODE": "polling", "METRICS_PORT": "0",
+        "TELEGRAM_API_URL": tg.api, "COINGECKO_API": cg.api, "BINANCE_API": bn.api,
+        "STATE_DB": os.path.join(tmp, "state.db"), "PRICE_STREAM_ENABLED": "0",
+        # shedding trả về ngay và chạy việc nền -> latency process_update không còn ý nghĩa
+        "LOAD_SHEDDING": "1" if args.shedding else "0",
+    })
+    if args.cache_ttl is not None:
+        os.environ["PRICE_CACHE_TTL"] = str(args.cache_ttl)
+    if "config" in sys.modules:
+        print("  warning: config already imported, fake URLs may not apply")
+
+    import main as bot
+    import metrics
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.ERROR)
+    bot.bootstrap()
+    app = bot.build_application(jobs=False, rate_limiter=args.rate_limiter)
+    await app.initialize()
+    await app.start()
+
+    texts = _seed_texts(args.seed_file, rng)
+    results: Dict[str, Dict[str, float]] = {}
+    next_id = 1
+    print(f"suite updates={args.updates} concurrency={args.concurrency} latency={args.latency_ms:g}ms "
+          f"error_rate={args.error_rate:g} rate_limiter={args.rate_limiter}")
+    print(f"  {'scenario':<12}{'n':>6}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'upd/s':>9}{'sent':>7}{'err':>5}")
+    try:
+        for scenario in args.scenarios:
+            warm = _gen_updates(scenario, min(10, args.updates), texts, rng, args.chats, next_id)
+            next_id += len(warm)
+            await _drive(app, warm, args.concurrency)
+
+            updates = _gen_updates(scenario, args.updates, texts, rng, args.chats, next_id)
+            next_id += len(updates)
+            sent0 = tg.calls.get("sendMessage", 0)
+            err0 = metrics._COUNTERS.get("update_errors", 0) + metrics._COUNTERS.get("reply_errors", 0)
+            lat, wall = await _drive(app, updates, args.concurrency)
+            sent = tg.calls.get("sendMessage", 0) - sent0
+            errs = metrics._COUNTERS.get("update_errors", 0) + metrics._COUNTERS.get("reply_errors", 0) - err0
+            r = results[scenario] = {
+                "n": len(lat),
+                "p50_ms": _pct(lat, 0.50) * 1000,
+                "p99_ms": _pct(lat, 0.99) * 1000,
+                "max_ms": max(lat) * 1000,
+                "updates_per_s": len(lat) / wall if wall else 0.0,
+            }
+            print(f"  {scenario:<12}{r['n']:>6}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}"
+                  f"{r['updates_per_s']:>9.0f}{sent:>7}{errs:>5}")
+    finally:
+        await app.stop()
+        await app.shutdown()
+        await bot.on_shutdown(app)
+        for f in (tg, cg, bn):
+            await f.stop()
+    print(f"  upstream requests: coingecko={cg.requests} binance={bn.requests} (injected errors "
+          f"{cg.errors + bn.errors}), telegram={sum(tg.calls.values())}")
+    if args.shedding:
+        c = metrics._COUNTERS
+        print(f"  shedding: chat={c.get('shed_chat', 0)} user={c.get('shed_user', 0)} dropped={c.get('shed_dropped', 0)}")
+    return results
+
+def _compare(results: Dict[str, Dict[str, float]], baseline_path: str, tolerance: float) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    failed = 0
+    for scenario, r in results.items():
+        b = base.get(scenario)
+        if not b:
+            continue
+        p99_limit = b["p99_ms"] * (1 + tolerance)
+        ups_floor = b["updates_per_s"] * (1 - tolerance)
+        bad = []
+        if r["p99_ms"] > p99_limit:
+            bad.append(f"p99 {r['p99_ms']:.1f} > {p99_limit:.1f} ms")
+        if r["updates_per_s"] < ups_floor:
+            bad.append(f"upd/s {r['updates_per_s']:.0f} < {ups_floor:.0f}")
+        if bad:
+            failed += 1
+            print(f"  REGRESSION {scenario}: " + "; ".join(bad))
+    if not failed:
+        print(f"  OK: within {tolerance:.0%} of {baseline_path}")
+    return 1 if failed else 0
+
+def bench_suite(args) -> int:
+    results = asyncio.run(_suite(args))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"  saved {args.save}")
+    if args.compare:
+        return _compare(results, args.compare, args.tolerance)
+    return 0
+
+def main():
+    ap = argparse.ArgumentParser(description="rotchain-auto offline benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    q = sub.add_parser("quick_reply", help="so khớp từ khoá: vòng lặp cũ vs matcher")
+    q.add_argument("--keywords", type=int, default=5000)
+    q.add_argument("--messages", type=int, default=2000)
+    q.add_argument("--hit-ratio", type=float, default=0.3)
+    q.add_argument("--seed", type=int, default=42)
+
+    st = sub.add_parser("startup", help="thời gian cold start (import main + bootstrap + build app)")
+    st.add_argument("--runs", type=int, default=5)
+    st.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1500")),
+                    help="p50 wall vượt ngưỡng -> exit code 1 (0 = không kiểm tra)")
+    st.add_argument("--profile", type=int, default=0, metavar="N", help="in N import tốn thời gian nhất (-X importtime)")
+
+    su = sub.add_parser("suite", help="throughput/latency handler main.py với fake Telegram/CoinGecko/Binance")
+    su.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    su.add_argument("--updates", type=int, default=300, help="số update mỗi scenario")
+    su.add_argument("--concurrency", type=int, default=16)
+    su.add_argument("--chats", type=int, default=50)
+    su.add_argument("--latency-ms", type=float, default=50, help="độ trễ CoinGecko/Binance giả")
+    su.add_argument("--telegram-latency-ms", type=float, default=20)
+    su.add_argument("--jitter-ms", type=float, default=10)
+    su.add_argument("--error-rate", type=float, default=0.0)
+    su.add_argument("--cache-ttl", type=float, default=None, help="ghi đè PRICE_CACHE_TTL (0 = luôn gọi upstream)")
+    su.add_argument("--rate-limiter", action="store_true", help="bật AIORateLimiter như production")
+    su.add_argument("--shedding", action="store_true", help="bật LOAD_SHEDDING (đo số update bị bỏ, không đo latency)")
+    su.add_argument("--seed-file", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "requests.jsonl"))
+    su.add_argument("--seed", type=int, default=42)
+    su.add_argument("--save", default="", help="ghi kết quả JSON (làm baseline)")
+    su.add_argument("--compare", default="", help="so với baseline JSON")
+    su.add_argument("--tolerance", type=float, default=0.25)
+    su.add_argument("--verbose", action="store_true")
+
+    args = ap.parse_args()
+    if args.cmd == "quick_reply":
+        bench_quick_reply(args.keywords, args.messages, args.hit_ratio, args.seed)
+    elif args.cmd == "startup":
+        sys.exit(bench_startup(args.runs, args.budget_ms, args.profile))
+    elif args.cmd == "suite":
+        sys.exit(bench_suite(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+# broadcast.py
+"""
+Gửi 1 tin tới mọi người đã đăng ký (/start), chạy được lại sau restart:
+  - registry subscriber + từng đợt broadcast + trạng thái từng người nhận đều nằm trong SQLite
+  - tạo đợt = chụp danh sách subscriber lúc đó; chạy lại chỉ gửi những người còn "pending"
+  - N worker async ăn chung 1 hàng đợi; token bucket riêng giữ tốc độ dưới trần ~30 tin/s của Telegram
+    (chừa chỗ cho lệnh thường), AIORateLimiter vẫn lo giới hạn từng chat / group ở tầng dưới
+  - RetryAfter lọt qua AIORateLimiter -> cả đợt dừng đúng retry_after giây rồi gửi lại người đó
+    (không tính vào số lần thử: Telegram chỉ bảo chờ, không phải lỗi)
+  - nội dung hỏng (HTML sai, quá dài) -> dừng cả đợt ngay ở người đầu tiên, không gửi N request chắc chắn lỗi
+  - bị chặn / bị kick / chat không còn -> tự huỷ đăng ký; group nâng cấp (ChatMigrated) -> đổi sang id mới
+  - kết quả ghi theo lô (mỗi giây), kèm heartbeat: process chết thì process khác nhận lại đợt đang dở
+  - admin nhận 1 tin tiến độ được sửa định kỳ: đã gửi, lỗi, bị chặn, tin/s, ETA
+Một người có thể nhận trùng nếu process chết trước khi lô kết quả cuối được ghi (tối đa ~1 giây gửi).
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+import metrics
+from storage import connect
+from upstream import TokenBucket
+
+log = logging.getLogger("rotchain.broadcast")
+
+PENDING, SENT, FAILED, BLOCKED = 0, 1, 2, 3
+RUNNING, DONE, CANCELLED = "running", "done", "cancelled"
+MAX_TRIES = 3
+STALE_SEC = 60.0              # heartbeat cũ hơn -> coi như process chạy đợt đó đã chết
+# BadRequest do chính nội dung tin: người nhận nào cũng sẽ lỗi y hệt
+_BAD_TEXT = ("can't parse entities", "message is too long", "message text is empty", "text must be non-empty")
+
+def bad_text(error: BaseException) -> bool:
+    return isinstance(error, BadRequest) and any(m in str(error).lower() for m in _BAD_TEXT)
+
+class _BadText(Exception):
+    pass
+
+class Job(NamedTuple):
+    id: int
+    text: str
+    admin_chat: int
+    report_msg: Optional[int]
+    status: str
+    created: float
+
+class SubscriberStore:
+    def __init__(self, db_path: str):
+        self.conn = connect(db_path)
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS subscribers ("
+                " chat_id INTEGER PRIMARY KEY, user_id INTEGER, active INTEGER NOT NULL DEFAULT 1,"
+                " created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS broadcasts ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL, admin_chat INTEGER NOT NULL,"
+                " report_msg INTEGER, status TEXT NOT NULL, created REAL NOT NULL, heartbeat REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries ("
+                " bid INTEGER NOT NULL, chat_id INTEGER NOT NULL, state INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (bid, chat_id)) WITHOUT ROWID"
+            )
+
+    # ---- registry ----
+    def subscribe(self, chat_id: int, user_id: Optional[int] = None) -> bool:
+        """True nếu là đăng ký mới (hoặc đăng ký lại sau khi đã huỷ)."""
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT active FROM subscribers WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row and row[0]:
+                return False
+            self.conn.execute(
+                "INSERT INTO subscribers (chat_id, user_id, active, created, updated) VALUES (?, ?, 1, ?, ?)"
+                " ON CONFLICT(chat_id) DO UPDATE SET active = 1, user_id = excluded.user_id, updated = excluded.updated",
+                (chat_id, user_id, now, now),
+            )
+        return True
+
+    def unsubscribe(self, chat_id: int) -> bool:
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "UPDATE subscribers SET active = 0, updated = ? WHERE chat_id = ? AND active = 1",
+                (time.time(), chat_id),
+            )
+        return cur.rowcount > 0
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM subscribers WHERE active = 1").fetchone()[0]
+
+    # ---- broadcast ----
+    def create(self, text: str, admin_chat: int, extra: Iterable[int] = ()) -> Tuple[int, int]:
+        """Chụp danh sách người nhận (subscriber đang active + extra). Trả về (id đợt, số người nhận)."""
+        now = time.time()
+        with self._lock, self.conn:
+            bid = self.conn.execute(
+                "INSERT INTO broadcasts (text, admin_chat, status, created, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                (text, admin_chat, RUNNING, now, now),
+            ).lastrowid
+            self.conn.execute(
+                "INSERT INTO deliveries (bid, chat_id) SELECT ?, chat_id FROM subscribers WHERE active = 1", (bid,)
+            )
+            self.conn.executemany("INSERT OR IGNORE INTO deliveries (bid, chat_id) VALUES (?, ?)",
+                                  [(bid, c) for c in extra if c])
+            total = self.conn.execute("SELECT COUNT(*) FROM deliveries WHERE bid = ?", (bid,)).fetchone()[0]
+        return bid, total
+
+    def get(self, bid: int) -> Optional[Job]:
+        row = self.conn.execute(
+            "SELECT id, text, admin_chat, report_msg, status, created FROM broadcasts WHERE id = ?", (bid,)
+        ).fetchone()
+        return Job(*row) if row else None
+
+    def pending(self, bid: int) -> List[int]:
+        return [r[0] for r in self.conn.execute(
+            "SELECT chat_id FROM deliveries WHERE bid = ? AND state = ? ORDER BY chat_id", (bid, PENDING)
+        )]
+
+    def counts(self, bid: int) -> Dict[int, int]:
+        return dict(self.conn.execute(
+            "SELECT state, COUNT(*) FROM deliveries WHERE bid = ? GROUP BY state", (bid,)
+        ).fetchall())
+
+    def record(
+        self,
+        bid: int,
+        results: List[Tuple[int, int]],
+        migrated: Iterable[Tuple[int, int]] = (),
+        report_msg: Optional[int] = None,
+    ) -> str:
+        """
+        Ghi 1 lô kết quả (chat_id, state) + heartbeat; người bị chặn thì huỷ đăng ký luôn.
+        migrated: (id cũ, id mới) của group đã lên supergroup -> đăng ký và dòng giao hàng chuyển sang id mới.
+        Trả về status hiện tại của đợt (admin có thể đã huỷ từ process khác).
+        """
+        with self._lock, self.conn:
+            for old, new in migrated:
+                self.conn.execute("UPDATE OR IGNORE subscribers SET chat_id = ?, updated = ? WHERE chat_id = ?",
+                                  (new, time.time(), old))
+                self.conn.execute("UPDATE OR IGNORE deliveries SET chat_id = ? WHERE bid = ? AND chat_id = ?",
+                                  (new, bid, old))
+                self.conn.execute("DELETE FROM deliveries WHERE bid = ? AND chat_id = ?", (bid, old))
+            self.conn.executemany("UPDATE deliveries SET state = ? WHERE bid = ? AND chat_id = ?",
+                                  [(state, bid, chat_id) for chat_id, state in results])
+            blocked = [(time.time(), c) for c, state in results if state == BLOCKED]
+            if blocked:
+                self.conn.executemany("UPDATE subscribers SET active = 0, updated = ? WHERE chat_id = ?", blocked)
+            self.conn.execute(
+                "UPDATE broadcasts SET heartbeat = ?, report_msg = COALESCE(?, report_msg) WHERE id = ?",
+                (time.time(), report_msg, bid),
+            )
+            return self.conn.execute("SELECT status FROM broadcasts WHERE id = ?", (bid,)).fetchone()[0]
+
+    def finish(self, bid: int, status: str = DONE) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE broadcasts SET status = ? WHERE id = ? AND status = ?", (status, bid, RUNNING))
+
+    def cancel(self, bid: Optional[int] = None) -> int:
+        """Huỷ 1 đợt (hoặc mọi đợt đang chạy); process đang gửi thấy ở lần ghi lô kế tiếp."""
+        with self._lock, self.conn:
+            if bid is None:
+                cur = self.conn.execute("UPDATE broadcasts SET status = ? WHERE status = ?", (CANCELLED, RUNNING))
+            else:
+                cur = self.conn.execute("UPDATE broadcasts SET status = ? WHERE id = ? AND status = ?",
+                                        (CANCELLED, bid, RUNNING))
+        return cur.rowcount
+
+    def release(self, bid: int) -> None:
+        """Dừng có chủ đích (shutdown): cho phép nhận lại ngay, không chờ heartbeat cũ."""
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE broadcasts SET heartbeat = 0 WHERE id = ? AND status = ?", (bid, RUNNING))
+
+    def claim(self, stale_sec: float = STALE_SEC) -> List[Job]:
+        """Nhận các đợt đang dở mà không process nào chạy (heartbeat cũ). Chỉ 1 process nhận được mỗi đợt."""
+        now = time.time()
+        out = []
+        with self._lock, self.conn:
+            rows = self.conn.execute("SELECT id FROM broadcasts WHERE status = ? AND heartbeat < ?",
+                                     (RUNNING, now - stale_sec)).fetchall()
+            for (bid,) in rows:
+                cur = self.conn.execute("UPDATE broadcasts SET heartbeat = ? WHERE id = ? AND status = ? AND heartbeat < ?",
+                                        (now, bid, RUNNING, now - stale_sec))
+                if cur.rowcount:
+                    out.append(bid)
+        return [job for job in map(self.get, out) if job]
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+def _fmt_eta(sec: float) -> str:
+    sec = int(sec)
+    if sec >= 3600:
+        return f"{sec // 3600}h{sec % 3600 // 60:02d}m"
+    return f"{sec // 60}m{sec % 60:02d}s" if sec >= 60 else f"{sec}s"
+
+class _Progress:
+    """Trạng thái 1 đợt trong RAM: bộ đếm + lô kết quả chưa ghi xuống DB."""
+
+    def __init__(self, job: Job, counts: Dict[int, int]):
+        self.job = job
+        self.report_msg = job.report_msg
+        self.done = {s: counts.get(s, 0) for s in (SENT, FAILED, BLOCKED)}
+        self.total = sum(self.done.values()) + counts.get(PENDING, 0)
+        self.sent_now = 0
+        self.started = time.monotonic()
+        self.last_report = 0.0
+        self.results: List[Tuple[int, int]] = []
+        self.migrated: List[Tuple[int, int]] = []
+        self.error = ""                              # lỗi nội dung -> huỷ cả đợt
+
+    def take(self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        batch, moves = self.results, self.migrated
+        self.results, self.migrated = [], []
+        return batch, moves
+
+    def format(self, status: str = RUNNING) -> str:
+        processed = sum(self.done.values())
+        rate = self.sent_now / max(time.monotonic() - self.started, 1e-6)
+        pct = processed / self.total * 100.0 if self.total else 100.0
+        head = {RUNNING: "📣", DONE: "✅", CANCELLED: "⛔"}[status]
+        note = " – đã huỷ" if status == CANCELLED else ""
+        speed = f"Tốc độ {rate:.1f} tin/s"
+        if status == RUNNING and rate:
+            speed += f" · ETA {_fmt_eta((self.total - processed) / rate)}"
+        text = (
+            f"{head} Broadcast #{self.job.id}{note}: {processed}/{self.total} ({pct:.1f}%)\n"
+            f"Đã gửi {self.done[SENT]} · bị chặn {self.done[BLOCKED]} (đã huỷ đăng ký) · lỗi {self.done[FAILED]}\n"
+            f"{speed}"
+        )
+        return f"{text}\nNội dung lỗi: {self.error}" if self.error else text
+
+class Broadcaster:
+    """
+    Chạy các đợt: mỗi đợt 1 hàng đợi chat_id pending + `concurrency` worker;
+    bucket `rate` tin/s dùng chung mọi đợt của process.
+    db: hàm chạy code SQLite ngoài event loop (vd. offloader.run).
+    """
+
+    def __init__(
+        self,
+        store: SubscriberStore,
+        bot,
+        db: Callable[..., Awaitable[Any]],
+        rate: float = 25.0,
+        concurrency: int = 8,
+        report_sec: float = 10.0,
+    ):
+        self.store = store
+        self.bot = bot
+        self.db = db
+        self.bucket = TokenBucket(rate, max(1.0, rate))
+        self.concurrency = max(1, concurrency)
+        self.report_sec = report_sec
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self._resume_at = 0.0                        # RetryAfter: cả pipeline nghỉ tới lúc này (monotonic)
+
+    def start(self, job: Job) -> bool:
+        if job.id in self.tasks:
+            return False
+        task = asyncio.get_running_loop().create_task(self.run(job), name=f"broadcast-{job.id}")
+        self.tasks[job.id] = task
+        task.add_done_callback(lambda t: self._done(job.id, t))
+        return True
+
+    def _done(self, bid: int, task: asyncio.Task) -> None:
+        self.tasks.pop(bid, None)
+        if not task.cancelled() and task.exception() is not None:
+            metrics.incr("broadcast_crashed")
+            log.error("Broadcast %d crashed", bid, exc_info=task.exception())
+
+    async def stop(self) -> None:
+        """Shutdown: dừng mọi đợt, ghi phần đã gửi; đợt dở được nhận lại ở lần chạy sau."""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _send(self, job: Job, chat_id: int) -> Tuple[int, Optional[int], float]:
+        """1 lần gửi -> (state; PENDING = gửi lại, chat id mới nếu group đã migrate, giây phải nghỉ)."""
+        try:
+            await self.bot.send_message(chat_id, job.text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+            return SENT, None, 0.0
+        except RetryAfter as e:
+            return PENDING, None, float(e.retry_after)
+        except Forbidden:
+            return BLOCKED, None, 0.0
+        except ChatMigrated as e:
+            return PENDING, e.new_chat_id, 0.0
+        except BadRequest as e:
+            if bad_text(e):
+                raise _BadText(str(e)) from e
+            msg = str(e).lower()
+            return (BLOCKED if "chat not found" in msg or "deactivated" in msg else FAILED), None, 0.0
+        except NetworkError as e:
+            log.debug("Broadcast %d -> %s: %s", job.id, chat_id, e)
+            return PENDING, None, 0.0
+        except Exception as e:              # TelegramError khác / lỗi lạ: người này coi như lỗi, đợt vẫn chạy
+            log.warning("Broadcast %d -> %s failed: %r", job.id, chat_id, e)
+            return FAILED, None, 0.0
+
+    async def _worker(self, p: _Progress, queue: "asyncio.Queue[Tuple[int, int]]") -> None:
+        while True:
+            chat_id, tries = await queue.get()
+            try:
+                if p.error:
+                    continue                        # đợt sắp bị huỷ: để nguyên pending
+                while (pause := self._resume_at - time.monotonic()) > 0:
+                    await asyncio.sleep(pause)
+                await self.bucket.aacquire(1.0, max_wait=3600)
+                state, new_id, backoff = await self._send(p.job, chat_id)
+                if backoff:                         # flood control: chờ rồi gửi lại, không tính 1 lần thử
+                    self._resume_at = max(self._resume_at, time.monotonic() + backoff)
+                    metrics.incr("broadcast_retry_after")
+                    queue.put_nowait((chat_id, tries))
+                    continue
+                if new_id:
+                    p.migrated.append((chat_id, new_id))
+                    queue.put_nowait((new_id, tries))
+                    continue
+                if state == PENDING:
+                    if tries + 1 < MAX_TRIES:
+                        queue.put_nowait((chat_id, tries + 1))
+                        continue
+                    state = FAILED
+                self._count(p, chat_id, state)
+            except _BadText as e:
+                p.error = p.error or str(e)
+            except Exception:                       # không để worker chết lặng lẽ (queue.join() sẽ treo)
+                log.exception("Broadcast %d worker error at chat %s", p.job.id, chat_id)
+                self._count(p, chat_id, FAILED)
+            finally:
+                queue.task_done()
+
+    @staticmethod
+    def _count(p: _Progress, chat_id: int, state: int) -> None:
+        p.results.append((chat_id, state))
+        p.done[state] += 1
+        if state == SENT:
+            p.sent_now += 1
+        metrics.incr(("", "broadcast_sent", "broadcast_failed", "broadcast_blocked")[state])
+
+    async def _flush(self, p: _Progress) -> str:
+        """Ghi lô kết quả + heartbeat (offloader), sửa tin tiến độ mỗi report_sec. Trả về status trong DB."""
+        if time.monotonic() - p.last_report >= self.report_sec:
+            p.last_report = time.monotonic()
+            await self._report(p)
+        batch, moves = p.take()
+        try:
+            return await self.db(self.store.record, p.job.id, batch, moves, p.report_msg)
+        except Exception as e:            # offloader quá tải / quá giờ: giữ lô lại, ghi ở lượt sau (record idempotent)
+            p.results[:0], p.migrated[:0] = batch, moves
+            metrics.incr("broadcast_flush_errors")
+            log.warning("Broadcast %d flush failed: %s", p.job.id, e)
+            return RUNNING
+
+    async def _report(self, p: _Progress, status: str = RUNNING) -> None:
+        text = p.format(status)
+        try:
+            if p.report_msg:
+                await self.bot.edit_message_text(text, chat_id=p.job.admin_chat, message_id=p.report_msg)
+            else:
+                p.report_msg = (await self.bot.send_message(p.job.admin_chat, text)).message_id
+        except Exception as e:            # "message is not modified", admin chặn bot, ...: không ảnh hưởng đợt gửi
+            log.debug("Broadcast report failed: %s", e)
+
+    async def run(self, job: Job) -> None:
+        pending = await self.db(self.store.pending, job.id)
+        p = _Progress(job, await self.db(self.store.counts, job.id))
+        queue: "asyncio.Queue[Tuple[int, int]]" = asyncio.Queue()
+        for chat_id in pending:
+            queue.put_nowait((chat_id, 0))
+        log.info("Broadcast %d: %d/%d pending", job.id, len(pending), p.total)
+
+        workers = [asyncio.create_task(self._worker(p, queue)) for _ in range(self.concurrency)]
+        joined = asyncio.ensure_future(queue.join())
+        status = RUNNING
+        stopping = False
+        try:
+            while not joined.done():
+                await asyncio.wait({joined}, timeout=1.0)
+                status = await self._flush(p)
+                if p.error and status == RUNNING:
+                    log.warning("Broadcast %d aborted: %s", job.id, p.error)
+                    await self.db(self.store.cancel, job.id)
+                    status = CANCELLED
+                if status != RUNNING:
+                    break
+            else:
+                status = DONE
+        except asyncio.CancelledError:
+            stopping = True
+            raise
+        finally:
+            joined.cancel()
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            batch, moves = p.take()
+
+            def close() -> None:
+                self.store.record(job.id, batch, moves, p.report_msg)
+                if status == RUNNING:
+                    self.store.release(job.id)
+                else:
+                    self.store.finish(job.id, status)
+
+            if stopping:
+                close()                   # shutdown: loop sắp đóng, offloader có thể đã ngừng nhận việc
+            else:
+                try:
+                    await self.db(close)
+                except Exception as e:    # không được mất kết quả (sẽ gửi trùng khi resume): ghi thẳng
+                    log.warning("Broadcast %d final write via offloader failed (%s), writing inline", job.id, e)
+                    close()
+            if status == RUNNING:
+                log.info("Broadcast %d paused at %d/%d", job.id, sum(p.done.values()), p.total)
+            else:
+                log.info("Broadcast %d %s: %s", job.id, status, p.done)
+                await self._report(p, status)
@@ -16,6 +16,7 @@ def getenv_list(key):
 class Settings:
     BOT_TOKEN        = os.getenv("BOT_TOKEN", "").strip()
     TELEGRAM_CHAT_ID = getenv_int("TELEGRAM_CHAT_ID", 0)
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").strip()   # Bot API server riêng / fakes.py; rỗng = api.telegram.org
     ADMIN_IDS        = set(int(x) for x in getenv_list("ADMIN_IDS"))
     LP_URL           = os.getenv("LP_URL", "https://rotchain.click")
 
@@ -27,16 +28,95 @@ class Settings:
         "giá": "Thông tin giá/ưu đãi xem tại link:"
     }
 
+    KEYWORDS_FILE          = os.getenv("KEYWORDS_FILE", "")                 # JSON từ khoá bổ sung (tuỳ chọn)
+    KEYWORD_WORD_BOUNDARY  = os.getenv("KEYWORD_WORD_BOUNDARY", "0") == "1"
+
+    AIRDROP_BACKEND        = os.getenv("AIRDROP_BACKEND", "json")          # json | sqlite
+    AIRDROP_DB             = os.getenv("AIRDROP_DB", "data/airdrops.db")
+    AIRDROP_PAGE_SIZE      = getenv_int("AIRDROP_PAGE_SIZE", 8)
+
     CRYPTO_WATCH_ENABLED   = os.getenv("CRYPTO_WATCH_ENABLED", "1") == "1"
     SYMBOLS                = getenv_list("SYMBOLS") or ["btc", "eth", "bnb"]
     ALERT_UP_PCT           = float(os.getenv("ALERT_UP_PCT", "3"))
     ALERT_DOWN_PCT         = float(os.getenv("ALERT_DOWN_PCT", "3"))
+    ALERT_WINDOW_MIN       = getenv_int("ALERT_WINDOW_MIN", 60)
+    PRICE_POLL_MIN         = getenv_int("PRICE_POLL_MIN", 5)
+    ALERTS_DB              = os.getenv("ALERTS_DB", "data/alerts.db")   # /watch của từng user
+    ALERT_MAX_PER_USER     = getenv_int("ALERT_MAX_PER_USER", 20)
+    PRICE_HISTORY_SIZE     = getenv_int("PRICE_HISTORY_SIZE", 288)   # 288 tick x 5 phút = 24h
+    PRICE_EMA_ALPHA        = float(os.getenv("PRICE_EMA_ALPHA", "0.2"))
     PRICE_BASE_CURRENCY    = os.getenv("PRICE_BASE_CURRENCY", "usd")
+    COINGECKO_API          = os.getenv("COINGECKO_API", "https://api.coingecko.com/api/v3").rstrip("/")
+    BINANCE_API            = os.getenv("BINANCE_API", "https://api.binance.com/api/v3").rstrip("/")  # trỏ về fakes.py khi bench
+    SYMBOL_INDEX_PATH      = os.getenv("SYMBOL_INDEX_PATH", "data/symbols.idx")
+    SYMBOL_REFRESH_HOURS   = getenv_int("SYMBOL_REFRESH_HOURS", 24)
+    PRICE_STREAM_ENABLED   = os.getenv("PRICE_STREAM_ENABLED", "0") == "1"
+    PRICE_STREAM_URL       = os.getenv("PRICE_STREAM_URL", "wss://stream.binance.com:9443/stream")
+    PRICE_STREAM_TICK_SEC  = getenv_int("PRICE_STREAM_TICK_SEC", 10)   # chu kỳ xét ngưỡng khi streaming
+    PRICE_STREAM_MAX_AGE   = getenv_int("PRICE_STREAM_MAX_AGE", 30)    # giây: giá stream cũ hơn thì bỏ
+    CG_RATE_PER_MIN        = float(os.getenv("CG_RATE_PER_MIN", "30"))
+    BINANCE_WEIGHT_PER_MIN = float(os.getenv("BINANCE_WEIGHT_PER_MIN", "3000"))
+    BREAKER_FAILURES       = getenv_int("BREAKER_FAILURES", 3)
+    BREAKER_RESET_SEC      = float(os.getenv("BREAKER_RESET_SEC", "30"))
+    PRICE_CACHE_TTL        = float(os.getenv("PRICE_CACHE_TTL", "30"))      # giây: dữ liệu còn "tươi"
+    PRICE_CACHE_STALE      = float(os.getenv("PRICE_CACHE_STALE", "600"))   # giây: còn dùng được khi upstream lỗi
+    PRICE_CACHE_MAX        = getenv_int("PRICE_CACHE_MAX", 256)
+    SPREAD_TOP_N           = getenv_int("SPREAD_TOP_N", 10)           # /spread_top mặc định
+    SPREAD_MAX_PCT         = float(os.getenv("SPREAD_MAX_PCT", "50"))  # |Δ| lớn hơn: coi là map nhầm coin, bỏ
+    SPREAD_CG_CHUNK        = getenv_int("SPREAD_CG_CHUNK", 250)        # số id CoinGecko mỗi request
+    SPREAD_TIMEOUT         = float(os.getenv("SPREAD_TIMEOUT", "8"))
+    TSDB_DIR               = os.getenv("TSDB_DIR", "data/tsdb")          # lịch sử giá cho /chart ("" = tắt)
+    TSDB_RAW_DAYS          = float(os.getenv("TSDB_RAW_DAYS", "2"))      # số ngày giữ từng tầng (0 = giữ mãi)
+    TSDB_1M_DAYS           = float(os.getenv("TSDB_1M_DAYS", "14"))
+    TSDB_1H_DAYS           = float(os.getenv("TSDB_1H_DAYS", "400"))
+    TSDB_COMPACT_MIN       = getenv_int("TSDB_COMPACT_MIN", 10)
+    INLINE_ENABLED         = os.getenv("INLINE_ENABLED", "1") == "1"      # cần bật inline mode ở BotFather
+    INLINE_MAX_RESULTS     = getenv_int("INLINE_MAX_RESULTS", 20)
+    INLINE_CACHE_SEC       = getenv_int("INLINE_CACHE_SEC", 300)         # cache_time phía Telegram (chỉ airdrop)
+    INLINE_PRICE_CACHE_SEC = getenv_int("INLINE_PRICE_CACHE_SEC", 30)    # cache_time khi kết quả có thẻ giá
+    INLINE_DEBOUNCE_MS     = getenv_int("INLINE_DEBOUNCE_MS", 400)       # gom symbol thiếu giá rồi mới gọi upstream
+    INLINE_REBUILD_SEC     = getenv_int("INLINE_REBUILD_SEC", 300)
+    INLINE_MAX_AIRDROPS    = getenv_int("INLINE_MAX_AIRDROPS", 1000)     # airdrop được index (open trước), mỗi worker; 0 = hết
+    SUBSCRIBERS_DB         = os.getenv("SUBSCRIBERS_DB", "data/subscribers.db")   # /start opt-in + tiến độ broadcast
+    BROADCAST_RATE         = float(os.getenv("BROADCAST_RATE", "25"))   # tin/s, dưới trần ~30/s của Telegram
+    BROADCAST_CONCURRENCY  = getenv_int("BROADCAST_CONCURRENCY", 8)
+    BROADCAST_REPORT_SEC   = getenv_int("BROADCAST_REPORT_SEC", 10)     # chu kỳ sửa tin tiến độ cho admin
 
     FAUCET_ENABLED         = os.getenv("FAUCET_ENABLED", "0") == "1"
     FAUCET_ENDPOINTS       = getenv_list("FAUCET_ENDPOINTS")
     FAUCET_INTERVAL_MIN    = getenv_int("FAUCET_INTERVAL_MIN", 30)
 
+    BOT_MODE               = os.getenv("BOT_MODE", "polling").strip().lower()   # polling | webhook
+    WEBHOOK_URL            = os.getenv("WEBHOOK_URL", "").strip()              # URL public, vd https://bot.example.com
+    WEBHOOK_LISTEN         = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    WEBHOOK_PORT           = getenv_int("WEBHOOK_PORT", getenv_int("PORT", 8443))
+    WEBHOOK_PATH           = "/" + os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+    WEBHOOK_SECRET         = os.getenv("WEBHOOK_SECRET", "").strip()           # bắt buộc khi BOT_MODE=webhook
+    WEBHOOK_INSECURE       = os.getenv("WEBHOOK_INSECURE", "0") == "1"         # chỉ để test local: cho chạy không secret
+
+    SHARD_WORKERS          = getenv_int("SHARD_WORKERS", 0)        # >1: front + N worker process (shard.py)
+    SHARD_QUEUE_MAX        = getenv_int("SHARD_QUEUE_MAX", 1000)   # update chờ tối đa mỗi worker
+    SHARED_CACHE_DB        = os.getenv("SHARED_CACHE_DB", "data/shared_cache.db")
+
+    STATE_DB               = os.getenv("STATE_DB", "data/state.db")   # lần chạy gần nhất của job, ...
+    JOB_JITTER_SEC         = float(os.getenv("JOB_JITTER_SEC", "15"))
+
+    OFFLOAD_WORKERS        = getenv_int("OFFLOAD_WORKERS", 4)       # thread pool cho code blocking (faucet, SQLite, file)
+    OFFLOAD_MAX_PENDING    = getenv_int("OFFLOAD_MAX_PENDING", 32)  # quá số task chờ/chạy -> từ chối ngay
+    OFFLOAD_TIMEOUT        = float(os.getenv("OFFLOAD_TIMEOUT", "20"))
+    FAUCET_TIMEOUT         = float(os.getenv("FAUCET_TIMEOUT", "300"))
+
+    LOAD_SHEDDING          = os.getenv("LOAD_SHEDDING", "1") == "1"   # token bucket theo user/chat (shedding.py); admin miễn
+    RATE_USER_PER_MIN      = float(os.getenv("RATE_USER_PER_MIN", "20"))
+    RATE_USER_BURST        = float(os.getenv("RATE_USER_BURST", "5"))
+    RATE_CHAT_PER_MIN      = float(os.getenv("RATE_CHAT_PER_MIN", "60"))
+    RATE_CHAT_BURST        = float(os.getenv("RATE_CHAT_BURST", "20"))
+    CHAT_QUEUE_MAX         = getenv_int("CHAT_QUEUE_MAX", 5)         # việc chờ mỗi chat; đầy thì bỏ việc cũ nhất
+    SLOW_DOWN_NOTICE_SEC   = float(os.getenv("SLOW_DOWN_NOTICE_SEC", "30"))
+
+    METRICS_PORT           = getenv_int("METRICS_PORT", 0)       # >0: phục vụ GET /metrics (Prometheus); trùng WEBHOOK_PORT thì dùng chung server, cần Bearer WEBHOOK_SECRET
+    METRICS_LISTEN         = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
     DEBUG                  = os.getenv("DEBUG", "0") == "1"
     TZ = ZoneInfo(os.getenv("TZ", "Asia/Ho_Chi_Minh"))
 
@@ -44,6 +124,12 @@ def ensure_core_env():
     if not Settings.BOT_TOKEN or Settings.TELEGRAM_CHAT_ID == 0:
         raise RuntimeError("❌ Thiếu BOT_TOKEN hoặc TELEGRAM_CHAT_ID trong biến môi trường!")
 
+    # Không có secret thì ai biết URL cũng bơm được update giả (kể cả lệnh admin)
+    if Settings.BOT_MODE == "webhook" and not Settings.WEBHOOK_SECRET:
+        if not Settings.WEBHOOK_INSECURE:
+            raise RuntimeError("❌ BOT_MODE=webhook cần WEBHOOK_SECRET (hoặc WEBHOOK_INSECURE=1 khi test local)!")
+        print("[CONFIG] ⚠️  WEBHOOK_SECRET trống: webhook nhận update từ BẤT KỲ ai – chỉ dùng khi test local!")
+
     if Settings.TELEGRAM_CHAT_ID and Settings.TELEGRAM_CHAT_ID not in Settings.ADMIN_IDS:
         Settings.ADMIN_IDS.add(Settings.TELEGRAM_CHAT_ID)
 
@@ -1,11 +1,30 @@
 # crypto.py
 from __future__ import annotations
+import asyncio
+import json
+import math
+import random
 import time
-import requests
-from typing import Dict, Tuple, List, Optional
+import threading
+import warnings
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Tuple, List, Optional, NamedTuple
 
-COINGECKO = "https://api.coingecko.com/api/v3/simple/price"
-BINANCE   = "https://api.binance.com/api/v3/ticker/price"
+import metrics
+from config import Settings
+from symbols import SymbolIndex
+from upstream import UpstreamError, guard_for
+
+if TYPE_CHECKING:
+    import requests
+
+COINGECKO  = f"{Settings.COINGECKO_API}/simple/price"
+COINS_LIST = f"{Settings.COINGECKO_API}/coins/list"
+BINANCE    = f"{Settings.BINANCE_API}/ticker/price"
+
+NAN = math.nan
 
 # Map phổ biến: ticker -> coingecko_id
 TICKER_TO_CG = {
@@ -16,47 +35,333 @@ TICKER_TO_CG = {
     "ton": "the-open-network",
 }
 
+# Index đầy đủ (coins list CoinGecko); TICKER_TO_CG luôn được ưu tiên khi ticker trùng
+SYMBOL_INDEX = SymbolIndex(Settings.SYMBOL_INDEX_PATH, overrides=TICKER_TO_CG)
+SYMBOL_INDEX.load()
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
 def _session() -> requests.Session:
-    s = requests.Session()
-    s.headers.update({"User-Agent": "rotchain-auto/1.0"})
-    return s
+    """
+    Session dùng chung (keep-alive + connection pool) cho mọi lời gọi CG/Binance,
+    tránh mở TLS handshake mới cho từng request.
+    """
+    global _SESSION
+    if _SESSION is None:
+        # requests/urllib3 chỉ nạp khi có lời gọi sync đầu tiên (bot dùng acrypto/httpx)
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                s = requests.Session()
+                s.headers.update({"User-Agent": "rotchain-auto/1.0"})
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _SESSION = s
+    return _SESSION
+
+def _get(url: str, params: Optional[Dict] = None, timeout: float = 10, cost: float = 1.0) -> requests.Response:
+    """
+    GET qua session chung, có rate limit + circuit breaker theo host.
+    Host đang open -> raise CircuitOpen ngay, không chờ timeout.
+    """
+    import requests
+
+    guard = guard_for(url)
+    guard.before(cost)
+    t0 = time.perf_counter()
+    r: Optional[requests.Response] = None
+    try:
+        r = _session().get(url, params=params, timeout=timeout)
+    finally:
+        if r is None:               # lỗi mạng / timeout / exception bất kỳ: vẫn phải kết thúc lượt breaker
+            metrics.observe_http(url, time.perf_counter() - t0, True)
+            guard.failure()
+    metrics.observe_http(url, time.perf_counter() - t0, r.status_code >= 400)
+    guard.observe(r.status_code, r.headers.get("Retry-After"))
+    return r
+
+def _with_retry(fn, attempts=2, delay=0.6, reraise=False):
+    import requests
 
-def _with_retry(fn, attempts=2, delay=0.6):
     last_exc = None
-    for _ in range(attempts):
+    for i in range(attempts):
         try:
             return fn()
+        except UpstreamError as e:
+            last_exc = e        # breaker open / hết quota: fail fast, không retry
+            break
+        except requests.HTTPError as e:
+            last_exc = e
+            code = e.response.status_code if e.response is not None else 0
+            if 400 <= code < 500:
+                break           # 429 đã mở breaker theo Retry-After, retry ngay cũng vô ích
         except Exception as e:
             last_exc = e
-            time.sleep(delay)
+        if i + 1 < attempts:
+            time.sleep(delay * (2 ** i) * random.uniform(0.8, 1.2))
     if last_exc:
+        if reraise:
+            raise last_exc
         # có thể log ra stdout nếu cần
         # print("API error:", last_exc)
-        pass
     return None
 
+# ====== Cache giá dùng chung (TTL + gộp request đang bay + stale khi lỗi) ======
+class TTLCache:
+    """
+    Cache LRU có TTL, an toàn đa luồng:
+      - get_or_fetch(): hit nếu còn hạn; nhiều caller miss cùng key chỉ chạy 1 fetch
+        (các caller còn lại chờ chung kết quả)
+      - upstream lỗi -> trả dữ liệu cũ nếu chưa quá `stale_ttl`
+      - đếm hits / misses / coalesced / stale / errors để theo dõi
+      - `shared` (storage.KVCache, tuỳ chọn): tầng 2 dùng chung giữa các process shard,
+        xem trước khi gọi upstream và ghi lại sau mỗi lần fetch thành công
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 256, stale_ttl: float = 600.0, shared=None):
+        self.ttl = ttl
+        self.maxsize = max(1, maxsize)
+        self.stale_ttl = max(stale_ttl, ttl)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._ainflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.errors = 0
+        self.shared = shared
+        self.shared_hits = 0
+
+    def _shared_get(self, key: Hashable, max_age: float) -> Optional[Tuple[Any, float]]:
+        if self.shared is None:
+            return None
+        try:
+            return self.shared.get(key, max_age)
+        except Exception:
+            return None
+
+    def _shared_put(self, key: Hashable, value: Any) -> None:
+        if self.shared is not None:
+            try:
+                self.shared.put(key, value)
+            except Exception:
+                pass
+
+    # Bản async: KVCache là SQLite (busy_timeout vài giây khi process khác đang ghi) -> chạy trong thread
+    async def _ashared_get(self, key: Hashable, max_age: float) -> Optional[Tuple[Any, float]]:
+        if self.shared is None:
+            return None
+        return await asyncio.to_thread(self._shared_get, key, max_age)
+
+    def _ashared_put(self, key: Hashable, value: Any) -> None:
+        if self.shared is not None:
+            # Không chờ: waiter đã có kết quả, lỗi ghi đã được _shared_put nuốt
+            asyncio.get_running_loop().run_in_executor(None, self._shared_put, key, value)
+
+    def _adopt(self, key: Hashable, hit: Tuple[Any, float], stale: bool = False) -> Any:
+        """Nhận giá trị từ tầng shared vào cache local (giữ nguyên tuổi)."""
+        value, age = hit
+        with self._lock:
+            if not stale:
+                self._put(key, value, time.monotonic() - age)
+                self.shared_hits += 1
+            else:
+                self.stale += 1
+        return value
+
+    def _put(self, key: Hashable, value: Any, now: float) -> None:
+        self._data[key] = (now, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Chỉ trả giá trị còn hạn TTL (không fetch, không đụng counters)."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._put(key, value, time.monotonic())
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return flight.result()
+
+        hit = self._shared_get(key, self.ttl)
+        if hit is not None:
+            value = self._adopt(key, hit)
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.set_result(value)
+            return value
+
+        try:
+            value = fetch()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self.errors += 1
+                entry = self._data.get(key)
+                usable = entry is not None and time.monotonic() - entry[0] < self.stale_ttl
+                if usable:
+                    self.stale += 1
+            if usable:
+                flight.set_result(entry[1])
+                return entry[1]
+            hit = self._shared_get(key, self.stale_ttl)
+            if hit is not None:
+                value = self._adopt(key, hit, stale=True)
+                flight.set_result(value)
+                return value
+            flight.set_exception(e)
+            raise
+
+        with self._lock:
+            self._put(key, value, time.monotonic())
+            self._inflight.pop(key, None)
+        self._shared_put(key, value)
+        flight.set_result(value)
+        return value
+
+    async def aget_or_fetch(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        """
+        Bản asyncio của get_or_fetch(): `fetch` là coroutine function; các coroutine
+        miss cùng key chờ chung 1 asyncio.Future thay vì block thread.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return entry[1]
+            flight = self._ainflight.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._ainflight[key] = asyncio.get_running_loop().create_future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return await asyncio.shield(flight)
+
+        try:
+            hit = await self._ashared_get(key, self.ttl)
+        except BaseException:           # leader bị huỷ khi đang chờ thread: đừng để waiter treo
+            with self._lock:
+                self._ainflight.pop(key, None)
+            flight.set_exception(RuntimeError("fetch cancelled"))
+            flight.exception()
+            raise
+        if hit is not None:
+            value = self._adopt(key, hit)
+            with self._lock:
+                self._ainflight.pop(key, None)
+            flight.set_result(value)
+            return value
+
+        try:
+            value = await fetch()
+        except BaseException as e:
+            with self._lock:
+                self._ainflight.pop(key, None)
+                self.errors += 1
+                entry = self._data.get(key)
+                usable = entry is not None and time.monotonic() - entry[0] < self.stale_ttl
+                if usable:
+                    self.stale += 1
+            if usable and isinstance(e, Exception):
+                flight.set_result(entry[1])
+                return entry[1]
+            hit = await self._ashared_get(key, self.stale_ttl) if isinstance(e, Exception) else None
+            if hit is not None:
+                value = self._adopt(key, hit, stale=True)
+                flight.set_result(value)
+                return value
+            flight.set_exception(e if isinstance(e, Exception) else RuntimeError("fetch cancelled"))
+            flight.exception()  # tránh warning "exception was never retrieved" khi không ai chờ
+            raise
+
+        with self._lock:
+            self._put(key, value, time.monotonic())
+            self._ainflight.pop(key, None)
+        flight.set_result(value)
+        self._ashared_put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "stale": self.stale,
+                "errors": self.errors,
+                "shared_hits": self.shared_hits,
+            }
+
+PRICE_CACHE = TTLCache(Settings.PRICE_CACHE_TTL, Settings.PRICE_CACHE_MAX, Settings.PRICE_CACHE_STALE)
+
 def normalize_to_cg_ids(symbols: List[str]) -> List[str]:
     ids: List[str] = []
     for s in symbols:
         k = s.strip().lower()
-        ids.append(TICKER_TO_CG.get(k, k))  # nếu không map được thì dùng nguyên chuỗi
+        ids.append(SYMBOL_INDEX.cg_id(k) or k)  # nếu không map được thì dùng nguyên chuỗi (có thể là id CG)
     return ids
 
 def get_cg_prices(symbols: List[str], vs: str = "usd", timeout: int = 10) -> Dict[str, float]:
     """
     symbols: danh sách id Coingecko (hoặc ticker phổ biến – sẽ auto map)
     """
-    ids = ",".join(normalize_to_cg_ids(symbols))
+    return _cg_prices(tuple(sorted(set(normalize_to_cg_ids(symbols)))), vs, timeout)
+
+def _cg_prices(ids: Tuple[str, ...], vs: str, timeout: float) -> Dict[str, float]:
+    """ids: id CoinGecko đã chuẩn hoá + sort (làm key cache)."""
     if not ids:
         return {}
 
     def _call():
-        with _session() as s:
-            r = s.get(COINGECKO, params={"ids": ids, "vs_currencies": vs}, timeout=timeout)
-            r.raise_for_status()
-            return r.json()
+        r = _get(COINGECKO, params={"ids": ",".join(ids), "vs_currencies": vs}, timeout=timeout)
+        r.raise_for_status()
+        return _parse_cg(r.json(), vs)
+
+    try:
+        return PRICE_CACHE.get_or_fetch(("cg", vs, ids), lambda: _with_retry(_call, reraise=True))
+    except Exception:
+        return {}
 
-    data = _with_retry(_call) or {}
+def _parse_cg(data: Dict, vs: str) -> Dict[str, float]:
     out: Dict[str, float] = {}
     for k, v in data.items():
         try:
@@ -66,63 +371,353 @@ def get_cg_prices(symbols: List[str], vs: str = "usd", timeout: int = 10) -> Dic
     return out
 
 def get_binance_price(symbol: str = "BTCUSDT", timeout: int = 10) -> Optional[float]:
+    pair = symbol.upper()
+
     def _call():
-        with _session() as s:
-            r = s.get(BINANCE, params={"symbol": symbol.upper()}, timeout=timeout)
-            r.raise_for_status()
-            return float(r.json()["price"])
-    val = _with_retry(_call)
+        r = _get(BINANCE, params={"symbol": pair}, timeout=timeout, cost=2)
+        r.raise_for_status()
+        return float(r.json()["price"])
+
+    try:
+        val = PRICE_CACHE.get_or_fetch(("bn", pair), lambda: _with_retry(_call, reraise=True))
+    except Exception:
+        return None
     return float(val) if val is not None else None
 
+def _parse_binance(rows: List[Dict], wanted: Optional[set] = None) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for row in rows:
+        sym = str(row.get("symbol", "")).upper()
+        if wanted is not None and sym not in wanted:
+            continue
+        try:
+            out[sym] = float(row["price"])
+        except Exception:
+            continue
+    return out
+
+def get_binance_prices(pairs: List[str], timeout: int = 10) -> Dict[str, float]:
+    """
+    Lấy giá nhiều cặp Binance trong 1 request (tham số `symbols`).
+    Nếu có cặp không tồn tại, Binance trả 400 cho cả lô -> fallback tải toàn bộ bảng ticker rồi lọc.
+    """
+    wanted = sorted({p.upper() for p in pairs if p})
+    if not wanted:
+        return {}
+
+    def _call():
+        r = _get(BINANCE, params={"symbols": json.dumps(wanted, separators=(",", ":"))}, timeout=timeout, cost=4)
+        if r.status_code == 400:
+            r = _get(BINANCE, timeout=timeout, cost=4)
+        r.raise_for_status()
+        return _parse_binance(r.json(), set(wanted))
+
+    try:
+        return PRICE_CACHE.get_or_fetch(("bn", tuple(wanted)), lambda: _with_retry(_call, reraise=True))
+    except Exception:
+        return {}
+
 def map_to_binance(symbol: str) -> str:
     # cho phép truyền "btc" hoặc "BTCUSDT"
     s = symbol.upper()
     if s.endswith("USDT"):
         return s
-    return f"{s}USDT"
+    return SYMBOL_INDEX.pair(symbol) or f"{s}USDT"
+
+class PriceStats(NamedTuple):
+    symbol: str
+    last: float
+    change_pct: Optional[float]   # % thay đổi trong cửa sổ
+    ema: float
+    volatility: Optional[float]   # độ lệch chuẩn log-return mỗi tick (%)
+
+class PriceAlert(NamedTuple):
+    symbol: str
+    price: float
+    change_pct: float
+    window_min: int
 
 class PriceMemory:
-    def __init__(self):
+    """
+    Lịch sử giá dạng ring buffer cố định `capacity` tick cho mọi symbol:
+      - mỗi tick là 1 cột (dùng chung timestamp), mỗi symbol là 1 hàng trong array('d')
+      - symbol thiếu giá ở tick nào thì ô đó là NaN
+      - stats() tính %change / EMA / volatility cho mọi symbol trong 1 lượt (NumPy, zero-copy)
+      - alerts() chỉ báo khi vượt ngưỡng, báo 1 lần cho tới khi giá quay lại trong ngưỡng
+    """
+
+    def __init__(self, capacity: int = 288, ema_alpha: float = 0.2):
+        self.capacity = max(2, capacity)
+        self.ema_alpha = ema_alpha
+        self.symbols: List[str] = []
+        self._row: Dict[str, int] = {}
+        self._prices = array("d")                       # len = len(symbols) * capacity
+        self._ts = array("d", [NAN] * self.capacity)
+        self._ema = array("d")
+        self._head = 0                                  # slot ghi tiếp theo
+        self._count = 0
+        self._fired: Dict[str, int] = {}                # symbol -> +1/-1 đã báo, 0 chưa
         self.last: Dict[str, float] = {}
 
+    def _ensure_row(self, symbol: str) -> int:
+        row = self._row.get(symbol)
+        if row is None:
+            row = self._row[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            self._prices.extend([NAN] * self.capacity)
+            self._ema.append(NAN)
+        return row
+
+    def observe(self, prices: Dict[str, float], ts: Optional[float] = None) -> None:
+        """Ghi 1 tick: {symbol: price}. Giá <= 0 coi như thiếu dữ liệu."""
+        for sym in prices:
+            self._ensure_row(sym)
+        slot = self._head
+        cap = self.capacity
+        self._ts[slot] = time.time() if ts is None else ts
+        a = self.ema_alpha
+        for sym, row in self._row.items():
+            p = prices.get(sym)
+            if p is None or p <= 0:
+                self._prices[row * cap + slot] = NAN
+                continue
+            self._prices[row * cap + slot] = p
+            prev = self._ema[row]
+            self._ema[row] = p if prev != prev else prev + a * (p - prev)  # NaN -> khởi tạo
+            self.last[sym] = p
+        self._head = (slot + 1) % cap
+        self._count = min(self._count + 1, cap)
+
+    def observe_quotes(self, quotes: List[Quote], ts: Optional[float] = None) -> None:
+        """Ghi 1 tick từ Quote: ưu tiên giá Binance, thiếu thì dùng CG."""
+        self.observe({q.symbol.lower(): (q.bn or q.cg or 0.0) for q in quotes}, ts)
+
     def diff_pct(self, symbol: str, price: float) -> float:
+        """% chênh của `price` so với giá ghi gần nhất. Chỉ đọc: không ghi tick (ghi 1 symbol sẽ làm NaN cả cột)."""
         if price <= 0:
             return 0.0
         old = self.last.get(symbol)
-        self.last[symbol] = price
         if not old or old <= 0:
             return 0.0
         return (price - old) / old * 100.0
 
+    def stats(self, window_s: float = 3600.0, now: Optional[float] = None) -> List[PriceStats]:
+        if not self.symbols or not self._count:
+            return []
+        import numpy as np
+
+        cap, n = self.capacity, len(self.symbols)
+        order = (self._head - self._count + np.arange(self._count)) % cap      # cũ -> mới
+        ts = np.frombuffer(self._ts, dtype=np.float64)[order]
+        mat = np.frombuffer(self._prices, dtype=np.float64).reshape(n, cap)[:, order]
+        ema = np.frombuffer(self._ema, dtype=np.float64).copy()
+
+        # mốc đầu cửa sổ: tick cuối cùng <= now - window (hoặc tick cũ nhất nếu chưa đủ lịch sử)
+        now = ts[-1] if now is None else now
+        j0 = max(int(np.searchsorted(ts, now - window_s, side="right")) - 1, 0)
+        win = mat[:, j0:]
+        valid = ~np.isnan(win)
+        has = valid.any(axis=1)
+        first = win[np.arange(n), valid.argmax(axis=1)]
+        last = win[np.arange(n), win.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)]
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)   # hàng toàn NaN -> nanmean rỗng
+            change = (last - first) / first * 100.0
+            rets = np.diff(np.log(win), axis=1)
+            nret = (~np.isnan(rets)).sum(axis=1)
+            vol = np.sqrt(np.nansum((rets - np.nanmean(rets, axis=1, keepdims=True)) ** 2, axis=1)
+                          / np.maximum(nret - 1, 1)) * 100.0 if rets.shape[1] else np.full(n, np.nan)
+
+        out: List[PriceStats] = []
+        for i, sym in enumerate(self.symbols):
+            if not has[i]:
+                continue
+            out.append(PriceStats(
+                sym,
+                float(last[i]),
+                float(change[i]) if valid[i].sum() >= 2 else None,
+                float(ema[i]),
+                float(vol[i]) if rets.shape[1] and nret[i] >= 2 else None,
+            ))
+        return out
+
+    def alerts(self, up_pct: float, down_pct: float, window_s: float = 3600.0) -> List[PriceAlert]:
+        out: List[PriceAlert] = []
+        window_min = int(window_s // 60)
+        for st in self.stats(window_s):
+            if st.change_pct is None:
+                continue
+            prev = self._fired.get(st.symbol, 0)
+            if st.change_pct >= up_pct:
+                state = 1
+            elif st.change_pct <= -down_pct:
+                state = -1
+            else:
+                state = 0
+            self._fired[st.symbol] = state
+            if state and state != prev:
+                out.append(PriceAlert(st.symbol, st.last, st.change_pct, window_min))
+        return out
+
+def format_alerts(alerts: List[PriceAlert]) -> str:
+    lines = ["🚨 Biến động giá:"]
+    for a in alerts:
+        icon = "📈" if a.change_pct > 0 else "📉"
+        lines.append(f"{icon} <b>{a.symbol.upper()}</b> <code>{a.price:.4g}</code> | "
+                     f"<b>{a.change_pct:+.2f}%</b> / {a.window_min} phút")
+    return "\n".join(lines)
+
+class Quote(NamedTuple):
+    """Kết quả giá của 1 symbol: CG (vs), Binance (USDT) và chênh lệch %."""
+    symbol: str
+    cg_id: str
+    pair: str
+    cg: Optional[float]
+    bn: Optional[float]
+    diff_pct: Optional[float]
+
+def _make_quote(symbol: str, cg_id: str, pair: str,
+                cg_price: Optional[float], bn_price: Optional[float]) -> Quote:
+    if cg_price and bn_price:
+        diff_pct = (bn_price - cg_price) / cg_price * 100.0
+        return Quote(symbol, cg_id, pair, cg_price, bn_price, diff_pct)
+    return Quote(symbol, cg_id, pair, cg_price or None, bn_price or None, None)
+
+def fetch_quotes(symbols: List[str], vs: str = "usd") -> List[Quote]:
+    """
+    Engine gộp: 1 request CoinGecko `simple/price` cho mọi id + 1 request Binance
+    `ticker/price` cho mọi cặp, dùng chung session. Trả về 1 Quote / symbol (giữ thứ tự).
+    """
+    syms = [s.strip() for s in symbols if s and s.strip()]
+    if not syms:
+        return []
+    cg_ids = normalize_to_cg_ids(syms)
+    pairs  = [map_to_binance(s) for s in syms]
+
+    cg_prices = get_cg_prices(cg_ids, vs)
+    bn_prices = get_binance_prices(pairs)
+
+    return [
+        _make_quote(sym, cg_id, pair, cg_prices.get(cg_id), bn_prices.get(pair))
+        for sym, cg_id, pair in zip(syms, cg_ids, pairs)
+    ]
+
 def check_arbitrage_one(symbol: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
     """
     symbol: cho phép 'btc','eth','bnb' hoặc coingecko id 'bitcoin','ethereum',...
     Trả về (giá CG(USD), giá Binance(USDT), chênh lệch % nếu đủ dữ liệu)
     """
-    # giá Coingecko dùng id
-    cg_id = normalize_to_cg_ids([symbol])[0]
-    cg_price = get_cg_prices([cg_id], "usd").get(cg_id)
+    quotes = fetch_quotes([symbol], "usd")
+    if not quotes:
+        return (None, None, None)
+    q = quotes[0]
+    return (q.cg, q.bn, q.diff_pct)
 
-    # giá Binance dùng ticker/USDT
-    bn_symbol = map_to_binance(symbol)
-    bn_price  = get_binance_price(bn_symbol)
-
-    if cg_price and bn_price:
-        diff_pct = (bn_price - cg_price) / cg_price * 100.0
-        return (cg_price, bn_price, diff_pct)
-    return (cg_price or None, bn_price or None, None)
-
-def format_prices_for_msg(symbols: List[str]) -> str:
+def format_quotes(quotes: List[Quote]) -> str:
     """
-    Tiện ích: gộp nhiều giá và chênh lệch thành 1 message HTML.
+    Render danh sách Quote thành 1 message HTML.
     """
     lines = ["💹 Giá & chênh lệch:"]
-    for sym in symbols:
-        cg, bn, df = check_arbitrage_one(sym)
-        sym_disp = sym.upper()
+    for q in quotes:
+        cg, bn, df = q.cg, q.bn, q.diff_pct
+        sym_disp = q.symbol.upper()
         if cg and bn and df is not None:
             lines.append(f"• <b>{sym_disp}</b> CG: <code>{cg:.2f} USD</code> | "
                          f"BN: <code>{bn:.2f} USDT</code> | Δ <b>{df:+.2f}%</b>")
         else:
             lines.append(f"• <b>{sym_disp}</b> dữ liệu chưa đủ.")
     return "\n".join(lines)
+
+def format_prices_for_msg(symbols: List[str]) -> str:
+    """
+    Tiện ích: gộp nhiều giá và chênh lệch thành 1 message HTML.
+    """
+    return format_quotes(fetch_quotes(symbols))
+
+# ====== Quét chênh lệch toàn thị trường (/spread_top) ======
+class SpreadScan(NamedTuple):
+    quotes: List[Quote]       # top N theo |Δ%| giảm dần
+    listed: int               # số cặp trong symbol index
+    scanned: int              # số cặp có đủ giá 2 bên
+    outliers: int             # |Δ| > max_abs_pct: gần như chắc chắn map nhầm coin, bỏ qua
+    compute_ms: float
+
+_LISTING: Tuple[float, List[str], List[str], List[str]] = (-1.0, [], [], [])
+
+def _listing() -> Tuple[List[str], List[str], List[str]]:
+    """(tickers, cg_ids, pairs) của mọi cặp niêm yết; dựng lại khi symbol index đổi."""
+    global _LISTING
+    built_at = SYMBOL_INDEX.built_at
+    if _LISTING[0] != built_at:
+        recs = SYMBOL_INDEX.listed()
+        _LISTING = (built_at, [r[0] for r in recs], [r[1] for r in recs], [r[2] for r in recs])
+    return _LISTING[1], _LISTING[2], _LISTING[3]
+
+def _chunks(ids: List[str], size: int) -> List[Tuple[str, ...]]:
+    ids = sorted(set(ids))
+    return [tuple(ids[i:i + size]) for i in range(0, len(ids), max(1, size))]
+
+def get_cg_snapshot(ids: List[str], vs: str = "usd", chunk: int = 250, timeout: int = 10) -> Dict[str, float]:
+    """Giá CG cho rất nhiều id: mỗi lô `chunk` id là 1 request simple/price (cache theo lô)."""
+    out: Dict[str, float] = {}
+    for part in _chunks(ids, chunk):
+        out.update(_cg_prices(part, vs, timeout))
+    return out
+
+def get_binance_all(timeout: int = 10) -> Dict[str, float]:
+    """Toàn bộ bảng ticker Binance trong 1 request."""
+    def _call():
+        r = _get(BINANCE, timeout=timeout, cost=4)
+        r.raise_for_status()
+        return _parse_binance(r.json())
+
+    try:
+        return PRICE_CACHE.get_or_fetch(("bn", "*"), lambda: _with_retry(_call, reraise=True))
+    except Exception:
+        return {}
+
+def rank_spreads(
+    cg_prices: Dict[str, float],
+    bn_prices: Dict[str, float],
+    top: int = 10,
+    max_abs_pct: float = 50.0,
+) -> SpreadScan:
+    """
+    Ghép giá CG/Binance theo symbol index rồi tính Δ% cho mọi cặp trong 1 lượt NumPy,
+    chọn top N bằng argpartition (không sort cả mảng).
+    """
+    import numpy as np
+
+    t0 = time.perf_counter()
+    tickers, ids, pairs = _listing()
+    n = len(ids)
+    cg = np.fromiter((cg_prices.get(i, NAN) for i in ids), dtype=np.float64, count=n)
+    bn = np.fromiter((bn_prices.get(p, NAN) for p in pairs), dtype=np.float64, count=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        diff = (bn - cg) / cg * 100.0
+        ok = (cg > 0) & (bn > 0) & np.isfinite(diff)
+    absd = np.abs(diff)
+    outlier = ok & (absd > max_abs_pct)
+    ok &= ~outlier
+    idx = np.flatnonzero(ok)
+    if top < len(idx):
+        idx = idx[np.argpartition(-absd[idx], max(top, 1) - 1)[:top]]
+    idx = idx[np.argsort(-absd[idx], kind="stable")]
+    quotes = [Quote(tickers[i], ids[i], pairs[i], float(cg[i]), float(bn[i]), float(diff[i])) for i in idx]
+    return SpreadScan(quotes, n, int(ok.sum()), int(outlier.sum()), (time.perf_counter() - t0) * 1000)
+
+def scan_spreads(top: int = 10, vs: str = "usd", max_abs_pct: float = 50.0) -> SpreadScan:
+    _, ids, _ = _listing()
+    return rank_spreads(get_cg_snapshot(ids, vs), get_binance_all(), top, max_abs_pct)
+
+def format_spreads(scan: SpreadScan) -> str:
+    if not scan.listed:
+        return "Chỉ mục symbol chưa sẵn sàng, thử lại sau ít phút."
+    lines = [f"📊 Top {len(scan.quotes)} chênh lệch CG vs Binance "
+             f"({scan.scanned}/{scan.listed} cặp, {scan.compute_ms:.1f} ms):"]
+    for i, q in enumerate(scan.quotes, 1):
+        lines.append(f"{i}. <b>{q.symbol.upper()}</b> CG <code>{q.cg:.4g}</code> | "
+                     f"BN <code>{q.bn:.4g}</code> | Δ <b>{q.diff_pct:+.2f}%</b>")
+    if scan.outliers:
+        lines.append(f"<i>Bỏ {scan.outliers} cặp lệch bất thường (có thể trùng ticker khác coin).</i>")
+    return "\n".join(lines)
@@ -0,0 +1,371 @@
+# fakes.py
+"""
+Server giả lập chạy local (không cần internet) để dựng/kiểm tra bot offline.
+  - FakeTickerServer: websocket phát miniTicker kiểu Binance (random walk)
+  - FakeCoinGecko / FakeBinance / FakeTelegram: HTTP (simple/price, ticker/price, Bot API)
+    có độ trễ + tỉ lệ lỗi cấu hình được
+
+Chạy tay:
+  python fakes.py ticker --port 8765 --pairs BTCUSDT,ETHUSDT
+  PRICE_STREAM_ENABLED=1 PRICE_STREAM_URL=ws://127.0.0.1:8765/ws/!miniTicker@arr python main.py
+
+  python fakes.py http --latency-ms 80 --error-rate 0.02     # in ra biến môi trường cần export
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+from webhook import MiniHTTPServer, Request, Response
+
+DEFAULT_PAIRS = {"BTCUSDT": 65000.0, "ETHUSDT": 3200.0, "BNBUSDT": 580.0, "SOLUSDT": 150.0, "TONUSDT": 6.5}
+
+class FakeTickerServer:
+    """
+    Websocket server phát bảng miniTicker mỗi `interval` giây.
+      - path chứa "@arr"  -> gửi list tất cả cặp (giống !miniTicker@arr)
+      - path "?streams=" -> gửi từng cặp bọc {"stream":..., "data":...}
+      - drop_after: đóng kết nối sau N message (kiểm tra reconnect)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        prices: Optional[Dict[str, float]] = None,
+        interval: float = 1.0,
+        volatility: float = 0.002,
+        drop_after: int = 0,
+        seed: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.prices = dict(prices or DEFAULT_PAIRS)
+        self.interval = interval
+        self.volatility = volatility
+        self.drop_after = drop_after
+        self.connections = 0
+        self._rng = random.Random(seed)
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/ws/!miniTicker@arr"
+
+    def _tick(self) -> List[dict]:
+        now_ms = int(time.time() * 1000)
+        rows = []
+        for pair, p in self.prices.items():
+            p *= 1.0 + self._rng.gauss(0.0, self.volatility)
+            self.prices[pair] = p
+            rows.append({"e": "24hrMiniTicker", "E": now_ms, "s": pair, "c": f"{p:.8f}"})
+        return rows
+
+    async def _handler(self, ws) -> None:
+        self.connections += 1
+        path = getattr(getattr(ws, "request", None), "path", "") or ""
+        sent = 0
+        try:
+            while True:
+                rows = self._tick()
+                if "streams=" in path:
+                    for row in rows:
+                        await ws.send(json.dumps({"stream": f"{row['s'].lower()}@miniTicker", "data": row}))
+                else:
+                    await ws.send(json.dumps(rows))
+                sent += 1
+                if self.drop_after and sent >= self.drop_after:
+                    return
+                await asyncio.sleep(self.interval)
+        except Exception:
+            return
+
+    async def start(self) -> "FakeTickerServer":
+        import websockets
+        self._server = await websockets.serve(self._handler, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+# ====== HTTP fakes ======
+# cg_id -> (ticker, giá USD)
+DEFAULT_COINS = {
+    "bitcoin": ("btc", 65000.0),
+    "ethereum": ("eth", 3200.0),
+    "binancecoin": ("bnb", 580.0),
+    "solana": ("sol", 150.0),
+    "the-open-network": ("ton", 6.5),
+}
+
+def _json(status: int, data: Any) -> Response:
+    return status, "application/json", json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def _query(req: Request) -> Dict[str, str]:
+    return {k: v[-1] for k, v in parse_qs(req.query).items()}
+
+class FakeHTTPService:
+    """
+    Nền chung cho fake HTTP: mỗi request chờ latency (+ jitter ngẫu nhiên),
+    sau đó với xác suất error_rate trả lỗi thay vì dữ liệu.
+    Mỗi service nên dùng host riêng (127.0.0.x) vì upstream guard tính theo host.
+    """
+    name = "fake"
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._server: Optional[MiniHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _install(self, server: MiniHTTPServer) -> None:
+        raise NotImplementedError
+
+    def _error(self) -> Response:
+        return _json(503, {"error": "injected failure"})
+
+    def _may_fail(self, req: Request) -> bool:
+        return True
+
+    def _wrap(self, handler):
+        async def _handle(req: Request) -> Response:
+            self.requests += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if delay:
+                await asyncio.sleep(delay)
+            if self.error_rate and self._may_fail(req) and self._rng.random() < self.error_rate:
+                self.errors += 1
+                return self._error()
+            return await handler(req)
+
+        return _handle
+
+    async def start(self) -> "FakeHTTPService":
+        server = MiniHTTPServer(self.host, self.port)
+        self._install(server)
+        await server.start()
+        self.port = server.port
+        self._server = server
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            await self._server.stop(grace=0.5)
+            self._server = None
+
+class FakeCoinGecko(FakeHTTPService):
+    """GET /api/v3/simple/price, GET /api/v3/coins/list."""
+    name = "coingecko"
+
+    def __init__(self, *args, coins: Optional[Dict[str, Tuple[str, float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.coins = dict(coins or DEFAULT_COINS)
+
+    @property
+    def api(self) -> str:
+        return f"{self.base_url}/api/v3"
+
+    def _install(self, server: MiniHTTPServer) -> None:
+        server.route("GET", "/api/v3/simple/price", self._wrap(self._simple_price))
+        server.route("GET", "/api/v3/coins/list", self._wrap(self._coins_list))
+
+    async def _simple_price(self, req: Request) -> Response:
+        q = _query(req)
+        vs = [v for v in q.get("vs_currencies", "usd").split(",") if v]
+        out = {}
+        for cid in q.get("ids", "").split(","):
+            if cid in self.coins:
+                price = self.coins[cid][1] * (1.0 + self._rng.gauss(0.0, 0.001))
+                out[cid] = {v: price for v in vs}
+        return _json(200, out)
+
+    async def _coins_list(self, req: Request) -> Response:
+        return _json(200, [{"id": cid, "symbol": sym, "name": cid.replace("-", " ").title()}
+                           for cid, (sym, _) in self.coins.items()])
+
+class FakeBinance(FakeHTTPService):
+    """GET /api/v3/ticker/price (?symbol= | ?symbols=[...] | toàn bảng)."""
+    name = "binance"
+
+    def __init__(self, *args, prices: Optional[Dict[str, float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prices = dict(prices or DEFAULT_PAIRS)
+
+    @property
+    def api(self) -> str:
+        return f"{self.base_url}/api/v3"
+
+    def _install(self, server: MiniHTTPServer) -> None:
+        server.route("GET", "/api/v3/ticker/price", self._wrap(self._ticker_price))
+
+    def _row(self, pair: str) -> Dict[str, str]:
+        p = self.prices[pair] * (1.0 + self._rng.gauss(0.0, 0.001))
+        return {"symbol": pair, "price": f"{p:.8f}"}
+
+    async def _ticker_price(self, req: Request) -> Response:
+        q = _query(req)
+        if "symbol" in q:
+            if q["symbol"] not in self.prices:
+                return _json(400, {"code": -1121, "msg": "Invalid symbol."})
+            return _json(200, self._row(q["symbol"]))
+        if "symbols" in q:
+            try:
+                wanted = json.loads(q["symbols"])
+            except ValueError:
+                return _json(400, {"code": -1100, "msg": "Illegal characters found in parameter 'symbols'"})
+            if any(s not in self.prices for s in wanted):
+                return _json(400, {"code": -1121, "msg": "Invalid symbol."})
+            return _json(200, [self._row(s) for s in wanted])
+        return _json(200, [self._row(s) for s in self.prices])
+
+class FakeTelegram(FakeHTTPService):
+    """
+    Bot API tối thiểu tại /bot<token>/<method>: getMe, sendMessage, getUpdates (rỗng), còn lại trả True.
+    Đếm số lần gọi theo method; lỗi tiêm vào trả 500 kiểu Bot API.
+    sendMessage tới chat trong `blocked` trả 403 như khi user đã chặn bot.
+    """
+    name = "telegram"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls: Dict[str, int] = {}
+        self.blocked: Set[int] = set()
+        self._message_id = 0
+
+    @property
+    def api(self) -> str:
+        """Giá trị cho ApplicationBuilder.base_url() / TELEGRAM_API_URL."""
+        return f"{self.base_url}/bot"
+
+    def _install(self, server: MiniHTTPServer) -> None:
+        server.fallback = self._wrap(self._bot_api)
+
+    def _error(self) -> Response:
+        return _json(500, {"ok": False, "error_code": 500, "description": "Internal Server Error: injected"})
+
+    def _may_fail(self, req: Request) -> bool:
+        return not req.path.endswith("/getMe")      # để bot khởi động được
+
+    @staticmethod
+    def _params(req: Request) -> Dict[str, Any]:
+        ctype = req.headers.get("content-type", "")
+        if "json" in ctype:
+            try:
+                return json.loads(req.body or b"{}")
+            except ValueError:
+                return {}
+        if "x-www-form-urlencoded" in ctype:
+            return {k: v[-1] for k, v in parse_qs(req.body.decode("utf-8")).items()}
+        return _query(req)
+
+    async def _bot_api(self, req: Request) -> Response:
+        if not req.path.startswith("/bot") or "/" not in req.path[4:]:
+            return _json(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+        method = req.path.rsplit("/", 1)[1]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = self._params(req)
+        if method == "getMe":
+            return _json(200, {"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": True,
+            }})
+        if method == "sendMessage":
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 0) or 0)
+            if chat_id in self.blocked:
+                return _json(403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})
+            return _json(200, {"ok": True, "result": {
+                "message_id": self._message_id, "date": int(time.time()), "text": params.get("text", ""),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            }})
+        if method == "getUpdates":
+            await asyncio.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            return _json(200, {"ok": True, "result": []})
+        return _json(200, {"ok": True, "result": True})
+
+async def start_http_fakes(
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    telegram_latency: Optional[float] = None,
+    seed: Optional[int] = None,
+    ports: Tuple[int, int, int] = (0, 0, 0),
+) -> Tuple[FakeTelegram, FakeCoinGecko, FakeBinance]:
+    """Bật 3 fake trên 127.0.0.1/.2/.3 (host khác nhau -> rate limit / breaker tách biệt như thật)."""
+    tg_lat = latency if telegram_latency is None else telegram_latency
+    tg = FakeTelegram("127.0.0.1", ports[0], tg_lat, jitter, error_rate, seed)
+    cg = FakeCoinGecko("127.0.0.2", ports[1], latency, jitter, error_rate, seed)
+    bn = FakeBinance("127.0.0.3", ports[2], latency, jitter, error_rate, seed)
+    for f in (tg, cg, bn):
+        await f.start()
+    return tg, cg, bn
+
+async def _serve_forever(server) -> None:
+    await server.start()
+    print(f"[fakes] listening on {server.url}")
+    await asyncio.Future()
+
+async def _serve_http_forever(args) -> None:
+    tg, cg, bn = await start_http_fakes(
+        args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate,
+        ports=(args.telegram_port, args.cg_port, args.binance_port),
+    )
+    print("[fakes] export these before starting the bot:")
+    print(f"  TELEGRAM_API_URL={tg.api}")
+    print(f"  COINGECKO_API={cg.api}")
+    print(f"  BINANCE_API={bn.api}")
+    await asyncio.Future()
+
+def main():
+    ap = argparse.ArgumentParser(description="Local stand-in servers")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("ticker", help="websocket miniTicker kiểu Binance")
+    t.add_argument("--host", default="127.0.0.1")
+    t.add_argument("--port", type=int, default=8765)
+    t.add_argument("--pairs", default=",".join(DEFAULT_PAIRS))
+    t.add_argument("--interval", type=float, default=1.0)
+    t.add_argument("--drop-after", type=int, default=0)
+    h = sub.add_parser("http", help="Telegram Bot API + CoinGecko + Binance REST")
+    h.add_argument("--telegram-port", type=int, default=8081)
+    h.add_argument("--cg-port", type=int, default=8082)
+    h.add_argument("--binance-port", type=int, default=8083)
+    h.add_argument("--latency-ms", type=float, default=50)
+    h.add_argument("--jitter-ms", type=float, default=20)
+    h.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+
+    if args.cmd == "ticker":
+        pairs = [p.strip().upper() for p in args.pairs.split(",") if p.strip()]
+        prices = {p: DEFAULT_PAIRS.get(p, 1.0) for p in pairs}
+        server = FakeTickerServer(args.host, args.port, prices, args.interval, drop_after=args.drop_after)
+        asyncio.run(_serve_forever(server))
+    elif args.cmd == "http":
+        asyncio.run(_serve_http_forever(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 
 import os, csv, io, base64, datetime, json
-from utils.log import log, save_report
+from utils.log import log, report, close as close_log
 
 def load_wallets_from_secret():
     b64 = os.environ.get("WALLETS_CSV", "").strip()
@@ -38,19 +38,19 @@ def run():
     log(f"Loaded {len(wallets)} wallets")
     log(f"Loaded {len(campaigns)} campaigns")
 
-    results = []
+    total = 0
     for c in campaigns:
         name = c.get("name", "unknown")
         steps = c.get("steps", [])
         for w in wallets:
             for step in steps:
-                res = run_step(w, name, step)
-                results.append(res)
+                report(run_step(w, name, step))   # stream ra file, không gom trong RAM
+                total += 1
         log(f"Completed campaign: {name} for {len(wallets)} wallets x {len(steps)} steps")
 
-    # Save daily report
-    save_report(results)
-    log("All done.")
+    log(f"All done ({total} results).")
+    # Flush + đóng daily report
+    close_log()
 
 if __name__ == "__main__":
     run()
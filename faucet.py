@@ -2,12 +2,15 @@
 from __future__ import annotations
 import time
 import random
+import threading
 from typing import List, Dict, Any, Union, Optional
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+import metrics
+
 # Header mặc định lịch sự
 DEFAULT_HEADERS = {
     "User-Agent": "ROTCHAIN/1.0 (+https://example.com) Python-requests",
@@ -62,6 +65,7 @@ def probe(session: requests.Session, ep: Endpoint) -> Dict[str, Any]:
     headers = {**DEFAULT_HEADERS, **(cfg.get("headers") or {})}
     timeout = int(cfg.get("timeout", 15)) or 15
 
+    t0 = time.perf_counter()
     try:
         if method == "POST":
             r = session.post(url, json=payload or {}, headers=headers, timeout=timeout)
@@ -70,6 +74,7 @@ def probe(session: requests.Session, ep: Endpoint) -> Dict[str, Any]:
 
         status = r.status_code
         ok = 200 <= status < 300
+        metrics.observe_http(url, time.perf_counter() - t0, not ok)
         return {
             "url": url,
             "method": method,
@@ -78,15 +83,18 @@ def probe(session: requests.Session, ep: Endpoint) -> Dict[str, Any]:
             "elapsed_ms": int(r.elapsed.total_seconds() * 1000),
         }
     except Exception as e:
+        metrics.observe_http(url, time.perf_counter() - t0, True)
         return {"url": url, "method": method, "status": -1, "ok": False, "error": str(e)}
 
 def run_cycle(
     endpoints: List[Endpoint],
     proxy: Optional[str] = None,
     jitter_range: tuple[float, float] = (0.8, 1.6),
+    cancel: Optional[threading.Event] = None,
 ) -> List[Dict[str, Any]]:
     """
     Gọi lần lượt danh sách endpoint (GET/POST), có jitter ngẫu nhiên để tránh trùng IP/tần suất.
+    `cancel` được set (timeout / huỷ từ offload) -> dừng sau endpoint hiện tại, trả kết quả đã có.
     """
     if not endpoints:
         return []
@@ -94,10 +102,20 @@ def run_cycle(
     session = build_session(proxy=proxy, retries=2, backoff=0.6)
     results: List[Dict[str, Any]] = []
 
-    for ep in endpoints:
+    for i, ep in enumerate(endpoints):
+        if cancel is not None and cancel.is_set():
+            break
         results.append(probe(session, ep))
-        time.sleep(random.uniform(*jitter_range))
+        if i == len(endpoints) - 1:
+            break
+        delay = random.uniform(*jitter_range)
+        if cancel is not None:
+            if cancel.wait(delay):
+                break
+        else:
+            time.sleep(delay)
 
+    session.close()
     return results
 
 def format_report(results: List[Dict[str, Any]]) -> str:
@@ -0,0 +1,319 @@
+# inline.py
+"""
+Inline mode (@bot ton): trả lời từ RAM, không gọi upstream trong lúc user đang gõ.
+  - index prefix dựng sẵn (list term đã sort + bisect): tên / network / tag airdrop, ticker / id coin
+    (chỉ tối đa `max_airdrops` airdrop, ưu tiên open > upcoming > closed: RAM có trần dù catalog lớn)
+  - InlineQueryResultArticle dựng 1 lần: airdrop theo version catalog, thẻ giá theo lần cập nhật giá
+  - kết quả theo chuỗi query giữ trong LRU (theo thế hệ index) -> gõ lại / user khác gõ trùng là tra dict
+  - giá thiếu / cũ: gom symbol vào 1 lô, chờ `debounce` giây rồi mới gọi upstream 1 lần cho cả lô
+    (gõ b, bt, btc liên tiếp chỉ tạo 1 request); giá job_prices lấy được cũng đổ vào đây
+  - cache_time gửi kèm câu trả lời: Telegram tự cache phía server, dài cho airdrop, ngắn khi có giá
+Dựng lại index (rebuild) chạy ở thread (offloader), chỉ thay snapshot bằng 1 phép gán.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+from telegram.constants import ParseMode
+
+import metrics
+from crypto import Quote, format_quotes
+
+log = logging.getLogger("rotchain.inline")
+
+COIN, AIRDROP = "p:", "a:"             # tiền tố ref, đồng thời là id của InlineQueryResult
+STATUS_RANK = {"open": 0, "upcoming": 1, "closed": 2}
+INDEXED_STATUSES = sorted(STATUS_RANK, key=STATUS_RANK.__getitem__)
+MAX_TICKER = 20
+
+_WORD = re.compile(r"[a-z0-9]+")
+_QUERY = re.compile(r"[^a-z0-9\-]+")
+
+def _words(*values: Any) -> Set[str]:
+    out: Set[str] = set()
+    for v in values:
+        s = str(v or "").strip().lower()
+        if s:
+            out.add(s)
+            out.update(_WORD.findall(s))
+    return out
+
+def _tokens(query: str) -> Tuple[str, ...]:
+    return tuple(t for t in _QUERY.split(query.strip().lower()) if t)
+
+class _Snapshot(NamedTuple):
+    gen: int
+    terms: List[str]                       # đã sort
+    refs: List[str]                        # ref tương ứng từng term
+    rank: Dict[str, Tuple]                 # ref -> khoá xếp hạng (nhỏ = lên trước)
+    articles: Dict[str, InlineQueryResultArticle]    # ref airdrop -> kết quả dựng sẵn
+    defaults: List[str]                    # query rỗng
+
+_EMPTY = _Snapshot(0, [], [], {}, {}, [])
+
+def _airdrop_article(key: int, it: Dict[str, Any], card: str) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(
+        id=f"{AIRDROP}{key}",
+        title=str(it.get("name") or "?")[:100],
+        description=f"🎁 {it.get('reward', 'N/A')} · 🌐 {it.get('network', 'N/A')} · 📌 {it.get('status', 'unknown')}",
+        input_message_content=InputTextMessageContent(card, parse_mode=ParseMode.HTML, disable_web_page_preview=True),
+    )
+
+def _price_article(q: Quote) -> InlineQueryResultArticle:
+    px = q.bn or q.cg
+    parts = []
+    if q.cg:
+        parts.append(f"CG {q.cg:.6g} USD")
+    if q.bn:
+        parts.append(f"BN {q.bn:.6g} USDT")
+    if q.diff_pct is not None:
+        parts.append(f"Δ {q.diff_pct:+.2f}%")
+    stamp = time.strftime("%H:%M:%S")
+    return InlineQueryResultArticle(
+        id=f"{COIN}{q.symbol.lower()}",
+        title=f"💹 {q.symbol.upper()} · {px:.6g}",
+        description=f"{' · '.join(parts)} · {stamp}",
+        input_message_content=InputTextMessageContent(f"{format_quotes([q])}\n⏱ {stamp}", parse_mode=ParseMode.HTML),
+    )
+
+class InlineIndex:
+    def __init__(
+        self,
+        marketing,
+        defaults: Sequence[str] = (),
+        max_results: int = 20,
+        max_coins: int = 5,
+        cache_sec: int = 300,
+        price_cache_sec: int = 30,
+        price_ttl: float = 30.0,
+        debounce: float = 0.4,
+        wait: float = 1.0,
+        rebuild_sec: float = 300.0,
+        cache_size: int = 2048,
+        max_airdrops: int = 1000,
+    ):
+        self.marketing = marketing
+        self.defaults = [s.lower() for s in defaults]
+        self.max_results = max(1, min(max_results, 50))        # Telegram nhận tối đa 50 / lần
+        self.max_coins = max_coins
+        self.cache_sec = cache_sec
+        self.price_cache_sec = price_cache_sec
+        self.price_ttl = price_ttl
+        self.debounce = debounce
+        self.wait = wait
+        self.rebuild_sec = rebuild_sec
+        self.cache_size = cache_size
+        self.max_airdrops = max(0, max_airdrops)
+        self._snap = _EMPTY
+        self._catalog_version = -1
+        self._listing_at = -1.0
+        self._air: Tuple[List[Tuple[str, str]], Dict[str, Tuple], Dict[str, InlineQueryResultArticle]] = ([], {}, {})
+        self._coin: Tuple[List[Tuple[str, str]], Dict[str, Tuple]] = ([], {})
+        self._checked = 0.0
+        self._building = False
+        self._results: "OrderedDict[Tuple[int, Tuple[str, ...]], List[str]]" = OrderedDict()
+        self._cards: Dict[str, Tuple[float, InlineQueryResultArticle]] = {}     # ticker -> (monotonic, thẻ giá)
+        self._asked: Dict[str, float] = {}
+        self._pending: Set[str] = set()
+        self._flush: Optional[asyncio.Future] = None
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    # ====== Dựng index (thread) ======
+    def due(self) -> bool:
+        """True nếu chưa có index hoặc đã quá rebuild_sec kể từ lần kiểm tra trước."""
+        return not self._building and (not self._snap.gen or time.monotonic() - self._checked >= self.rebuild_sec)
+
+    async def refresh(self, offloader) -> None:
+        """Chạy rebuild() ở offloader (không chặn event loop); gọi song song thì chỉ 1 lần chạy."""
+        if not self.due():
+            return
+        self._building = True
+        self._checked = time.monotonic()
+        try:
+            await offloader.run(self.rebuild, timeout=120, name="inline_rebuild")
+        except Exception as e:
+            log.warning("Inline index rebuild failed: %s", e)
+        finally:
+            self._building = False
+
+    def _build_airdrops(self, rows: Iterable[Tuple[int, Dict[str, Any], str]]) -> None:
+        terms: List[Tuple[str, str]] = []
+        rank: Dict[str, Tuple] = {}
+        articles: Dict[str, InlineQueryResultArticle] = {}
+        for key, it, card in rows:
+            ref = f"{AIRDROP}{key}"
+            status = str(it.get("status") or "").strip().lower()
+            rank[ref] = (1, STATUS_RANK.get(status, 3), key)
+            articles[ref] = _airdrop_article(key, it, card)
+            for w in _words(it.get("name"), it.get("network"), status, *(it.get("tags") or [])):
+                terms.append((w, ref))
+        self._air = (terms, rank, articles)
+
+    def _build_coins(self) -> None:
+        from crypto import SYMBOL_INDEX, TICKER_TO_CG
+
+        coins: Dict[str, str] = dict(TICKER_TO_CG)
+        coins.update((sym, cg_id) for sym, cg_id, _ in SYMBOL_INDEX.listed())
+        for sym in self.defaults:
+            coins.setdefault(sym, SYMBOL_INDEX.cg_id(sym) or "")
+        terms: List[Tuple[str, str]] = []
+        rank: Dict[str, Tuple] = {}
+        for sym, cg_id in coins.items():
+            if not sym or len(sym) > MAX_TICKER or not sym.isalnum():
+                continue
+            ref = f"{COIN}{sym}"
+            rank[ref] = (0, sym not in self.defaults, len(sym), sym)
+            terms.append((sym, ref))
+            if cg_id and cg_id != sym:
+                terms.append((cg_id, ref))
+        self._coin = (terms, rank)
+
+    def rebuild(self) -> bool:
+        """Dựng lại phần nào đổi (catalog version / symbol index). True nếu có snapshot mới."""
+        from crypto import SYMBOL_INDEX
+
+        got = self.marketing.catalog_cards(self._catalog_version, INDEXED_STATUSES, self.max_airdrops)
+        listing_at = SYMBOL_INDEX.built_at
+        if got is None and listing_at == self._listing_at and self._snap.gen:
+            return False
+        if got is not None:
+            self._catalog_version, rows = got
+            self._build_airdrops(rows)
+        if listing_at != self._listing_at or not self._snap.gen:
+            self._build_coins()
+            self._listing_at = listing_at
+
+        air_terms, air_rank, articles = self._air
+        coin_terms, coin_rank = self._coin
+        pairs = sorted(set(air_terms) | set(coin_terms))
+        rank = {**air_rank, **coin_rank}
+        defaults = [f"{COIN}{s}" for s in self.defaults if f"{COIN}{s}" in rank]
+        defaults += sorted(articles, key=rank.__getitem__)[:max(0, self.max_results - len(defaults))]
+        self._snap = _Snapshot(
+            self._snap.gen + 1, [t for t, _ in pairs], [r for _, r in pairs], rank, articles, defaults
+        )
+        log.info("Inline index: %d terms, %d airdrops, %d coins", len(pairs), len(articles), len(coin_rank))
+        return True
+
+    # ====== Tra cứu (event loop) ======
+    def _prefix(self, snap: _Snapshot, token: str) -> Set[str]:
+        lo = bisect_left(snap.terms, token)
+        hi = bisect_left(snap.terms, token + "\uffff", lo)
+        return set(snap.refs[lo:hi])
+
+    def lookup(self, query: str, snap: Optional[_Snapshot] = None) -> List[str]:
+        """Query -> danh sách ref đã xếp hạng (coin trước, tối đa max_coins; rồi airdrop open/upcoming/closed)."""
+        snap = snap or self._snap
+        tokens = _tokens(query)
+        key = (snap.gen, tokens)
+        refs = self._results.get(key)
+        if refs is not None:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return refs
+        self.misses += 1
+        if not tokens:
+            refs = list(snap.defaults)
+        else:
+            found: Optional[Set[str]] = None
+            for t in tokens:
+                hit = self._prefix(snap, t)
+                found = hit if found is None else found & hit
+                if not found:
+                    break
+            exact = f"{COIN}{tokens[0]}"
+            ranked = sorted(found or (), key=lambda r: (r != exact, snap.rank[r]))
+            coins = [r for r in ranked if r.startswith(COIN)][:self.max_coins]
+            refs = coins + [r for r in ranked if r.startswith(AIRDROP)]
+        self._results[key] = refs
+        while len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+        return refs
+
+    async def answer(self, query: str, offset: str = "") -> Tuple[List[InlineQueryResultArticle], str, int]:
+        """(kết quả, next_offset, cache_time). Chỉ chờ upstream khi query đúng 1 ticker chưa từng có giá."""
+        try:
+            start = max(0, int(offset or 0))
+        except ValueError:
+            start = 0
+        snap = self._snap                  # rebuild trong lúc await bên dưới không được làm mất ref đã tra
+        refs = self.lookup(query, snap)
+        page = refs[start:start + self.max_results]
+        coins = [r[len(COIN):] for r in page if r.startswith(COIN)]
+        if coins:
+            now = time.monotonic()
+            stale = [c for c in coins if c not in self._cards or now - self._cards[c][0] > self.price_ttl]
+            if stale:
+                flush = self._want(stale)
+                tokens = _tokens(query)
+                if flush and len(tokens) == 1 and tokens[0] in stale and tokens[0] not in self._cards:
+                    await asyncio.wait({flush}, timeout=self.wait)
+        results = []
+        for ref in page:
+            if ref.startswith(COIN):
+                card = self._cards.get(ref[len(COIN):])
+                if card:
+                    results.append(card[1])
+            else:
+                results.append(snap.articles[ref])
+        more = start + self.max_results < len(refs)
+        return results, str(start + self.max_results) if more else "", self.price_cache_sec if coins else self.cache_sec
+
+    # ====== Giá ======
+    def observe(self, quotes: Iterable[Quote]) -> None:
+        """Nhận giá mới (job_prices / lô debounce) -> dựng lại thẻ giá của các symbol đó."""
+        now = time.monotonic()
+        for q in quotes:
+            if q.bn or q.cg:
+                self._cards[q.symbol.lower()] = (now, _price_article(q))
+
+    def _want(self, symbols: Iterable[str]) -> Optional[asyncio.Future]:
+        """Gom symbol vào lô đang chờ; None nếu mọi symbol vừa được hỏi (trong price_ttl)."""
+        now = time.monotonic()
+        fresh = [s for s in symbols if now - self._asked.get(s, -1e9) > self.price_ttl]
+        if not fresh and not self._pending:
+            return None
+        for s in fresh:
+            self._asked[s] = now
+            self._pending.add(s)
+        if self._flush is None:
+            self._flush = asyncio.get_running_loop().create_future()
+            asyncio.get_running_loop().create_task(self._fetch_later(self._flush))
+        return self._flush
+
+    async def _fetch_later(self, done: asyncio.Future) -> None:
+        import acrypto
+
+        try:
+            await asyncio.sleep(self.debounce)
+            batch, self._pending, self._flush = sorted(self._pending), set(), None
+            self.fetches += 1
+            metrics.incr("inline_price_fetch")
+            self.observe(await acrypto.fetch_quotes(batch))
+        except Exception as e:
+            log.warning("Inline price fetch failed: %s", e)
+        finally:
+            self._flush = None if self._flush is done else self._flush
+            if not done.done():
+                done.set_result(None)
+        if len(self._asked) > 10 * self.cache_size:
+            cutoff = time.monotonic() - self.price_ttl
+            self._asked = {s: t for s, t in self._asked.items() if t > cutoff}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "terms": len(self._snap.terms),
+            "cached_queries": len(self._results),
+            "cards": len(self._cards),
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+        }
@@ -1,15 +1,257 @@
+# log.py  (farmer.py import dưới tên utils.log)
+"""
+Log + report cho farmer, bộ nhớ không đổi dù có bao nhiêu bản ghi:
+  - ReportWriter: ghi JSONL kiểu append (chạy lại không đè file cũ), gom buffer rồi flush theo
+    kích thước hoặc thời gian; xoay file theo ngày (UTC) và theo dung lượng, tuỳ chọn gzip file đã xoay
+  - mọi lần ghi (log lẫn report) đi qua 1 queue có giới hạn tới thread nền -> producer không chờ I/O
+  - log() quá tải thì bỏ dòng (đếm lại); report() đầy queue thì chờ chỗ trống, không bao giờ bỏ bản ghi
+Cấu hình qua env: REPORT_DIR, REPORT_MAX_MB, REPORT_GZIP, REPORT_FLUSH_SEC.
+"""
+from __future__ import annotations
+import atexit
+import datetime
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO
 
-import os, json, datetime
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _gzip_file(path: str) -> str:
+    """path -> path.gz (xoá bản gốc). Chạy ở thread nền nên không chặn ai."""
+    dst = path + ".gz"
+    with open(path, "rb") as src, gzip.open(dst, "wb") as out:
+        shutil.copyfileobj(src, out, 1 << 20)
+    os.remove(path)
+    return dst
+
+class ReportWriter:
+    """
+    File đang ghi: <dir>/<prefix>_YYYYMMDD.jsonl
+    Vượt max_bytes -> đổi tên thành <prefix>_YYYYMMDD.<n>.jsonl (gzip nếu bật) rồi ghi tiếp file mới.
+    Ngày của bản ghi lấy lúc write() (không phải lúc flush): sang ngày mới thì buffer cũ được flush vào file
+    ngày cũ trước, rồi file đó được gzip (nếu bật). Mở file khi bật gzip -> gzip luôn file ngày cũ còn sót
+    (process chết / restart qua đêm). Không thread-safe: dùng từ 1 thread.
+    """
+
+    def __init__(
+        self,
+        directory: str = "reports",
+        prefix: str = "report",
+        max_bytes: int = 64 << 20,
+        flush_bytes: int = 64 << 10,
+        flush_sec: float = 5.0,
+        compress: bool = False,
+        clock: Callable[[], datetime.datetime] = _utcnow,
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.flush_bytes = flush_bytes
+        self.flush_sec = flush_sec
+        self.compress = compress
+        self._clock = clock
+        self._buf: List[str] = []
+        self._buf_bytes = 0
+        self._last_flush = time.monotonic()
+        self._day = ""                   # ngày của file đang mở
+        self._buf_day = ""               # ngày của các bản ghi đang nằm trong buffer
+        self._size = 0
+        self._fh: Optional[TextIO] = None
+        self.records = 0
+        self.files: List[str] = []       # file đã đóng (đã xoay) trong lần chạy này
+
+    def _path(self, day: str, part: int = 0) -> str:
+        name = f"{self.prefix}_{day}.{part}.jsonl" if part else f"{self.prefix}_{day}.jsonl"
+        return os.path.join(self.directory, name)
+
+    @property
+    def path(self) -> str:
+        return self._path(self._day or self._clock().strftime("%Y%m%d"))
+
+    def _open(self, day: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if self.compress:
+            self._compress_leftovers(day)
+        self._day = day
+        self._fh = open(self._path(day), "a", encoding="utf-8")
+        self._size = self._fh.tell()
+
+    def _compress_leftovers(self, today: str) -> None:
+        """gzip file .jsonl của các ngày trước `today` còn để dạng thường."""
+        pat = re.compile(rf"{re.escape(self.prefix)}_(\d{{8}})(?:\.\d+)?\.jsonl")
+        for name in sorted(os.listdir(self.directory)):
+            m = pat.fullmatch(name)
+            path = os.path.join(self.directory, name)
+            if m and m.group(1) < today and os.path.getsize(path):
+                _gzip_file(path)
+
+    def _close_file(self, compress: bool) -> None:
+        if self._fh is None:
+            return
+        path = self._fh.name
+        self._fh.close()
+        self._fh = None
+        if compress and os.path.getsize(path):
+            path = _gzip_file(path)
+        self.files.append(path)
+
+    def _rotate_size(self) -> None:
+        day = self._day
+        self._close_file(False)
+        self.files.pop()
+        part = 1
+        while os.path.exists(self._path(day, part)) or os.path.exists(self._path(day, part) + ".gz"):
+            part += 1
+        dst = self._path(day, part)
+        os.replace(self._path(day), dst)
+        self.files.append(_gzip_file(dst) if self.compress else dst)
+        self._open(day)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        day = self._clock().strftime("%Y%m%d")
+        if day != self._buf_day:
+            self.flush()                 # bản ghi trước nửa đêm vào file của ngày đó
+            self._buf_day = day
+        self._buf.append(line)
+        self._buf_bytes += len(line)
+        self.records += 1
+        if self._buf_bytes >= self.flush_bytes or time.monotonic() - self._last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._buf:
+            return
+        day = self._buf_day
+        if self._fh is None or day != self._day:
+            self._close_file(self.compress)
+            self._open(day)
+        data = "".join(self._buf)
+        self._buf.clear()
+        self._buf_bytes = 0
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate_size()
+        self._fh.write(data)
+        self._fh.flush()
+        self._size += len(data)      # ước lượng theo ký tự, đủ dùng cho ngưỡng xoay
+
+    def due(self) -> bool:
+        return bool(self._buf) and time.monotonic() - self._last_flush >= self.flush_sec
+
+    def close(self) -> None:
+        self.flush()
+        self._close_file(False)      # file của hôm nay để dạng thường: chạy lại cùng ngày còn append được
+
+class BackgroundLogger:
+    """Thread nền ăn queue có giới hạn: dòng log ra stream, bản ghi report vào ReportWriter."""
+
+    _STOP = object()
+
+    def __init__(self, writer: Optional[ReportWriter] = None, maxsize: int = 10000, stream: Optional[TextIO] = None):
+        self.writer = writer
+        self.stream = stream
+        self.dropped = 0
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, line: str) -> None:
+        try:
+            self._q.put_nowait(("log", line))
+        except queue.Full:
+            self.dropped += 1
+
+    def record(self, rec: Dict[str, Any]) -> None:
+        self._q.put(("rec", rec))          # đầy thì chờ thread nền (backpressure), không bỏ report
+
+    def flush(self) -> None:
+        done = threading.Event()
+        self._q.put(("flush", done))
+        done.wait()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._q.put(self._STOP)
+            self._thread.join()
+
+    def _run(self) -> None:
+        timeout = self.writer.flush_sec if self.writer else None
+        while True:
+            try:
+                item = self._q.get(timeout=timeout)
+            except queue.Empty:
+                self.writer.flush()          # flush theo thời gian khi không có bản ghi mới
+                continue
+            try:
+                if item is self._STOP:
+                    break
+                kind, payload = item
+                if kind == "log":
+                    print(payload, file=self.stream or sys.stdout, flush=self._q.empty())
+                elif kind == "rec":
+                    self.writer.write(payload)
+                elif kind == "flush":
+                    if self.writer:
+                        self.writer.flush()
+                    payload.set()
+                if self.writer and self.writer.due():
+                    self.writer.flush()
+            except Exception as e:           # lỗi I/O không được giết thread log
+                print(f"[log] write error: {e}", file=sys.stderr)
+        if self.dropped:
+            print(f"[log] {self.dropped} log lines dropped (queue full)", file=sys.stderr)
+        if self.writer:
+            self.writer.close()
+
+_logger: Optional[BackgroundLogger] = None
+_lock = threading.Lock()
+
+def _get() -> BackgroundLogger:
+    global _logger
+    if _logger is None:
+        with _lock:
+            if _logger is None:
+                writer = ReportWriter(
+                    os.getenv("REPORT_DIR", "reports"),
+                    max_bytes=int(float(os.getenv("REPORT_MAX_MB", "64")) * (1 << 20)),
+                    flush_sec=float(os.getenv("REPORT_FLUSH_SEC", "5")),
+                    compress=os.getenv("REPORT_GZIP", "0") == "1",
+                )
+                _logger = BackgroundLogger(writer)
+                atexit.register(close)
+    return _logger
 
 def log(msg):
-    ts = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{ts} UTC] {msg}")
-
-def save_report(results):
-    os.makedirs("reports", exist_ok=True)
-    ts = datetime.datetime.utcnow().strftime("%Y%m%d")
-    path = os.path.join("reports", f"report_{ts}.jsonl")
-    with open(path, "w", encoding="utf-8") as f:
-        for r in results:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
-    log(f"Saved report: {path}")
+    ts = _utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    _get().log(f"[{ts} UTC] {msg}")
+
+def report(record: Dict[str, Any]) -> None:
+    """Ghi 1 bản ghi vào report của ngày (stream, không giữ trong RAM)."""
+    _get().record(record)
+
+def save_report(results: Iterable[Dict[str, Any]]) -> None:
+    """Tương thích cũ: nhận list hoặc generator, append vào report ngày rồi flush."""
+    for r in results:
+        report(r)
+    close()
+
+def close() -> None:
+    """Flush + đóng thread nền (gọi cuối chương trình; atexit cũng tự gọi)."""
+    global _logger
+    with _lock:
+        lg, _logger = _logger, None
+    if lg is not None:
+        lg.close()
+        w = lg.writer
+        if w and w.records:
+            rotated = f", +{len(w.files) - 1} rotated" if len(w.files) > 1 else ""
+            print(f"[{_utcnow():%Y-%m-%d %H:%M:%S} UTC] Saved report: {w.path} ({w.records} records{rotated})")
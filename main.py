@@ -2,20 +2,24 @@
 from __future__ import annotations
 import asyncio
 import logging
+import sys
+import threading
 from datetime import timedelta
-from typing import List
+from typing import TYPE_CHECKING, List
 
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, ContextTypes, filters, AIORateLimiter
+    Application, CommandHandler, InlineQueryHandler, MessageHandler, ContextTypes, filters, AIORateLimiter
 )
 
-# Local modules
+# Local modules (crypto/acrypto/faucet/stream + HTTP stack của chúng nạp lười khi dùng lần đầu)
 from config import Settings, ensure_core_env
-from marketing import Marketing
-from crypto import format_prices_for_msg
-from faucet import run_cycle, format_report
+import metrics
+from offload import Offloader, OffloadTimeout, QueueFull
+
+if TYPE_CHECKING:
+    from scheduler import Scheduler
 
 # ============ Logging ============
 logging.basicConfig(
@@ -25,8 +29,117 @@ logging.basicConfig(
 log = logging.getLogger("rotchain")
 
 # ============ Bootstrapping ============
-ensure_core_env()
-marketing = Marketing(Settings.LP_URL, Settings.KEYWORDS)
+# Tạo trong bootstrap() (gọi từ main), import module không tốn gì ngoài telegram
+marketing = None
+price_stream = None
+price_memory = None
+alert_book = None
+tsdb = None
+inline_index = None
+subscribers = None
+broadcaster = None
+# Code blocking (faucet sleep/requests, SQLite, đọc airdrops.json) chạy ở đây, không chặn event loop
+offloader = Offloader(Settings.OFFLOAD_WORKERS, Settings.OFFLOAD_MAX_PENDING, default_timeout=Settings.OFFLOAD_TIMEOUT)
+# Store SQLite được mở lười ngay trong thread offload -> khoá để 2 thread không cùng mở
+_open_lock = threading.Lock()
+
+def bootstrap() -> None:
+    global marketing, price_stream
+    ensure_core_env()
+    from marketing import Marketing
+
+    marketing = Marketing(
+        Settings.LP_URL,
+        Settings.KEYWORDS,
+        keywords_file=Settings.KEYWORDS_FILE,
+        word_boundary=Settings.KEYWORD_WORD_BOUNDARY,
+        backend=Settings.AIRDROP_BACKEND,
+        db_path=Settings.AIRDROP_DB,
+    )
+    if Settings.PRICE_STREAM_ENABLED:
+        from crypto import map_to_binance
+        from stream import PriceStream, build_stream_url
+
+        price_stream = PriceStream(
+            build_stream_url(Settings.PRICE_STREAM_URL, [map_to_binance(s) for s in Settings.SYMBOLS])
+        )
+
+def get_price_memory():
+    global price_memory
+    if price_memory is None:
+        from crypto import PriceMemory
+
+        # Đủ tick để phủ cửa sổ cảnh báo khi streaming (tick dày hơn poll)
+        history = Settings.PRICE_HISTORY_SIZE
+        if price_stream:
+            history = max(history, Settings.ALERT_WINDOW_MIN * 60 // max(1, Settings.PRICE_STREAM_TICK_SEC) + 2)
+        price_memory = PriceMemory(history, Settings.PRICE_EMA_ALPHA)
+    return price_memory
+
+def get_alert_book():
+    """Mở DB (blocking): gọi trong offloader.run, không gọi thẳng trên event loop."""
+    global alert_book
+    with _open_lock:
+        if alert_book is None:
+            from alerts import AlertBook
+
+            alert_book = AlertBook(Settings.ALERTS_DB, Settings.ALERT_MAX_PER_USER)
+    return alert_book
+
+def get_tsdb():
+    """Mở thư mục dữ liệu (blocking): gọi trong offloader.run, không gọi thẳng trên event loop."""
+    global tsdb
+    with _open_lock:
+        if tsdb is None:
+            from tsdb import PriceStore
+
+            tsdb = PriceStore(Settings.TSDB_DIR, {
+                "raw": Settings.TSDB_RAW_DAYS * 86400,
+                "1m": Settings.TSDB_1M_DAYS * 86400,
+                "1h": Settings.TSDB_1H_DAYS * 86400,
+            })
+    return tsdb
+
+def get_inline_index():
+    global inline_index
+    if inline_index is None:
+        from inline import InlineIndex
+
+        inline_index = InlineIndex(
+            marketing,
+            Settings.SYMBOLS,
+            max_results=Settings.INLINE_MAX_RESULTS,
+            cache_sec=Settings.INLINE_CACHE_SEC,
+            price_cache_sec=Settings.INLINE_PRICE_CACHE_SEC,
+            price_ttl=Settings.PRICE_CACHE_TTL,
+            debounce=Settings.INLINE_DEBOUNCE_MS / 1000.0,
+            rebuild_sec=Settings.INLINE_REBUILD_SEC,
+            max_airdrops=Settings.INLINE_MAX_AIRDROPS,
+        )
+    return inline_index
+
+def get_subscribers():
+    """Mở DB (blocking): gọi trong offloader.run, không gọi thẳng trên event loop."""
+    global subscribers
+    with _open_lock:
+        if subscribers is None:
+            from broadcast import SubscriberStore
+
+            subscribers = SubscriberStore(Settings.SUBSCRIBERS_DB)
+    return subscribers
+
+def get_broadcaster(bot):
+    global broadcaster
+    if broadcaster is None:
+        from broadcast import Broadcaster
+
+        broadcaster = Broadcaster(
+            get_subscribers(), bot, offloader.run,
+            rate=Settings.BROADCAST_RATE,
+            concurrency=Settings.BROADCAST_CONCURRENCY,
+            report_sec=Settings.BROADCAST_REPORT_SEC,
+        )
+    return broadcaster
 
 # ============ Helpers ============
 def is_admin(user_id: int) -> bool:
@@ -36,133 +149,562 @@ async def safe_reply(update: Update, text: str, **kwargs):
     try:
         await update.effective_chat.send_message(text, **kwargs)
     except Exception as e:
+        metrics.incr("reply_errors")
         log.warning("Reply error: %s", e)
 
+async def offload_reply(update: Update, fn, *args, **kwargs):
+    """offloader.run cho command: quá tải / quá giờ thì báo user và trả None."""
+    try:
+        return await offloader.run(fn, *args, **kwargs)
+    except QueueFull:
+        await safe_reply(update, "⏳ Bot đang bận, bạn thử lại sau ít giây nhé.")
+    except OffloadTimeout as e:
+        log.warning("Offload timeout: %s", e)
+        await safe_reply(update, "⌛ Xử lý quá lâu, bạn thử lại sau nhé.")
+    return None
+
 # ============ Commands ============
 async def cmd_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Chào + đăng ký nhận broadcast cho chat này (/stop để huỷ)."""
+    if update.effective_chat:
+        chat_id = update.effective_chat.id
+        user_id = update.effective_user.id if update.effective_user else None
+        await offload_reply(update, lambda: get_subscribers().subscribe(chat_id, user_id))
+    await cmd_help(update, ctx)
+
+async def cmd_stop(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_chat:
+        return
+    chat_id = update.effective_chat.id
+    removed = await offload_reply(update, lambda: get_subscribers().unsubscribe(chat_id))
+    if removed:
+        return await safe_reply(update, "🔕 Đã huỷ nhận thông báo. Gõ /start để đăng ký lại.")
+    if removed is not None:
+        await safe_reply(update, "Chat này chưa đăng ký nhận thông báo (/start).")
+
+async def cmd_help(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     msg = (
         "👋 Xin chào! Mình là trợ lý dự án ROTCHAIN.\n\n"
-        "• /airdrop – Xem danh sách airdrop đang mở\n"
+        "• /airdrop [network] [trang] – Xem danh sách airdrop đang mở\n"
         "• /airdrop_random – Gợi ý 1 airdrop ngẫu nhiên (FOMO)\n"
         "• /prices – Xem giá & chênh lệch (CG vs Binance)\n"
+        "• /spread_top [N] – Top N cặp chênh lệch CG vs Binance toàn thị trường\n"
+        "• /chart symbol [6h|7d|30d|1y] – Biểu đồ giá từ lịch sử bot đã ghi\n"
+        "• /watch [symbol above|below giá | symbol ±x% 1h] – Cảnh báo giá riêng (/unwatch để xoá)\n"
+        "• /stop – Ngừng nhận thông báo (/start để nhận lại)\n"
         "• /faucet – Kiểm tra faucet endpoints (admin)\n"
+        "• /broadcast nội dung | status | cancel [id] – Gửi tới mọi người đã /start (admin)\n"
+        "• /stats – Thống kê latency handler/job/API (admin)\n"
         "• /help – Trợ giúp\n\n"
         f"{marketing.cta()}"
     )
     await safe_reply(update, msg, parse_mode=ParseMode.HTML)
 
-async def cmd_help(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    await cmd_start(update, ctx)
-
 async def cmd_airdrop(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    items = marketing.load_airdrops()
-    # Có thể lọc theo status/network/limit:
-    text = marketing.format_airdrops(items, status="open", network=None, limit=8)
-    await safe_reply(update, text, parse_mode=ParseMode.HTML)
+    # /airdrop [open|closed|upcoming|all] [network] [#tag] [trang] – catalog tự nạp lại khi airdrops.json đổi
+    f = marketing.parse_filters(ctx.args or [])
+    text = await offload_reply(
+        update, marketing.format_airdrops,
+        status=f["status"], network=f["network"], tag=f["tag"], page=f["page"], limit=Settings.AIRDROP_PAGE_SIZE,
+    )
+    if text:
+        await safe_reply(update, text, parse_mode=ParseMode.HTML)
 
 async def cmd_airdrop_random(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    items = marketing.load_airdrops()
-    text = marketing.random_airdrop(items, status="open", network=None)
-    await safe_reply(update, text, parse_mode=ParseMode.HTML)
+    text = await offload_reply(update, marketing.random_airdrop, status="open", network=None)
+    if text:
+        await safe_reply(update, text, parse_mode=ParseMode.HTML)
 
 async def cmd_prices(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    import acrypto
+    import upstream
+    from crypto import format_quotes, map_to_binance
+
     # lấy danh sách symbols từ config
     symbols: List[str] = Settings.SYMBOLS
-    text = format_prices_for_msg(symbols)
+    if price_stream and price_stream.is_fresh(Settings.PRICE_STREAM_MAX_AGE):
+        bn = price_stream.prices([map_to_binance(s) for s in symbols], Settings.PRICE_STREAM_MAX_AGE)
+        text = format_quotes(await acrypto.fetch_quotes(symbols, binance=bn))
+    else:
+        text = await acrypto.format_prices_for_msg(symbols)
+    # Host đang open thì lời gọi đã fail fast (dùng cache/stale) -> báo ngay cho user
+    down = upstream.degraded([acrypto.COINGECKO, acrypto.BINANCE])
+    if down:
+        text = f"{text}\n\n{upstream.format_degraded(down)}"
     await safe_reply(update, text, parse_mode=ParseMode.HTML)
 
+async def cmd_spread_top(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/spread_top [N] – quét mọi cặp USDT trên Binance so với CoinGecko, lấy N cặp lệch nhiều nhất."""
+    import acrypto
+    from crypto import format_spreads
+
+    try:
+        top = max(1, min(int(ctx.args[0]), 30)) if ctx.args else Settings.SPREAD_TOP_N
+    except ValueError:
+        return await safe_reply(update, "Cú pháp: /spread_top [N] (N ≤ 30)")
+    scan = await acrypto.scan_spreads(
+        top, Settings.PRICE_BASE_CURRENCY, Settings.SPREAD_MAX_PCT,
+        chunk=Settings.SPREAD_CG_CHUNK, timeout=Settings.SPREAD_TIMEOUT,
+    )
+    await safe_reply(update, format_spreads(scan), parse_mode=ParseMode.HTML)
+
+async def cmd_chart(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/chart btc [30d] – biểu đồ giá từ lịch sử đã lưu (tsdb.py), mặc định 1d."""
+    import tsdb as ts
+
+    if not Settings.TSDB_DIR:
+        return await safe_reply(update, "Lịch sử giá đang tắt (TSDB_DIR).")
+    if not ctx.args:
+        return await safe_reply(update, "Cú pháp: /chart &lt;symbol&gt; [6h|7d|30d|1y…]", parse_mode=ParseMode.HTML)
+    symbol = ctx.args[0].lower()
+    label = ctx.args[1].lower() if len(ctx.args) > 1 else "1d"
+    try:
+        span = ts.parse_span(label)
+    except ValueError as e:
+        return await safe_reply(update, f"⚠️ {e}")
+
+    def build() -> str:
+        import time
+
+        tier, t, px = get_tsdb().query(symbol, time.time() - span)
+        return ts.format_chart(symbol, label, tier, t, px, Settings.TZ)
+
+    text = await offload_reply(update, build)
+    if text:
+        await safe_reply(update, text, parse_mode=ParseMode.HTML)
+
+async def cmd_watch(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/watch btc above 70k | /watch eth -5% 1h | /watch (xem danh sách)."""
+    from alerts import WatchError, describe, format_list, parse_watch
+    from crypto import SYMBOL_INDEX
+
+    if not update.effective_user:
+        return
+    user_id = update.effective_user.id
+    if not ctx.args:
+        subs = await offload_reply(update, lambda: get_alert_book().for_user(user_id))
+        if subs is not None:
+            await safe_reply(update, format_list(subs), parse_mode=ParseMode.HTML)
+        return
+    chat_id = update.effective_chat.id
+    try:
+        symbol, kind, threshold, window = parse_watch(ctx.args)
+        # Index đã nạp thì chặn symbol không có giá ở đâu cả (cảnh báo sẽ không bao giờ bắn)
+        if len(SYMBOL_INDEX) and not (SYMBOL_INDEX.cg_id(symbol) or SYMBOL_INDEX.is_cg_id(symbol)):
+            raise WatchError(f"không tìm thấy symbol '{symbol}'")
+        sub = await offload_reply(
+            update, lambda: get_alert_book().add(user_id, chat_id, symbol, kind, threshold, window)
+        )
+    except WatchError as e:
+        return await safe_reply(update, f"⚠️ {e}\nVí dụ: /watch btc above 70k · /watch eth -5% 1h")
+    if sub is None:
+        return
+    await safe_reply(update, f"✅ Đã đặt cảnh báo <code>#{sub.id}</code>: {describe(sub)}", parse_mode=ParseMode.HTML)
+
+async def cmd_unwatch(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/unwatch <id|symbol|all>."""
+    if not update.effective_user:
+        return
+    if not ctx.args:
+        return await safe_reply(update, "Cú pháp: /unwatch &lt;id|symbol|all&gt; (xem id bằng /watch)", parse_mode=ParseMode.HTML)
+    user_id, target = update.effective_user.id, ctx.args[0].lstrip("#").lower()
+    n = await offload_reply(update, lambda: get_alert_book().remove(user_id, target))
+    if n is None:
+        return
+    await safe_reply(update, f"🗑 Đã xoá {n} cảnh báo." if n else "Không có cảnh báo nào khớp.")
+
 async def cmd_faucet(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id if update.effective_user else 0
     if not is_admin(user_id):
         return await safe_reply(update, "⛔ Lệnh này chỉ dành cho admin.")
     if not Settings.FAUCET_ENABLED or not Settings.FAUCET_ENDPOINTS:
         return await safe_reply(update, "Faucet chưa bật hoặc chưa có endpoint.")
+    from faucet import run_cycle, format_report
+
     proxy = None  # có thể đọc từ ENV nếu bạn muốn xoay IP
-    results = run_cycle(Settings.FAUCET_ENDPOINTS, proxy=proxy)
-    await safe_reply(update, format_report(results))
+    results = await offload_reply(
+        update, run_cycle, Settings.FAUCET_ENDPOINTS, proxy=proxy,
+        timeout=Settings.FAUCET_TIMEOUT, cancellable=True,
+    )
+    if results is not None:
+        await safe_reply(update, format_report(results))
 
 async def cmd_broadcast(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    """Admin broadcast 1 tin nhắn đơn giản vào TELEGRAM_CHAT_ID chính."""
+    """
+    Admin: /broadcast <nội dung HTML> – gửi tới mọi chat đã /start + TELEGRAM_CHAT_ID chính.
+    /broadcast status | /broadcast cancel [id]. Chạy nền, tiến độ được sửa trong 1 tin riêng.
+    """
     user_id = update.effective_user.id if update.effective_user else 0
     if not is_admin(user_id):
         return await safe_reply(update, "⛔ Lệnh này chỉ dành cho admin.")
-    text = " ".join(ctx.args) if ctx.args else "Thông báo chung từ hệ thống."
-    await ctx.bot.send_message(Settings.TELEGRAM_CHAT_ID, text, parse_mode=ParseMode.HTML)
-    await safe_reply(update, "✅ Đã gửi.")
+    store = await offload_reply(update, get_subscribers)
+    if store is None:
+        return
+    sub = ctx.args[0].lower() if ctx.args else ""
+    if sub == "status":
+        running = sorted(broadcaster.tasks) if broadcaster else []
+        count = await offload_reply(update, store.count)
+        if count is None:
+            return
+        return await safe_reply(update, f"👥 {count} người đăng ký · đang chạy: {running or 'không có'}")
+    if sub == "cancel":
+        bid = int(ctx.args[1]) if len(ctx.args) > 1 and ctx.args[1].isdigit() else None
+        n = await offload_reply(update, store.cancel, bid)
+        if n is None:
+            return
+        return await safe_reply(update, f"⛔ Đã huỷ {n} đợt broadcast." if n else "Không có đợt nào đang chạy.")
+    # Giữ nguyên xuống dòng của tin gốc (ctx.args đã tách mất)
+    parts = (update.message.text or "").split(None, 1) if update.message else []
+    text = parts[1].strip() if len(parts) > 1 else "Thông báo chung từ hệ thống."
+    # Gửi bản xem trước cho admin: HTML hỏng thì dừng ở đây, không tạo đợt lỗi cho cả nghìn người
+    from telegram.error import BadRequest
+    try:
+        await ctx.bot.send_message(update.effective_chat.id, text, parse_mode=ParseMode.HTML,
+                                   disable_web_page_preview=True)
+    except BadRequest as e:
+        return await safe_reply(update, f"⚠️ Nội dung không gửi được, chưa tạo broadcast: {e}")
+    admin_chat = update.effective_chat.id
+
+    def create():
+        bid, total = store.create(text, admin_chat, (Settings.TELEGRAM_CHAT_ID,))
+        return store.get(bid), total
+
+    # Quá giờ sau khi đã ghi: đợt vẫn nằm trong DB, job_broadcast nhận lại khi heartbeat cũ
+    created = await offload_reply(update, create)
+    if created is None:
+        return
+    job, total = created
+    get_broadcaster(ctx.bot).start(job)
+    await safe_reply(update, f"📣 Broadcast #{job.id}: {total} người nhận, tiến độ sẽ cập nhật bên dưới.")
 
 async def cmd_ping(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await safe_reply(update, "pong 🏓")
 
+async def cmd_stats(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/stats [handler|job|http] – latency p50/p99, số lần gọi, lỗi (admin)."""
+    user_id = update.effective_user.id if update.effective_user else 0
+    if not is_admin(user_id):
+        return await safe_reply(update, "⛔ Lệnh này chỉ dành cho admin.")
+    kind = ctx.args[0].lower() if ctx.args else None
+    await safe_reply(update, metrics.format_stats(kind), parse_mode=ParseMode.HTML)
+
 # ============ Text handler (quick reply) ============
+def wants_reply(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> bool:
+    """
+    Chỉ tin khớp từ khoá mới tính quota shedding; chat thường trong group bot không trả lời.
+    Câu trả lời gắn vào ctx.quick_reply (ctx đi cùng update tới on_message) -> chỉ quét từ khoá 1 lần.
+    """
+    text = update.message.text if update.message else None
+    ctx.quick_reply = marketing.quick_reply(text) if text else None
+    return ctx.quick_reply is not None
+
 async def on_message(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.text:
         return
-    reply = marketing.quick_reply(update.message.text)
+    reply = ctx.quick_reply if hasattr(ctx, "quick_reply") else marketing.quick_reply(update.message.text)
     if reply:
         await safe_reply(update, reply, parse_mode=ParseMode.HTML)
 
+# ============ Inline mode (@bot ton) ============
+async def on_inline(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Trả lời từ index dựng sẵn trong RAM; index cũ thì dựng lại nền (offloader), không chờ."""
+    index = get_inline_index()
+    if index.due():
+        ctx.application.create_task(index.refresh(offloader))
+    q = update.inline_query
+    results, next_offset, cache_time = await index.answer(q.query, q.offset)
+    try:
+        await q.answer(results, cache_time=cache_time, is_personal=False, next_offset=next_offset)
+    except Exception as e:          # query quá 10s / user đã gõ tiếp: Telegram từ chối, bỏ qua
+        metrics.incr("inline_answer_errors")
+        log.debug("Inline answer failed: %s", e)
+
 # ============ Error handler ============
 async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE):
+    if update is None and context.job is not None:
+        # Job đã tự log lỗi chi tiết, raise lại chỉ để metrics "job" / state.db ghi nhận thất bại
+        metrics.incr("job_errors")
+        log.debug("Job %s failed: %r", context.job.name, context.error)
+        return
+    metrics.incr("update_errors")
     log.error("Update error: %s", context.error)
 
 # ============ Jobs (định kỳ) ============
 async def job_prices(context: ContextTypes.DEFAULT_TYPE):
+    import acrypto
+    from crypto import format_alerts
+
+    price_memory = get_price_memory()
+    quotes = []
+    failed = None       # bước nào lỗi cũng chạy tiếp các bước sau, cuối cùng mới raise
     try:
-        msg = format_prices_for_msg(Settings.SYMBOLS)
-        await context.bot.send_message(Settings.TELEGRAM_CHAT_ID, msg, parse_mode=ParseMode.HTML)
+        if price_stream and price_stream.is_fresh(Settings.PRICE_STREAM_MAX_AGE):
+            quotes = price_stream.quotes(Settings.SYMBOLS, max_age=Settings.PRICE_STREAM_MAX_AGE)
+        else:
+            quotes = await acrypto.fetch_quotes(Settings.SYMBOLS)
+        price_memory.observe_quotes(quotes)
+        if inline_index:
+            inline_index.observe(quotes)
+        alerts = price_memory.alerts(
+            Settings.ALERT_UP_PCT, Settings.ALERT_DOWN_PCT, window_s=Settings.ALERT_WINDOW_MIN * 60
+        )
+        if alerts:
+            await context.bot.send_message(Settings.TELEGRAM_CHAT_ID, format_alerts(alerts), parse_mode=ParseMode.HTML)
     except Exception as e:
         log.warning("job_prices error: %s", e)
+        failed = e
+    prices = {q.symbol.lower(): q.bn or q.cg for q in quotes}
+    try:
+        await check_watches(context, prices)
+    except Exception as e:
+        log.warning("job_prices watch error: %s", e)
+        failed = failed or e
+    if Settings.TSDB_DIR and prices:
+        try:
+            # Vài bản ghi 16 byte mỗi symbol, nhưng vẫn là I/O file: không làm trên event loop
+            await offloader.run(lambda: get_tsdb().append(prices), name="tsdb_append")
+        except Exception as e:
+            log.warning("job_prices tsdb error: %s", e)
+            failed = failed or e
+    if failed:
+        raise failed
+
+async def check_watches(context: ContextTypes.DEFAULT_TYPE, prices) -> None:
+    """Cảnh báo /watch: lấy thêm giá các symbol user theo dõi (1 lô, bổ sung vào prices), gửi mỗi chat 1 tin."""
+    import acrypto
+    from alerts import format_fired, group_by_chat
+
+    # AlertBook chạm SQLite (load / ghi fired) -> mọi lời gọi đều qua offloader
+    watched = await offloader.run(lambda: get_alert_book().symbols(), name="alerts_symbols")
+    extra = sorted(watched - prices.keys())
+    if extra:
+        prices.update({q.symbol.lower(): q.bn or q.cg for q in await acrypto.fetch_quotes(extra)})
+    fired = await offloader.run(lambda: get_alert_book().evaluate(prices), name="alerts_evaluate")
+    for chat_id, items in group_by_chat(fired).items():
+        try:
+            await context.bot.send_message(chat_id, format_fired(items), parse_mode=ParseMode.HTML)
+        except Exception as e:
+            metrics.incr("alert_send_errors")
+            log.warning("Watch alert to %s failed: %s", chat_id, e)
+
+async def job_symbols(context: ContextTypes.DEFAULT_TYPE):
+    """Làm mới symbol index (coins list) trong thread riêng, không chặn event loop."""
+    from crypto import SYMBOL_INDEX
+
+    if not SYMBOL_INDEX.is_stale(Settings.SYMBOL_REFRESH_HOURS * 3600):
+        return
+    try:
+        changed = await offloader.run(SYMBOL_INDEX.refresh, timeout=120, name="symbols_refresh")
+        log.info("Symbol index refreshed: %d coins, %d changed", len(SYMBOL_INDEX), changed)
+    except Exception as e:
+        log.warning("job_symbols error: %s", e)
+        raise
+
+async def job_tsdb(context: ContextTypes.DEFAULT_TYPE):
+    """Gộp raw -> 1m/1h/1d + cắt dữ liệu quá hạn, chạy trong thread riêng."""
+    try:
+        stats = await offloader.run(lambda: get_tsdb().compact(), timeout=300, name="tsdb_compact")
+        log.info("Tsdb compacted: %d bars, %d trimmed", stats["bars"], stats["trimmed"])
+    except Exception as e:
+        log.warning("job_tsdb error: %s", e)
+        raise
+
+async def job_broadcast(context: ContextTypes.DEFAULT_TYPE):
+    """Nhận lại các đợt broadcast dở (restart / process khác đã chết) rồi chạy tiếp."""
+    try:
+        jobs = await offloader.run(lambda: get_subscribers().claim())
+    except Exception as e:
+        log.warning("job_broadcast error: %s", e)
+        raise
+    bc = get_broadcaster(context.bot)
+    for job in jobs:
+        log.info("Resuming broadcast %d", job.id)
+        bc.start(job)
 
 async def job_airdrop(context: ContextTypes.DEFAULT_TYPE):
     try:
-        items = marketing.load_airdrops()
-        msg = marketing.random_airdrop(items, status="open", network=None)
+        msg = await offloader.run(marketing.random_airdrop, status="open", network=None)
         await context.bot.send_message(Settings.TELEGRAM_CHAT_ID, msg, parse_mode=ParseMode.HTML)
     except Exception as e:
         log.warning("job_airdrop error: %s", e)
+        raise
 
 async def job_faucet(context: ContextTypes.DEFAULT_TYPE):
+    from faucet import run_cycle, format_report
+
     try:
         if Settings.FAUCET_ENABLED and Settings.FAUCET_ENDPOINTS:
-            results = run_cycle(Settings.FAUCET_ENDPOINTS, proxy=None)
+            results = await offloader.run(
+                run_cycle, Settings.FAUCET_ENDPOINTS, proxy=None, timeout=Settings.FAUCET_TIMEOUT, cancellable=True
+            )
             await context.bot.send_message(Settings.TELEGRAM_CHAT_ID, format_report(results))
     except Exception as e:
         log.warning("job_faucet error: %s", e)
+        raise
 
 # ============ App bootstrap ============
-def main():
-    application = (
-        Application.builder()
-        .token(Settings.BOT_TOKEN)
-        .rate_limiter(AIORateLimiter(max_retries=2))
-        .build()
-    )
+COMMANDS = [
+    ("start", cmd_start),
+    ("stop", cmd_stop),
+    ("help", cmd_help),
+    ("airdrop", cmd_airdrop),
+    ("airdrop_random", cmd_airdrop_random),
+    ("prices", cmd_prices),
+    ("spread_top", cmd_spread_top),
+    ("chart", cmd_chart),
+    ("watch", cmd_watch),
+    ("unwatch", cmd_unwatch),
+    ("faucet", cmd_faucet),
+    ("broadcast", cmd_broadcast),
+    ("ping", cmd_ping),
+    ("stats", cmd_stats),
+]
 
-    # Commands
-    application.add_handler(CommandHandler("start", cmd_start))
-    application.add_handler(CommandHandler("help", cmd_help))
-    application.add_handler(CommandHandler("airdrop", cmd_airdrop))
-    application.add_handler(CommandHandler("airdrop_random", cmd_airdrop_random))
-    application.add_handler(CommandHandler("prices", cmd_prices))
-    application.add_handler(CommandHandler("faucet", cmd_faucet))
-    application.add_handler(CommandHandler("broadcast", cmd_broadcast))
-    application.add_handler(CommandHandler("ping", cmd_ping))
+# Token tiêu tốn mỗi lần gọi (mặc định 1): lệnh gọi upstream / offload nặng hơn quick reply
+COSTS = {"prices": 3, "spread_top": 5, "chart": 2, "airdrop": 2, "airdrop_random": 2}
 
-    # Text messages (quick replies)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_message))
+metrics_server = None   # server /metrics riêng (khi không dùng chung server webhook)
+
+def _metrics_on_webhook() -> bool:
+    return Settings.BOT_MODE == "webhook" and Settings.METRICS_PORT == Settings.WEBHOOK_PORT
+
+def _webhook_metrics_routes():
+    """Dùng chung listener public với webhook -> /metrics cần Bearer WEBHOOK_SECRET (bearer_token của Prometheus)."""
+    if not _metrics_on_webhook():
+        return None
+    from webhook import require_bearer
+
+    if not Settings.WEBHOOK_SECRET:
+        log.warning("METRICS_PORT == WEBHOOK_PORT but WEBHOOK_SECRET is empty: /metrics disabled")
+    return {("GET", "/metrics"): require_bearer(Settings.WEBHOOK_SECRET, metrics.prometheus_handler)}
+
+async def on_startup(application: Application):
+    global metrics_server
+    if price_stream:
+        price_stream.start()
+    if Settings.INLINE_ENABLED:
+        application.create_task(get_inline_index().refresh(offloader))
+    if Settings.METRICS_PORT > 0 and not _metrics_on_webhook():
+        from webhook import MiniHTTPServer
+        metrics_server = MiniHTTPServer(Settings.METRICS_LISTEN, Settings.METRICS_PORT)
+        metrics_server.route("GET", "/metrics", metrics.prometheus_handler)
+        await metrics_server.start()
+
+async def on_shutdown(application: Application):
+    if metrics_server:
+        await metrics_server.stop()
+    if price_stream:
+        await price_stream.stop()
+    if "acrypto" in sys.modules:        # chưa từng gọi giá thì không có client để đóng
+        await sys.modules["acrypto"].aclose()
+    if alert_book:
+        alert_book.close()
+    if tsdb:
+        tsdb.close()
+    if broadcaster:
+        await broadcaster.stop()        # ghi phần đã gửi, đợt dở được nhận lại ở lần chạy sau
+    if subscribers:
+        subscribers.close()
+    offloader.shutdown()
+
+def register_handlers(application: Application) -> None:
+    """
+    Commands + quick reply + error hook; mọi handler đều được đo latency.
+    LOAD_SHEDDING: giới hạn theo user/chat, việc của mỗi chat xếp hàng có giới hạn (shedding.py).
+    """
+    shedder = None
+    if Settings.LOAD_SHEDDING:
+        from shedding import Shedder
+
+        shedder = Shedder(
+            Settings.RATE_USER_PER_MIN, Settings.RATE_USER_BURST,
+            Settings.RATE_CHAT_PER_MIN, Settings.RATE_CHAT_BURST,
+            queue_max=Settings.CHAT_QUEUE_MAX, notice_sec=Settings.SLOW_DOWN_NOTICE_SEC,
+            exempt=Settings.ADMIN_IDS,
+        )
+
+    def wrap(name, fn, wants=None):
+        fn = metrics.instrument("handler", name, fn)
+        return shedder.guard(fn, COSTS.get(name, 1), wants) if shedder else fn
 
-    # Error hook
+    for name, fn in COMMANDS:
+        application.add_handler(CommandHandler(name, wrap(name, fn)))
+    # Text messages (quick replies)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, wrap("message", on_message, wants_reply)))
+    if Settings.INLINE_ENABLED:
+        # Không qua shedder: inline gửi theo từng phím gõ nhưng chỉ tra RAM, Telegram cũng tự cache
+        application.add_handler(InlineQueryHandler(metrics.instrument("handler", "inline", on_inline)))
     application.add_error_handler(on_error)
 
-    # JobQueue: lịch chạy tự động
+def schedule_jobs(application: Application, sched: Scheduler) -> None:
+    """
+    Job không chạy chồng: skip = bỏ tick trùng, coalesce = chạy bù đúng 1 lần.
+    Lịch nối tiếp lần chạy trước restart (state.db), lần đầu có jitter.
+    """
     jq = application.job_queue
-    # Giá crypto: mỗi 30 phút
-    jq.run_repeating(job_prices, interval=timedelta(minutes=30), first=10)
+
+    def every(fn, interval, first, policy="skip"):
+        name = fn.__name__.removeprefix("job_")
+        sched.every(jq, name, metrics.instrument("job", name, fn), interval, first=first, policy=policy)
+
+    # Giá crypto: poll theo PRICE_POLL_MIN, chỉ gửi khi vượt ngưỡng ALERT_UP/DOWN_PCT
+    if price_stream:
+        # Streaming: giá đã có sẵn trong RAM -> xét ngưỡng dày, không tốn request
+        every(job_prices, max(1, Settings.PRICE_STREAM_TICK_SEC), first=10, policy="coalesce")
+    else:
+        every(job_prices, timedelta(minutes=max(1, Settings.PRICE_POLL_MIN)), first=10, policy="coalesce")
+    # Symbol index: kiểm tra mỗi giờ, chỉ tải lại khi quá SYMBOL_REFRESH_HOURS
+    every(job_symbols, timedelta(hours=1), first=5)
+    # Lịch sử giá: nén tầng 1m/1h/1d + retention
+    if Settings.TSDB_DIR:
+        every(job_tsdb, timedelta(minutes=max(1, Settings.TSDB_COMPACT_MIN)), first=120)
+    # Broadcast dở dang (restart giữa chừng): nhận lại và gửi tiếp
+    every(job_broadcast, timedelta(minutes=1), first=15)
     # Airdrop ngẫu nhiên: mỗi 90 phút
-    jq.run_repeating(job_airdrop, interval=timedelta(minutes=90), first=30)
+    every(job_airdrop, timedelta(minutes=90), first=30)
     # Faucet (nếu bật): theo cấu hình phút
     if Settings.FAUCET_ENABLED and Settings.FAUCET_ENDPOINTS:
-        jq.run_repeating(job_faucet, interval=timedelta(minutes=max(5, Settings.FAUCET_INTERVAL_MIN)), first=60)
+        every(job_faucet, timedelta(minutes=max(5, Settings.FAUCET_INTERVAL_MIN)), first=60)
+
+def build_application(jobs: bool = True, rate_limiter: bool = True) -> Application:
+    from scheduler import Scheduler
+
+    builder = Application.builder().token(Settings.BOT_TOKEN).post_init(on_startup).post_shutdown(on_shutdown)
+    if Settings.TELEGRAM_API_URL:
+        builder = builder.base_url(Settings.TELEGRAM_API_URL)
+    if rate_limiter:
+        builder = builder.rate_limiter(AIORateLimiter(max_retries=2))
+    application = builder.build()
+    register_handlers(application)
+    # JobQueue: lịch chạy tự động
+    if jobs:
+        schedule_jobs(application, Scheduler(Settings.STATE_DB, max_jitter=Settings.JOB_JITTER_SEC, db=offloader.run))
+    return application
+
+def main():
+    if Settings.SHARD_WORKERS > 1:
+        from shard import run_sharded
+        ensure_core_env()
+        log.info("Bot starting (%d shard workers)…", Settings.SHARD_WORKERS)
+        run_sharded(Settings.SHARD_WORKERS)
+        return
+
+    bootstrap()
+    application = build_application()
+
+    if Settings.BOT_MODE == "webhook":
+        from webhook import run_webhook
+        log.info("Bot starting (webhook)…")
+        asyncio.run(run_webhook(
+            application,
+            listen=Settings.WEBHOOK_LISTEN,
+            port=Settings.WEBHOOK_PORT,
+            path=Settings.WEBHOOK_PATH,
+            secret=Settings.WEBHOOK_SECRET,
+            public_url=Settings.WEBHOOK_URL,
+            extra_routes=_webhook_metrics_routes(),
+        ))
+        return
 
     log.info("Bot starting…")
     application.run_polling(close_loop=False)
@@ -3,7 +3,336 @@ from __future__ import annotations
 import json
 import os
 import random
-from typing import Dict, Any, List, Optional, Iterable
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Sequence, Tuple
+
+import storage
+from matcher import KeywordMatcher, build_matcher, load_keywords_file
+
+STATUSES = {"open", "closed", "upcoming"}
+
+def _norm(value: Any) -> str:
+    return str(value or "").strip().lower()
+
+class AirdropCatalog:
+    """
+    Danh sách airdrop trong RAM, chỉ đọc lại file khi mtime/size thay đổi.
+    Index sẵn theo status / network / tag (đã chuẩn hoá lowercase) -> lọc bằng tra dict.
+    `version` tăng mỗi lần nạp lại, dùng làm khoá cho các cache phía sau.
+    """
+
+    def __init__(self, path: str = "airdrops.json"):
+        self.path = path
+        self.version = 0
+        self.items: List[Dict[str, Any]] = []
+        self.by_status: Dict[str, List[int]] = {}
+        self.by_network: Dict[str, List[int]] = {}
+        self.by_tag: Dict[str, List[int]] = {}
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                if isinstance(data, list):
+                    return [x for x in data if isinstance(x, dict)]
+                return []
+        except Exception as e:
+            print(f"[marketing] Lỗi load {self.path}: {e}")
+            return []
+
+    def _index(self, items: List[Dict[str, Any]]) -> None:
+        by_status: Dict[str, List[int]] = {}
+        by_network: Dict[str, List[int]] = {}
+        by_tag: Dict[str, List[int]] = {}
+        for i, it in enumerate(items):
+            by_status.setdefault(_norm(it.get("status")), []).append(i)
+            by_network.setdefault(_norm(it.get("network")), []).append(i)
+            for tag in {_norm(t) for t in (it.get("tags") or [])}:
+                by_tag.setdefault(tag, []).append(i)
+        self.items, self.by_status, self.by_network, self.by_tag = items, by_status, by_network, by_tag
+        self.version += 1
+
+    def refresh(self) -> bool:
+        """Nạp lại nếu file đổi (mtime/size). Trả về True nếu có nạp lại."""
+        try:
+            st = os.stat(self.path)
+            stamp: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return False
+        with self._lock:
+            if stamp == self._stamp:
+                return False
+            self._index(self._read() if stamp else [])
+            self._stamp = stamp
+        return True
+
+    def query(
+        self,
+        status: Optional[str] = None,
+        network: Optional[str] = None,
+        tag: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        items = self.items
+        return [items[i] for i in self.query_ids(status, network, tag)]
+
+    def query_ids(
+        self,
+        status: Optional[str] = None,
+        network: Optional[str] = None,
+        tag: Optional[str] = None,
+    ) -> List[int]:
+        """Như query() nhưng trả về vị trí trong `items` (dùng cho cache fragment theo version)."""
+        self.refresh()
+        picks: Optional[List[int]] = None
+        for idx, key in ((self.by_status, status), (self.by_network, network), (self.by_tag, tag)):
+            if not key:
+                continue
+            hit = idx.get(_norm(key), [])
+            if picks is None:
+                picks = hit
+            else:
+                keep = set(hit)
+                picks = [i for i in picks if i in keep]
+            if not picks:
+                return []
+        if picks is None:
+            return list(range(len(self.items)))
+        return list(picks)
+
+    def count(self) -> int:
+        self.refresh()
+        return len(self.items)
+
+    def page(
+        self,
+        status: Optional[str] = None,
+        network: Optional[str] = None,
+        tag: Optional[str] = None,
+        page: int = 1,
+        size: int = 8,
+    ) -> Tuple[List[Tuple[int, Dict[str, Any]]], bool]:
+        ids = self.query_ids(status, network, tag)
+        start = (max(1, page) - 1) * size
+        return [(i, self.items[i]) for i in ids[start:start + size]], start + size < len(ids)
+
+    def iter_rows(
+        self, status: Optional[str] = None, network: Optional[str] = None, tag: Optional[str] = None, size: int = 500
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(vị trí, item) theo thứ tự file. `size` chỉ để cùng chữ ký với AirdropStore."""
+        ids = self.query_ids(status, network, tag)
+        items = self.items
+        for i in ids:
+            yield i, items[i]
+
+    def random(
+        self, status: Optional[str] = None, network: Optional[str] = None
+    ) -> Optional[Tuple[int, Dict[str, Any]]]:
+        ids = self.query_ids(status, network)
+        if not ids:
+            return None
+        i = random.choice(ids)
+        return i, self.items[i]
+
+class AirdropStore:
+    """
+    Backend SQLite cho catalog lớn (hàng chục nghìn airdrop), RAM không đổi theo kích thước:
+      - cột status / network chuẩn hoá + bảng tag, đều có index (…, id)
+      - import dạng stream từ airdrops.json (array) hoặc JSONL, ghi theo lô
+      - phân trang keyset (id > cursor) thay vì OFFSET trên cả bảng
+    Cùng interface với AirdropCatalog: refresh / version / count / page / random / iter_rows.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS airdrops(
+        id      INTEGER PRIMARY KEY,
+        status  TEXT NOT NULL,
+        network TEXT NOT NULL,
+        data    TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_airdrops_status ON airdrops(status, id);
+    CREATE INDEX IF NOT EXISTS ix_airdrops_network ON airdrops(network, id);
+    CREATE INDEX IF NOT EXISTS ix_airdrops_status_network ON airdrops(status, network, id);
+    CREATE TABLE IF NOT EXISTS airdrop_tags(
+        tag        TEXT NOT NULL,
+        airdrop_id INTEGER NOT NULL,
+        PRIMARY KEY(tag, airdrop_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS airdrop_meta(key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, db_path: str, source: Optional[str] = "airdrops.json", batch_size: int = 1000):
+        self.db_path = db_path
+        self.source = source
+        self.batch_size = batch_size
+        self.conn = storage.connect(db_path)
+        self.conn.executescript(self._SCHEMA)
+        self.version = int(self._meta("version") or 0)
+        self._cursors: Dict[Tuple, int] = {}     # (filter, size, version, page) -> id cuối trang trước
+        self._lock = threading.Lock()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM airdrop_meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    # ====== Import ======
+    def import_items(self, items: Iterable[Dict[str, Any]], stamp: str = "") -> int:
+        """Thay toàn bộ nội dung bằng `items` (iterable, đọc dần), trong 1 transaction."""
+        n = 0
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM airdrops")
+                conn.execute("DELETE FROM airdrop_tags")
+                rows: List[Tuple] = []
+                tags: List[Tuple] = []
+                for it in items:
+                    n += 1
+                    rows.append((n, _norm(it.get("status")), _norm(it.get("network")),
+                                 json.dumps(it, ensure_ascii=False)))
+                    tags.extend((t, n) for t in {_norm(x) for x in (it.get("tags") or [])} if t)
+                    if len(rows) >= self.batch_size:
+                        conn.executemany("INSERT INTO airdrops VALUES (?,?,?,?)", rows)
+                        conn.executemany("INSERT OR IGNORE INTO airdrop_tags VALUES (?,?)", tags)
+                        rows, tags = [], []
+                conn.executemany("INSERT INTO airdrops VALUES (?,?,?,?)", rows)
+                conn.executemany("INSERT OR IGNORE INTO airdrop_tags VALUES (?,?)", tags)
+                version = int(self._meta("version") or 0) + 1
+                conn.executemany(
+                    "INSERT OR REPLACE INTO airdrop_meta VALUES (?,?)",
+                    [("version", str(version)), ("count", str(n)), ("source_stamp", stamp)],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.version = version
+            self._cursors.clear()
+        return n
+
+    def refresh(self) -> bool:
+        """Import lại nếu file nguồn đổi; đồng bộ version nếu process khác vừa import."""
+        changed = False
+        if self.source:
+            try:
+                st = os.stat(self.source)
+                stamp = f"{st.st_mtime_ns}:{st.st_size}"
+            except OSError:
+                stamp = ""
+            if stamp and stamp != self._meta("source_stamp"):
+                try:
+                    self.import_items(storage.iter_json_items(self.source), stamp)
+                    changed = True
+                except Exception as e:
+                    print(f"[marketing] Lỗi import {self.source}: {e}")
+        version = int(self._meta("version") or 0)
+        if version != self.version:
+            with self._lock:
+                self.version = version
+                self._cursors.clear()
+            changed = True
+        return changed
+
+    def count(self) -> int:
+        self.refresh()
+        return int(self._meta("count") or 0)
+
+    # ====== Truy vấn ======
+    @staticmethod
+    def _where(status: Optional[str], network: Optional[str], tag: Optional[str]) -> Tuple[str, List[Any]]:
+        join, clauses, params = "", ["1=1"], []
+        if tag:
+            join = "JOIN airdrop_tags t ON t.airdrop_id = a.id AND t.tag = ?"
+            params.append(_norm(tag))
+        if status:
+            clauses.append("a.status = ?")
+            params.append(_norm(status))
+        if network:
+            clauses.append("a.network = ?")
+            params.append(_norm(network))
+        return f"FROM airdrops a {join} WHERE {' AND '.join(clauses)}", params
+
+    def _after_id(self, fkey: Tuple, where: str, params: List[Any], page: int, size: int) -> Optional[int]:
+        """id cuối của trang (page-1): dùng cursor đã biết gần nhất rồi nhảy bằng index (chỉ đọc id)."""
+        if page <= 1:
+            return 0
+        base_page, after = 1, 0
+        for p in range(page, 1, -1):
+            hit = self._cursors.get((fkey, size, self.version, p))
+            if hit is not None:
+                if p == page:
+                    return hit
+                base_page, after = p, hit
+                break
+        row = self.conn.execute(
+            f"SELECT a.id {where} AND a.id > ? ORDER BY a.id LIMIT 1 OFFSET ?",
+            (*params, after, (page - base_page) * size - 1),
+        ).fetchone()
+        return row[0] if row else None
+
+    def page(
+        self,
+        status: Optional[str] = None,
+        network: Optional[str] = None,
+        tag: Optional[str] = None,
+        page: int = 1,
+        size: int = 8,
+    ) -> Tuple[List[Tuple[int, Dict[str, Any]]], bool]:
+        self.refresh()
+        page = max(1, page)
+        where, params = self._where(status, network, tag)
+        fkey = (_norm(status), _norm(network), _norm(tag))
+        after = self._after_id(fkey, where, params, page, size)
+        if after is None:
+            return [], False
+        rows = self.conn.execute(
+            f"SELECT a.id, a.data {where} AND a.id > ? ORDER BY a.id LIMIT ?",
+            (*params, after, size + 1),
+        ).fetchall()
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if rows:
+            if len(self._cursors) > 4096:
+                self._cursors.clear()
+            self._cursors[(fkey, size, self.version, page)] = after
+            self._cursors[(fkey, size, self.version, page + 1)] = rows[-1][0]
+        return [(r[0], json.loads(r[1])) for r in rows], has_more
+
+    def random(
+        self, status: Optional[str] = None, network: Optional[str] = None
+    ) -> Optional[Tuple[int, Dict[str, Any]]]:
+        self.refresh()
+        where, params = self._where(status, network, None)
+        lo, hi = self.conn.execute(f"SELECT MIN(a.id), MAX(a.id) {where}", params).fetchone()
+        if lo is None:
+            return None
+        row = self.conn.execute(
+            f"SELECT a.id, a.data {where} AND a.id >= ? ORDER BY a.id LIMIT 1",
+            (*params, random.randint(lo, hi)),
+        ).fetchone()
+        return row[0], json.loads(row[1])
+
+    def iter_rows(
+        self, status: Optional[str] = None, network: Optional[str] = None, tag: Optional[str] = None, size: int = 500
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(id, item) theo id, đọc từng trang keyset (id > cursor): RAM chỉ giữ 1 trang dù catalog lớn."""
+        self.refresh()
+        where, params = self._where(status, network, tag)
+        after = 0
+        while True:
+            rows = self.conn.execute(
+                f"SELECT a.id, a.data {where} AND a.id > ? ORDER BY a.id LIMIT ?", (*params, after, size)
+            ).fetchall()
+            for key, data in rows:
+                yield key, json.loads(data)
+            if len(rows) < size:
+                return
+            after = rows[-1][0]
 
 class Marketing:
     """
@@ -15,9 +344,41 @@ class Marketing:
       - Build nội dung chiến dịch dạng bullet
     """
 
-    def __init__(self, lp_url: str, keywords: Dict[str, str]):
+    def __init__(
+        self,
+        lp_url: str,
+        keywords: Dict[str, str],
+        airdrops_path: str = "airdrops.json",
+        render_cache_size: int = 128,
+        keywords_file: str = "",
+        word_boundary: bool = False,
+        backend: str = "json",
+        db_path: str = "data/airdrops.db",
+    ):
         self.lp_url = lp_url
         self.keywords = keywords
+        extra = []
+        if keywords_file:
+            try:
+                extra = load_keywords_file(keywords_file)
+            except Exception as e:
+                print(f"[marketing] Lỗi load {keywords_file}: {e}")
+        # Build 1 lần: chi phí match theo độ dài tin nhắn, không theo số từ khoá
+        self.matcher: KeywordMatcher = build_matcher(keywords, extra, word_boundary=word_boundary)
+        self.catalog = (
+            AirdropStore(db_path, source=airdrops_path) if backend == "sqlite"
+            else AirdropCatalog(airdrops_path)
+        )
+        # Cache message đã render: (bộ lọc, limit, page, catalog.version) -> HTML (LRU)
+        self.render_cache_size = max(1, render_cache_size)
+        self._rendered: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._frag_version = -1
+        # Fragment HTML từng item (list, card), render 1 lần / version, LRU để RAM có trần
+        self._frags: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()
+        self._frags_max = 10000
+        self.render_hits = 0
+        self.render_misses = 0
+        self._render_lock = threading.Lock()
 
     # ====== CTA ======
     def cta(self) -> str:
@@ -25,25 +386,55 @@ class Marketing:
 
     # ====== Quick reply theo từ khoá ======
     def quick_reply(self, text: str) -> Optional[str]:
-        t = (text or "").lower().strip()
-        for k, v in self.keywords.items():
-            if k in t:
-                return f"{v}\n{self.cta()}"
+        v = self.matcher.match(text or "")
+        if v is not None:
+            return f"{v}\n{self.cta()}"
         return None
 
     # ====== Airdrops ======
-    def load_airdrops(self, path: str = "airdrops.json") -> List[Dict[str, Any]]:
-        if not os.path.exists(path):
-            return []
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    return data
-                return []
-        except Exception as e:
-            print(f"[marketing] Lỗi load {path}: {e}")
-            return []
+    def load_airdrops(self, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Cả danh sách trong RAM: chỉ cho backend json (sqlite dùng catalog.page / catalog.iter_rows)."""
+        if path and path != getattr(self.catalog, "path", getattr(self.catalog, "source", None)):
+            return AirdropCatalog(path).query()
+        if isinstance(self.catalog, AirdropStore):
+            raise TypeError("load_airdrops() không dùng được với backend sqlite, hãy duyệt catalog.iter_rows()")
+        self.catalog.refresh()
+        return self.catalog.items
+
+    @staticmethod
+    def parse_filters(args: Iterable[str]) -> Dict[str, Any]:
+        """
+        Tham số lệnh /airdrop: số = trang, open/closed/upcoming/all = status, #tag = tag, còn lại = network.
+        Vd: /airdrop 2 | /airdrop ton | /airdrop ton #daily 3 | /airdrop upcoming
+        """
+        out: Dict[str, Any] = {"status": "open", "network": None, "tag": None, "page": 1}
+        for a in args:
+            a = a.strip()
+            if not a:
+                continue
+            if a.isdigit():
+                out["page"] = max(1, int(a))
+            elif a.lower() in STATUSES:
+                out["status"] = a.lower()
+            elif a.lower() == "all":
+                out["status"] = None
+            elif a.startswith("#") and len(a) > 1:
+                out["tag"] = a[1:]
+            else:
+                out["network"] = a
+        return out
+
+    @staticmethod
+    def _next_cmd(status: Optional[str], network: Optional[str], tag: Optional[str], page: int) -> str:
+        parts = ["/airdrop"]
+        if _norm(status) != "open":
+            parts.append(_norm(status) or "all")
+        if network:
+            parts.append(_norm(network))
+        if tag:
+            parts.append(f"#{_norm(tag)}")
+        parts.append(str(page))
+        return " ".join(parts)
 
     @staticmethod
     def _filter(items: Iterable[Dict[str, Any]], status: Optional[str], network: Optional[str]) -> List[Dict[str, Any]]:
@@ -58,75 +449,170 @@ class Marketing:
                 out.append(it)
         return out
 
+    @staticmethod
+    def _item_html(it: Dict[str, Any]) -> str:
+        name    = it.get("name", "?")
+        desc    = it.get("desc", "")
+        link    = it.get("link", "")
+        reward  = it.get("reward", "N/A")
+        net     = it.get("network", "N/A")
+        stat    = it.get("status", "unknown")
+        tags    = ", ".join(it.get("tags", []))
+        return (
+            f"<b>{name}</b> – {desc}\n"
+            f"🎁 Phần thưởng: {reward}\n"
+            f"🌐 Network: {net}\n"
+            f"📌 Trạng thái: {stat}\n"
+            f"🏷 Tags: {tags}\n"
+            f"🔗 {link}\n"
+        )
+
+    def _card_html(self, it: Dict[str, Any]) -> str:
+        name    = it.get("name", "?")
+        desc    = it.get("desc", "")
+        link    = it.get("link", "")
+        reward  = it.get("reward", "N/A")
+        net     = it.get("network", "N/A")
+        stat    = it.get("status", "unknown")
+        tags    = ", ".join(it.get("tags", []))
+        return (
+            f"🚀 <b>{name}</b>\n"
+            f"{desc}\n"
+            f"🎁 {reward} | 🌐 {net} | 📌 {stat}\n"
+            f"🏷 {tags}\n"
+            f"🔗 {link}\n\n{self.cta()}"
+        )
+
+    def _sync_fragments(self) -> int:
+        """Đổi version catalog -> bỏ fragment + message đã render của version cũ."""
+        self.catalog.refresh()
+        version = self.catalog.version
+        if version != self._frag_version:
+            self._frags.clear()
+            self._rendered.clear()
+            self._frag_version = version
+        return version
+
+    def _fragment(self, key: int, it: Dict[str, Any]) -> Tuple[str, str]:
+        frag = self._frags.get(key)
+        if frag is None:
+            frag = self._frags[key] = (self._item_html(it), self._card_html(it))
+            if len(self._frags) > self._frags_max:
+                self._frags.popitem(last=False)
+        else:
+            self._frags.move_to_end(key)
+        return frag
+
+    @staticmethod
+    def _render_list(frags: Iterable[str], cta: str, start: int = 1, footer: str = "") -> str:
+        lines = ["🔥 Danh sách Airdrop HOT:"]
+        lines.extend(f"{i}. {frag}" for i, frag in enumerate(frags, start))
+        if footer:
+            lines.append(footer)
+        lines.append(cta)
+        return "\n".join(lines)
+
     def format_airdrops(
         self,
-        items: List[Dict[str, Any]],
+        items: Optional[List[Dict[str, Any]]] = None,
         status: Optional[str] = "open",
         network: Optional[str] = None,
         limit: Optional[int] = None,
+        page: int = 1,
+        tag: Optional[str] = None,
     ) -> str:
         """
         Hiển thị danh sách airdrop:
           - status: lọc theo 'open'/'closed'/'upcoming' (mặc định 'open')
           - network: 'ton' / 'bsc' / 'eth' ... (nếu có)
-          - limit: giới hạn số dòng hiển thị
+          - limit: giới hạn số dòng hiển thị (= kích thước trang)
+          - page / tag: phân trang + lọc theo tag (chỉ khi dùng catalog)
+        items=None -> dùng catalog (lọc bằng index) + cache message đã render
         """
-        if not items:
-            return "Hiện chưa có airdrop nào."
+        if items is not None:
+            if not items:
+                return "Hiện chưa có airdrop nào."
+            items = self._filter(items, status=status, network=network)
+            if not items:
+                return "Không có airdrop phù hợp bộ lọc."
+            if limit:
+                items = items[:limit]
+            return self._render_list((self._item_html(it) for it in items), self.cta())
 
-        items = self._filter(items, status=status, network=network)
-        if not items:
-            return "Không có airdrop phù hợp bộ lọc."
+        with self._render_lock:
+            version = self._sync_fragments()
+            page = max(1, page)
+            key = (_norm(status), _norm(network), _norm(tag), limit or 0, page, version)
+            text = self._rendered.get(key)
+            if text is not None:
+                self.render_hits += 1
+                self._rendered.move_to_end(key)
+                return text
 
-        if limit:
-            items = items[:limit]
+            self.render_misses += 1
+            total = self.catalog.count()
+            size = limit or max(1, total)
+            rows, has_more = self.catalog.page(status, network, tag, page, size) if total else ([], False)
+            if not total:
+                text = "Hiện chưa có airdrop nào."
+            elif not rows:
+                text = "Không có airdrop phù hợp bộ lọc." if page == 1 else f"Trang {page} không có airdrop nào."
+            else:
+                footer = ""
+                if page > 1 or has_more:
+                    footer = f"📄 Trang {page}"
+                    if has_more:
+                        footer += f" – xem tiếp: {self._next_cmd(status, network, tag, page + 1)}"
+                    footer += "\n"
+                frags = (self._fragment(k, it)[0] for k, it in rows)
+                text = self._render_list(frags, self.cta(), (page - 1) * size + 1, footer)
 
-        lines = ["🔥 Danh sách Airdrop HOT:"]
-        for i, it in enumerate(items, 1):
-            name    = it.get("name", "?")
-            desc    = it.get("desc", "")
-            link    = it.get("link", "")
-            reward  = it.get("reward", "N/A")
-            net     = it.get("network", "N/A")
-            stat    = it.get("status", "unknown")
-            tags    = ", ".join(it.get("tags", []))
-
-            lines.append(
-                f"{i}. <b>{name}</b> – {desc}\n"
-                f"🎁 Phần thưởng: {reward}\n"
-                f"🌐 Network: {net}\n"
-                f"📌 Trạng thái: {stat}\n"
-                f"🏷 Tags: {tags}\n"
-                f"🔗 {link}\n"
-            )
-        lines.append(self.cta())
-        return "\n".join(lines)
+            self._rendered[key] = text
+            while len(self._rendered) > self.render_cache_size:
+                self._rendered.popitem(last=False)
+            return text
 
     def random_airdrop(
         self,
-        items: List[Dict[str, Any]],
+        items: Optional[List[Dict[str, Any]]] = None,
         status: Optional[str] = "open",
         network: Optional[str] = None,
     ) -> str:
-        if not items:
-            return "Không có airdrop nào."
-        filtered = self._filter(items, status=status, network=network) or items
-        it = random.choice(filtered)
-        name    = it.get("name", "?")
-        desc    = it.get("desc", "")
-        link    = it.get("link", "")
-        reward  = it.get("reward", "N/A")
-        net     = it.get("network", "N/A")
-        stat    = it.get("status", "unknown")
-        tags    = ", ".join(it.get("tags", []))
+        if items is not None:
+            if not items:
+                return "Không có airdrop nào."
+            filtered = self._filter(items, status=status, network=network) or items
+            return self._card_html(random.choice(filtered))
 
-        return (
-            f"🚀 <b>{name}</b>\n"
-            f"{desc}\n"
-            f"🎁 {reward} | 🌐 {net} | 📌 {stat}\n"
-            f"🏷 {tags}\n"
-            f"🔗 {link}\n\n{self.cta()}"
-        )
+        with self._render_lock:
+            self._sync_fragments()
+            hit = self.catalog.random(status, network) or self.catalog.random()
+            if hit is None:
+                return "Không có airdrop nào."
+            return self._fragment(*hit)[1]
+
+    def catalog_cards(
+        self, known_version: int = -1, statuses: Sequence[Optional[str]] = (None,), limit: int = 0
+    ) -> Optional[Tuple[int, Iterator[Tuple[int, Dict[str, Any], str]]]]:
+        """
+        (version, iterator (key, item, card HTML)) để dựng sẵn index inline: đọc dần theo trang,
+        lần lượt từng status trong `statuses` (None = tất cả), dừng ở `limit` item (0 = không giới hạn).
+        None nếu catalog vẫn là `known_version` (không cần dựng lại).
+        """
+        with self._render_lock:
+            version = self._sync_fragments()
+        if version == known_version:
+            return None
+        return version, self._iter_cards(statuses, limit)
+
+    def _iter_cards(self, statuses: Sequence[Optional[str]], limit: int) -> Iterator[Tuple[int, Dict[str, Any], str]]:
+        n = 0
+        for status in statuses:
+            for key, it in self.catalog.iter_rows(status):
+                yield key, it, self._card_html(it)
+                n += 1
+                if limit and n >= limit:
+                    return
 
     # ====== Builder chiến dịch ======
     def build_campaign(self, title: str, bullet_points: List[str]) -> str:
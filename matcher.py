@@ -0,0 +1,170 @@
+# matcher.py
+"""
+So khớp nhiều từ khoá cùng lúc (Aho–Corasick), build 1 lần, dùng cho quick_reply:
+  - chi phí theo độ dài tin nhắn, không theo số từ khoá
+  - chuẩn hoá Unicode: bỏ dấu (giá == gia), casefold, đ -> d
+  - tuỳ chọn khớp nguyên từ (word boundary) cho từng từ khoá
+  - nhiều từ khoá cùng khớp -> chọn theo priority (nhỏ thắng), rồi dài hơn, rồi xuất hiện trước
+"""
+from __future__ import annotations
+import json
+import re
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Generic, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+_COMBINING = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+_FOLD = str.maketrans({"đ": "d", "Đ": "d", "ø": "o", "ß": "ss", "ł": "l"})
+
+def normalize(text: str) -> str:
+    """Bỏ dấu + casefold. Mọi so khớp (kể cả word boundary) đều chạy trên chuỗi đã chuẩn hoá."""
+    if text.isascii():
+        return text.lower()
+    return _COMBINING.sub("", unicodedata.normalize("NFKD", text.translate(_FOLD))).casefold()
+
+class Match(NamedTuple):
+    start: int
+    end: int
+    keyword: str
+    value: Any
+    priority: int
+
+class _Pattern(NamedTuple):
+    keyword: str
+    value: Any
+    priority: int
+    word_boundary: bool
+    length: int
+
+class KeywordMatcher(Generic[V]):
+    def __init__(self, word_boundary: bool = False):
+        self.word_boundary = word_boundary
+        self._patterns: List[_Pattern] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._own: List[Tuple[int, ...]] = [()]    # pattern kết thúc đúng tại node
+        self._out: List[Tuple[int, ...]] = [()]    # own + output của chuỗi fail (sau compile)
+        self._compiled = True
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def add(
+        self,
+        keyword: str,
+        value: V,
+        priority: Optional[int] = None,
+        word_boundary: Optional[bool] = None,
+    ) -> "KeywordMatcher[V]":
+        kw = normalize(keyword).strip()
+        if not kw:
+            return self
+        pid = len(self._patterns)
+        self._patterns.append(_Pattern(
+            keyword,
+            value,
+            pid if priority is None else priority,
+            self.word_boundary if word_boundary is None else word_boundary,
+            len(kw),
+        ))
+        node = 0
+        for ch in kw:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append(())
+                self._out.append(())
+            node = nxt
+        self._own[node] = self._own[node] + (pid,)
+        self._compiled = False
+        return self
+
+    def compile(self) -> "KeywordMatcher[V]":
+        """Tính fail link (BFS) và gộp output theo suffix."""
+        goto, fail, own, out = self._goto, self._fail, self._own, self._out
+        q: deque = deque()
+        for nxt in goto[0].values():
+            fail[nxt] = 0
+            out[nxt] = own[nxt]
+            q.append(nxt)
+        while q:
+            node = q.popleft()
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = own[nxt] + out[fail[nxt]]
+                q.append(nxt)
+        self._compiled = True
+        return self
+
+    def finditer(self, text: str) -> Iterator[Match]:
+        if not self._compiled:
+            self.compile()
+        t = normalize(text)
+        goto, fail, out, pats = self._goto, self._fail, self._out, self._patterns
+        node = 0
+        for i, ch in enumerate(t):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                p = pats[pid]
+                start, end = i + 1 - p.length, i + 1
+                if p.word_boundary and (
+                    (start > 0 and t[start - 1].isalnum()) or (end < len(t) and t[end].isalnum())
+                ):
+                    continue
+                yield Match(start, end, p.keyword, p.value, p.priority)
+
+    def best(self, text: str) -> Optional[Match]:
+        best: Optional[Match] = None
+        for m in self.finditer(text):
+            if best is None or (m.priority, -(m.end - m.start), m.start) < (
+                best.priority, -(best.end - best.start), best.start
+            ):
+                best = m
+        return best
+
+    def match(self, text: str) -> Optional[V]:
+        m = self.best(text)
+        return m.value if m else None
+
+def load_keywords_file(path: str) -> List[Tuple[str, Any, Optional[int], Optional[bool]]]:
+    """
+    Đọc file từ khoá JSON:
+      {"kw": "reply", ...}  hoặc
+      [{"keyword": "...", "reply": "...", "priority": 0, "word": true}, ...]
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    rows: List[Tuple[str, Any, Optional[int], Optional[bool]]] = []
+    if isinstance(data, dict):
+        rows = [(k, v, None, None) for k, v in data.items()]
+    elif isinstance(data, list):
+        for d in data:
+            if isinstance(d, dict) and d.get("keyword"):
+                rows.append((d["keyword"], d.get("reply", ""), d.get("priority"), d.get("word")))
+    return rows
+
+def build_matcher(
+    keywords: Dict[str, V],
+    extra: Iterable[Tuple[str, Any, Optional[int], Optional[bool]]] = (),
+    word_boundary: bool = False,
+) -> KeywordMatcher:
+    """
+    Priority mặc định = thứ tự thêm vào (giống vòng lặp cũ: key đứng trước thắng);
+    từ khoá trong `extra` có thể tự đặt priority / word boundary.
+    """
+    m: KeywordMatcher = KeywordMatcher(word_boundary=word_boundary)
+    for k, v in keywords.items():
+        m.add(k, v)
+    for k, v, prio, wb in extra:
+        m.add(k, v, prio, wb)
+    return m.compile()
@@ -0,0 +1,175 @@
+# metrics.py
+"""
+Đo latency trong tiến trình, chi phí gần như bằng 0 trên hot path:
+  - Histogram bucket cố định (perf_counter + bisect, không lock, không cấp phát)
+  - nhóm theo (kind, name): handler / job / http
+  - đếm lỗi riêng; counter đơn giản cho sự kiện lẻ (reply lỗi, update lỗi, ...)
+  - xuất dạng text cho /stats và dạng Prometheus cho /metrics
+Ghi từ nhiều thread không khoá: có thể lệch vài đơn vị khi tranh chấp, chấp nhận được cho thống kê.
+"""
+from __future__ import annotations
+import functools
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+T = TypeVar("T")
+
+# Cận trên bucket (giây); bucket cuối = +Inf
+BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_STARTED = time.time()
+
+class Histogram:
+    __slots__ = ("counts", "count", "errors", "sum", "max")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """Ước lượng phân vị bằng nội suy tuyến tính trong bucket (giống histogram_quantile)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lo = 0.0
+        for i, c in enumerate(self.counts):
+            hi = BUCKETS[i] if i < len(BUCKETS) else self.max
+            if c and seen + c >= rank:
+                return min(lo + (hi - lo) * (rank - seen) / c, self.max)
+            seen += c
+            lo = hi
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+_HISTS: Dict[Tuple[str, str], Histogram] = {}
+_COUNTERS: Dict[str, int] = {}
+
+def histogram(kind: str, name: str) -> Histogram:
+    key = (kind, name)
+    h = _HISTS.get(key)
+    if h is None:
+        h = _HISTS.setdefault(key, Histogram())
+    return h
+
+def observe(kind: str, name: str, seconds: float, error: bool = False) -> None:
+    histogram(kind, name).observe(seconds, error)
+
+def incr(name: str, n: int = 1) -> None:
+    _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+def observe_http(url: str, seconds: float, error: bool = False) -> None:
+    """Timing của 1 lời gọi upstream, gom theo host."""
+    observe("http", urlsplit(url).netloc or url, seconds, error)
+
+@contextmanager
+def timer(kind: str, name: str) -> Iterator[None]:
+    h = histogram(kind, name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        h.observe(time.perf_counter() - t0, True)
+        raise
+    h.observe(time.perf_counter() - t0)
+
+def instrument(kind: str, name: str, fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Bọc coroutine function (handler PTB / job) để ghi latency + lỗi."""
+    h = histogram(kind, name)
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        t0 = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException:
+            h.observe(time.perf_counter() - t0, True)
+            raise
+        h.observe(time.perf_counter() - t0)
+        return result
+
+    return wrapper
+
+def reset() -> None:
+    _HISTS.clear()
+    _COUNTERS.clear()
+
+# ====== Xuất dữ liệu ======
+def snapshot() -> List[Tuple[str, str, Histogram]]:
+    return [(k, n, h) for (k, n), h in sorted(_HISTS.items())]
+
+def format_stats(kind: Optional[str] = None) -> str:
+    """Bảng text (HTML <pre>) cho lệnh /stats."""
+    uptime = int(time.time() - _STARTED)
+    lines = [f"📊 <b>Stats</b> (uptime {uptime // 3600}h{uptime % 3600 // 60:02d}m)"]
+    rows = [(k, n, h) for k, n, h in snapshot() if h.count and (kind is None or k == kind)]
+    if not rows:
+        lines.append("Chưa có dữ liệu.")
+    else:
+        body = [f"{'name':<24}{'n':>7}{'err':>5}{'p50':>7}{'p99':>7}{'max':>7}  (ms)"]
+        current = None
+        for k, n, h in rows:
+            if k != current:
+                body.append(f"[{k}]")
+                current = k
+            body.append(
+                f"{n[:24]:<24}{h.count:>7}{h.errors:>5}"
+                f"{h.quantile(0.5) * 1000:>7.0f}{h.quantile(0.99) * 1000:>7.0f}{h.max * 1000:>7.0f}"
+            )
+        lines.append("<pre>" + "\n".join(body) + "</pre>")
+    if _COUNTERS:
+        lines.append(" · ".join(f"{k}={v}" for k, v in sorted(_COUNTERS.items())))
+    return "\n".join(lines)
+
+def _label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus(prefix: str = "rotchain") -> str:
+    """Text exposition format 0.0.4."""
+    out: List[str] = []
+    hist = f"{prefix}_latency_seconds"
+    out.append(f"# HELP {hist} Latency of handlers, jobs and upstream HTTP calls.")
+    out.append(f"# TYPE {hist} histogram")
+    errs: List[str] = []
+    for kind, name, h in snapshot():
+        lbl = f'kind="{_label(kind)}",name="{_label(name)}"'
+        acc = 0
+        for i, c in enumerate(h.counts):
+            acc += c
+            le = f"{BUCKETS[i]}" if i < len(BUCKETS) else "+Inf"
+            out.append(f'{hist}_bucket{{{lbl},le="{le}"}} {acc}')
+        out.append(f"{hist}_sum{{{lbl}}} {h.sum:.6f}")
+        out.append(f"{hist}_count{{{lbl}}} {h.count}")
+        errs.append(f"{prefix}_errors_total{{{lbl}}} {h.errors}")
+    out.append(f"# HELP {prefix}_errors_total Failed handler/job/HTTP calls.")
+    out.append(f"# TYPE {prefix}_errors_total counter")
+    out.extend(errs)
+    if _COUNTERS:
+        out.append(f"# TYPE {prefix}_events_total counter")
+        for k, v in sorted(_COUNTERS.items()):
+            out.append(f'{prefix}_events_total{{event="{_label(k)}"}} {v}')
+    out.append(f"# TYPE {prefix}_uptime_seconds gauge")
+    out.append(f"{prefix}_uptime_seconds {time.time() - _STARTED:.0f}")
+    return "\n".join(out) + "\n"
+
+async def prometheus_handler(req) -> Tuple[int, str, bytes]:
+    """Route GET /metrics cho webhook.MiniHTTPServer."""
+    return 200, "text/plain; version=0.0.4", render_prometheus().encode("utf-8")
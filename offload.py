@@ -0,0 +1,165 @@
+# offload.py
+"""
+Đẩy code blocking (time.sleep, requests, SQLite, đọc file lớn) ra khỏi event loop:
+  - pool có giới hạn (thread hoặc process), tạo worker lười khi cần
+  - giới hạn số task đang chờ/chạy -> vượt thì từ chối ngay (QueueFull) thay vì dồn ứ
+  - timeout cho từng task; hết giờ hoặc handler bị huỷ -> bật cờ `cancel` để hàm tự dừng sớm
+    (task bỏ dở vẫn giữ chỗ trong giới hạn pending cho tới khi thread thật sự chạy xong)
+  - thời gian chạy được ghi vào metrics (kind="offload")
+Hàm muốn hỗ trợ huỷ thì nhận tham số `cancel: threading.Event` và kiểm tra / dùng cancel.wait() thay cho time.sleep().
+"""
+from __future__ import annotations
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+class QueueFull(Exception):
+    def __init__(self, name: str, limit: int):
+        super().__init__(f"offload queue full ({limit} pending), rejected {name}")
+        self.name = name
+        self.limit = limit
+
+class OffloadTimeout(TimeoutError):
+    def __init__(self, name: str, timeout: float):
+        super().__init__(f"{name} timed out after {timeout:g}s")
+        self.name = name
+        self.timeout = timeout
+
+class Offloader:
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_pending: int = 32,
+        kind: str = "thread",
+        default_timeout: Optional[float] = None,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"unknown pool kind: {kind}")
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.kind = kind
+        self.default_timeout = default_timeout
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._running = 0
+        self._lock = threading.Lock()       # _pending/_running đổi từ thread của pool và từ nhiều loop
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="offload")
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _call(self, fn: Callable[..., T], args: tuple, kwargs: Dict[str, Any]) -> T:
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def run(
+        self,
+        fn: Callable[..., T],
+        *args: Any,
+        timeout: Optional[float] = None,
+        cancellable: bool = False,
+        name: Optional[str] = None,
+        **kwargs: Any,
+    ) -> T:
+        """
+        Chạy fn(*args, **kwargs) trong pool và chờ kết quả.
+        cancellable=True: truyền thêm cancel=threading.Event (chỉ với pool thread).
+        """
+        name = name or getattr(fn, "__name__", "task")
+        loop = asyncio.get_running_loop()
+        # Kiểm tra + giữ chỗ trong cùng một lần lấy lock, để hai caller không cùng lọt qua giới hạn
+        with self._lock:
+            full = self._pending >= self.max_pending
+            if full:
+                self.rejected += 1
+            else:
+                self._pending += 1
+        if full:
+            metrics.incr("offload_rejected")
+            raise QueueFull(name, self.max_pending)
+
+        cancel: Optional[threading.Event] = None
+        if cancellable and self.kind == "thread":
+            cancel = threading.Event()
+            kwargs["cancel"] = cancel
+        if self.kind == "thread":
+            call = functools.partial(self._call, fn, args, kwargs)
+        else:
+            call = functools.partial(fn, *args, **kwargs)     # process: fn/args phải pickle được
+
+        timeout = self.default_timeout if timeout is None else timeout
+        t0 = time.perf_counter()
+        error = True
+        try:
+            job = self._pool().submit(call)
+        except BaseException:
+            self._release()
+            raise
+        # Giải phóng chỗ khi việc thật sự xong (hoặc bị huỷ trước khi chạy), không phải khi caller thôi chờ
+        job.add_done_callback(self._release)
+        fut = asyncio.wrap_future(job, loop=loop)
+        try:
+            if timeout:
+                result = await asyncio.wait_for(asyncio.shield(fut), timeout)
+            else:
+                result = await fut
+            error = False
+            return result
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._abandon(fut, cancel)
+            raise OffloadTimeout(name, timeout) from None
+        except asyncio.CancelledError:
+            self._abandon(fut, cancel)
+            raise
+        finally:
+            metrics.observe("offload", name, time.perf_counter() - t0, error)
+
+    def _release(self, _job: Any = None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    @staticmethod
+    def _abandon(fut: asyncio.Future, cancel: Optional[threading.Event]) -> None:
+        # Task chưa chạy thì huỷ hẳn; đang chạy thì chỉ báo cờ, kết quả bỏ đi
+        fut.cancel()
+        if cancel is not None:
+            cancel.set()
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "running": self._running,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
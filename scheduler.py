@@ -0,0 +1,152 @@
+# scheduler.py
+"""
+Lịch chạy job định kỳ trên JobQueue, an toàn khi chạy chồng và khi restart:
+  - policy "skip": tick tới khi lần trước chưa xong -> bỏ tick đó
+  - policy "coalesce": gộp mọi tick trong lúc đang chạy thành đúng 1 lần chạy bù ngay sau đó
+  - lần chạy gần nhất lưu SQLite (ghi qua `db`, không chặn event loop) -> restart thì chạy tiếp theo lịch cũ, không bắn lại từ đầu
+  - lần chạy đầu có jitter để các job không cùng lúc gọi upstream
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+import metrics
+from storage import connect
+
+log = logging.getLogger("rotchain.scheduler")
+
+POLICIES = ("skip", "coalesce")
+
+JobCallback = Callable[[Any], Awaitable[Any]]
+
+class JobState:
+    """Bảng jobs(name, last_start, last_end, last_ok, runs) trong state.db."""
+
+    def __init__(self, db_path: str):
+        self.conn = connect(db_path)
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " name TEXT PRIMARY KEY, last_start REAL, last_end REAL,"
+                " last_ok INTEGER DEFAULT 1, runs INTEGER DEFAULT 0)"
+            )
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT * FROM jobs WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def started(self, name: str, ts: float) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (name, last_start, runs) VALUES (?, ?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET last_start = excluded.last_start, runs = runs + 1",
+                (name, ts),
+            )
+
+    def finished(self, name: str, ts: float, ok: bool) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE jobs SET last_end = ?, last_ok = ? WHERE name = ?", (ts, int(ok), name))
+
+    def close(self) -> None:
+        self.conn.close()
+
+class Scheduler:
+    def __init__(
+        self,
+        db_path: str,
+        max_jitter: float = 15.0,
+        rng: Optional[random.Random] = None,
+        db: Optional[Callable[..., Awaitable[Any]]] = None,
+    ):
+        """db: chạy hàm blocking ngoài event loop (vd. offloader.run), mặc định asyncio.to_thread."""
+        self.state = JobState(db_path)
+        self._db = db or asyncio.to_thread
+        self.max_jitter = max_jitter
+        self._rng = rng or random.Random()
+        self._running: Dict[str, bool] = {}
+        self._again: Dict[str, bool] = {}
+
+    def first_delay(self, name: str, interval: float, first: float) -> float:
+        """
+        Chưa từng chạy -> `first`; đã chạy -> phần còn lại của chu kỳ tính từ lần start gần nhất
+        (quá hạn thì chạy ngay). Cộng jitter tối đa min(max_jitter, interval/4).
+        """
+        st = self.state.get(name)
+        if st and st.get("last_start"):
+            delay = max(0.0, st["last_start"] + interval - time.time())
+        else:
+            delay = first
+        return delay + self._rng.uniform(0, min(self.max_jitter, interval / 4))
+
+    def every(
+        self,
+        job_queue,
+        name: str,
+        callback: JobCallback,
+        interval: Union[float, timedelta],
+        first: float = 0,
+        policy: str = "skip",
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy: {policy}")
+        seconds = interval.total_seconds() if isinstance(interval, timedelta) else float(interval)
+        delay = self.first_delay(name, seconds, first)
+        log.info("Job %s: every %.0fs, first in %.0fs (%s)", name, seconds, delay, policy)
+        return job_queue.run_repeating(
+            self._guard(name, callback, policy),
+            interval=seconds,
+            first=delay,
+            name=name,
+            # APScheduler mặc định bỏ tick chồng (max_instances=1) kèm warning; để guard tự quyết
+            job_kwargs={"max_instances": 2, "coalesce": True, "misfire_grace_time": None},
+        )
+
+    async def _record(self, fn: Callable[..., None], *args: Any) -> None:
+        # Ghi trạng thái lỗi/quá tải thì chỉ log: không được làm job hỏng theo
+        try:
+            await self._db(fn, *args)
+        except Exception as e:
+            metrics.incr("job_state_errors")
+            log.warning("Job state write failed: %s", e)
+
+    def _guard(self, name: str, callback: JobCallback, policy: str) -> JobCallback:
+        async def run(context) -> None:
+            if self._running.get(name):
+                if policy == "coalesce":
+                    self._again[name] = True
+                    metrics.incr("job_coalesced")
+                else:
+                    metrics.incr("job_skipped")
+                    log.info("Job %s still running, tick skipped", name)
+                return
+            self._running[name] = True
+            try:
+                while True:
+                    self._again[name] = False
+                    await self._record(self.state.started, name, time.time())
+                    ok = False
+                    try:
+                        await callback(context)
+                        ok = True
+                    finally:
+                        await self._record(self.state.finished, name, time.time(), ok)
+                    if not self._again.get(name):
+                        break
+            finally:
+                self._running[name] = False
+
+        run.__name__ = getattr(callback, "__name__", name)
+        return run
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        rows = self.state.conn.execute("SELECT * FROM jobs ORDER BY name").fetchall()
+        return {r["name"]: {**dict(r), "running": bool(self._running.get(r["name"]))} for r in rows}
+
+    def close(self) -> None:
+        self.state.close()
@@ -0,0 +1,280 @@
+# shard.py
+"""
+Chạy bot trên nhiều core: 1 process front nhận update, N worker process xử lý.
+  - front chỉ nhận (long-poll getUpdates hoặc webhook), đọc chat id rồi đẩy JSON thô sang worker
+  - worker = chat_id % N -> mọi update của 1 chat luôn vào cùng worker, giữ đúng thứ tự
+  - worker dựng Application bằng main.build_application(): handler / job y như chạy 1 process
+  - job định kỳ chỉ chạy ở worker 0 (không post trùng)
+  - cache giá dùng chung qua SQLite (storage.KVCache), catalog airdrop dùng backend SQLite;
+    hạn mức upstream chia đều cho N worker
+  - hàng đợi mỗi worker có giới hạn: đầy thì bỏ update mới (đếm metrics) thay vì dồn RAM
+  - worker chết -> front tự bật lại, hàng đợi giữ nguyên
+
+Bật: SHARD_WORKERS=4 python main.py   (BOT_MODE=polling|webhook như thường)
+"""
+from __future__ import annotations
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing as mp
+import queue
+import signal
+import threading
+from typing import Any, Dict, List, Optional
+
+import metrics
+from config import Settings
+
+log = logging.getLogger("rotchain.shard")
+
+def chat_key(data: Dict[str, Any]) -> int:
+    """Chat id (hoặc user id với update không gắn chat) dùng để chia shard."""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post",
+                  "my_chat_member", "chat_member", "chat_join_request"):
+        obj = data.get(field)
+        if obj:
+            return int((obj.get("chat") or {}).get("id", 0))
+    cq = data.get("callback_query")
+    if cq:
+        msg = cq.get("message") or {}
+        if msg.get("chat"):
+            return int(msg["chat"]["id"])
+        return int((cq.get("from") or {}).get("id", 0))
+    for field in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query", "poll_answer"):
+        obj = data.get(field)
+        if obj:
+            return int((obj.get("from") or obj.get("user") or {}).get("id", 0))
+    return 0
+
+def shard_for(chat_id: int, workers: int) -> int:
+    return chat_id % workers
+
+# ====== Worker ======
+def _worker_main(index: int, workers: int, inbox) -> None:
+    """Entry point của worker process (spawn)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)      # Ctrl-C: front sẽ gửi lệnh dừng
+    logging.basicConfig(
+        format=f"%(asctime)s | %(levelname)s | w{index} %(name)s | %(message)s",
+        level=logging.INFO,
+    )
+    # Cấu hình phải xong trước khi crypto/upstream được nạp (nạp lười trong handler)
+    Settings.AIRDROP_BACKEND = "sqlite"
+    if Settings.METRICS_PORT > 0:
+        Settings.METRICS_PORT += index
+    import upstream
+    upstream.set_quota_share(workers)
+    import crypto
+    from storage import KVCache
+    crypto.PRICE_CACHE.shared = KVCache(Settings.SHARED_CACHE_DB)
+
+    import main as bot
+    bot.bootstrap()
+    application = bot.build_application(jobs=index == 0)
+    asyncio.run(_worker_loop(application, inbox, index))
+
+async def _worker_loop(application, inbox, index: int) -> None:
+    from telegram import Update
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+    except (NotImplementedError, RuntimeError):
+        pass
+
+    def deliver(raw: str) -> None:
+        try:
+            update = Update.de_json(json.loads(raw), application.bot)
+        except Exception as e:
+            log.warning("Bad update: %s", e)
+            return
+        application.update_queue.put_nowait(update)
+
+    def reader() -> None:
+        # mp.Queue.get() blocking -> chạy ở thread riêng, chuyển về event loop
+        while True:
+            raw = inbox.get()
+            if raw is None:
+                loop.call_soon_threadsafe(stop.set)
+                return
+            loop.call_soon_threadsafe(deliver, raw)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    threading.Thread(target=reader, name=f"shard-inbox-{index}", daemon=True).start()
+    log.info("Worker %d ready", index)
+    try:
+        await stop.wait()
+    finally:
+        await application.stop()            # xử lý nốt update đã nhận rồi mới dừng
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+# ====== Front ======
+class ShardDispatcher:
+    def __init__(self, workers: int, queue_max: int = 1000):
+        self.workers = workers
+        self._ctx = mp.get_context("spawn")
+        self.queues = [self._ctx.Queue(maxsize=queue_max) for _ in range(workers)]
+        self.procs: List[Optional[mp.Process]] = [None] * workers
+        self.dispatched = 0
+        self.dropped = 0
+
+    def _spawn(self, i: int) -> None:
+        p = self._ctx.Process(target=_worker_main, args=(i, self.workers, self.queues[i]), name=f"shard-{i}")
+        p.start()
+        self.procs[i] = p
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            self._spawn(i)
+        log.info("Started %d shard workers", self.workers)
+
+    def check(self) -> None:
+        """Bật lại worker đã chết (update đang chờ vẫn nằm trong queue)."""
+        for i, p in enumerate(self.procs):
+            if p is not None and not p.is_alive():
+                log.warning("Shard worker %d exited (code %s), restarting", i, p.exitcode)
+                metrics.incr("shard_restarts")
+                self._spawn(i)
+
+    def dispatch(self, raw: str, data: Dict[str, Any]) -> bool:
+        i = shard_for(chat_key(data), self.workers)
+        try:
+            self.queues[i].put_nowait(raw)
+        except queue.Full:
+            self.dropped += 1
+            metrics.incr("shard_dropped")
+            log.warning("Shard %d queue full, update %s dropped", i, data.get("update_id"))
+            return False
+        self.dispatched += 1
+        return True
+
+    def stop(self, timeout: float = 25.0) -> None:
+        for q in self.queues:
+            try:
+                q.put(None, timeout=2)
+            except queue.Full:
+                pass
+        for p in self.procs:
+            if p is not None:
+                p.join(timeout)
+                if p.is_alive():
+                    p.terminate()
+        for q in self.queues:
+            q.cancel_join_thread()          # update còn kẹt trong queue thì bỏ, không treo lúc thoát
+            q.close()
+        log.info("Shard workers stopped (%d dispatched, %d dropped)", self.dispatched, self.dropped)
+
+async def _poll(dispatcher: ShardDispatcher, stop: asyncio.Event, poll_timeout: int = 25) -> None:
+    from telegram import Bot, Update
+    from telegram.error import NetworkError, TelegramError
+
+    bot = Bot(Settings.BOT_TOKEN, base_url=Settings.TELEGRAM_API_URL or "https://api.telegram.org/bot")
+    async with bot:
+        await bot.delete_webhook()
+        offset: Optional[int] = None
+        backoff = 1.0
+        stopping = asyncio.create_task(stop.wait())
+        while not stop.is_set():
+            fetch = asyncio.create_task(bot.get_updates(
+                offset=offset, timeout=poll_timeout, allowed_updates=Update.ALL_TYPES,
+                read_timeout=poll_timeout + 10,
+            ))
+            await asyncio.wait({fetch, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if not fetch.done():            # dừng giữa long-poll: bỏ request, không chờ hết timeout
+                fetch.cancel()
+                break
+            try:
+                updates = fetch.result()
+                backoff = 1.0
+            except NetworkError as e:
+                log.warning("getUpdates failed: %s (retry in %.0fs)", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            except TelegramError as e:
+                log.error("getUpdates error: %s", e)
+                await asyncio.sleep(5)
+                continue
+            for u in updates:
+                data = u.to_dict()
+                dispatcher.dispatch(json.dumps(data), data)
+                offset = u.update_id + 1
+        if offset is not None:
+            # xác nhận offset cuối để restart không nhận lại
+            await bot.get_updates(offset=offset, timeout=0)
+
+async def _serve_webhook(dispatcher: ShardDispatcher, stop: asyncio.Event) -> None:
+    from webhook import SECRET_HEADER, MiniHTTPServer, Request, Response, _register_webhook
+
+    secret = Settings.WEBHOOK_SECRET
+
+    async def handle(req: Request) -> Response:
+        if secret and not hmac.compare_digest(req.headers.get(SECRET_HEADER, ""), secret):
+            return 403, "text/plain", b""
+        try:
+            data = json.loads(req.body or b"{}")
+        except ValueError:
+            return 400, "text/plain", b""
+        if not isinstance(data, dict) or "update_id" not in data:
+            return 400, "text/plain", b""
+        dispatcher.dispatch(req.body.decode("utf-8"), data)
+        return 200, "application/json", b"{}"
+
+    server = MiniHTTPServer(Settings.WEBHOOK_LISTEN, Settings.WEBHOOK_PORT)
+    server.route("POST", Settings.WEBHOOK_PATH, handle)
+    await server.start()
+    register = None
+    if Settings.WEBHOOK_URL:
+        from telegram import Bot
+
+        bot = Bot(Settings.BOT_TOKEN, base_url=Settings.TELEGRAM_API_URL or "https://api.telegram.org/bot")
+        register = asyncio.create_task(
+            _register_webhook(bot, Settings.WEBHOOK_URL.rstrip("/") + Settings.WEBHOOK_PATH, secret)
+        )
+    try:
+        await stop.wait()
+    finally:
+        if register and not register.done():
+            register.cancel()
+        await server.stop()
+
+async def _front(dispatcher: ShardDispatcher) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async def watchdog():
+        while not stop.is_set():
+            await asyncio.sleep(5)
+            dispatcher.check()
+
+    dog = asyncio.create_task(watchdog())
+    intake = asyncio.create_task(
+        _serve_webhook(dispatcher, stop) if Settings.BOT_MODE == "webhook" else _poll(dispatcher, stop)
+    )
+    await stop.wait()
+    dog.cancel()
+    try:
+        await asyncio.wait_for(intake, 30)
+    except (asyncio.TimeoutError, Exception) as e:
+        log.warning("Intake stopped: %s", e or "timeout")
+
+def run_sharded(workers: int) -> None:
+    dispatcher = ShardDispatcher(workers, Settings.SHARD_QUEUE_MAX)
+    dispatcher.start()
+    try:
+        asyncio.run(_front(dispatcher))
+    finally:
+        dispatcher.stop()
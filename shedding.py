@@ -0,0 +1,169 @@
+# shedding.py
+"""
+Giảm tải khi bị spam: bỏ bớt việc ngay từ cửa thay vì xếp hàng việc không kịp làm.
+  - token bucket theo user và theo chat (upstream.TokenBucket); lệnh nặng (/prices) tốn nhiều token hơn
+  - hết token -> bỏ update, gửi câu "chậm lại" dựng sẵn, tối đa 1 lần mỗi NOTICE_SEC cho mỗi chat
+  - mỗi chat có 1 hàng đợi riêng, giới hạn độ dài: đầy thì bỏ update CŨ nhất (user đã gõ tiếp rồi)
+  - handler trả về ngay, hàng đợi của chat chạy nền -> 1 chat bị flood không giữ chân chat khác
+  - admin (Settings.ADMIN_IDS) không bị giới hạn
+Số bucket / hàng đợi giữ trong RAM có giới hạn (bỏ cái lâu không dùng nhất).
+"""
+from __future__ import annotations
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+import metrics
+from upstream import TokenBucket
+
+log = logging.getLogger("rotchain.shedding")
+
+Handler = Callable[[Any, Any], Awaitable[Any]]
+
+SLOW_DOWN = "🐢 Bạn gửi hơi nhanh, bot tạm bỏ qua vài tin. Thử lại sau ít giây nhé."
+
+class _LRU(OrderedDict):
+    """Dict giới hạn số key: quá `limit` thì bỏ key lâu không đụng tới nhất."""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+
+    def touch(self, key, factory: Callable[[], Any]):
+        value = self.get(key)
+        if value is None:
+            value = self[key] = factory()
+            if len(self) > self.limit:
+                self.popitem(last=False)
+        else:
+            self.move_to_end(key)
+        return value
+
+class Shedder:
+    def __init__(
+        self,
+        user_per_min: float = 20,
+        user_burst: float = 5,
+        chat_per_min: float = 60,
+        chat_burst: float = 20,
+        queue_max: int = 5,
+        notice_sec: float = 30,
+        exempt: Iterable[int] = (),
+        max_keys: int = 10000,
+    ):
+        self.user_rate, self.user_burst = user_per_min / 60.0, user_burst
+        self.chat_rate, self.chat_burst = chat_per_min / 60.0, chat_burst
+        self.queue_max = max(1, queue_max)
+        self.notice_sec = notice_sec
+        self.exempt = exempt                   # giữ tham chiếu: ADMIN_IDS bổ sung sau vẫn có hiệu lực
+        self._users = _LRU(max_keys)
+        self._chats = _LRU(max_keys)
+        self._notified = _LRU(max_keys)
+        self._lanes: Dict[int, Deque[Tuple[Handler, Any, Any]]] = {}
+        self.shed = 0
+        self.dropped = 0
+
+    # ---- rate limit ----
+    def admit(self, user_id: Optional[int], chat_id: Optional[int], cost: float = 1.0) -> bool:
+        """
+        True nếu được xử lý. Xét cả bucket chat lẫn user trước, chỉ trừ token khi cả hai đều đủ
+        (update bị từ chối không ăn mất quota của chat / user còn lại).
+        """
+        if user_id is not None and user_id in self.exempt:
+            return True
+        chat = user = None
+        if chat_id is not None:
+            chat = self._chats.touch(chat_id, lambda: TokenBucket(self.chat_rate, self.chat_burst))
+            if not chat.available(cost):
+                metrics.incr("shed_chat")
+                self.shed += 1
+                return False
+        if user_id is not None:
+            user = self._users.touch(user_id, lambda: TokenBucket(self.user_rate, self.user_burst))
+            if not user.available(cost):
+                metrics.incr("shed_user")
+                self.shed += 1
+                return False
+        for bucket in (chat, user):     # chạy trên event loop: giữa available() và đây không ai chen vào
+            if bucket is not None:
+                bucket.try_acquire(cost)
+        return True
+
+    def should_notice(self, chat_id: int) -> bool:
+        """Câu "chậm lại" chỉ gửi 1 lần mỗi notice_sec / chat (bản thân nó cũng tốn quota gửi)."""
+        now = time.monotonic()
+        last = self._notified.get(chat_id)
+        if last is not None and now - last < self.notice_sec:
+            return False
+        self._notified.pop(chat_id, None)
+        self._notified.touch(chat_id, lambda: now)
+        return True
+
+    # ---- hàng đợi theo chat ----
+    def submit(self, chat_id: int, fn: Handler, update, ctx) -> bool:
+        """
+        Đưa việc vào hàng đợi của chat. True nếu cần bật task chạy nền (chat đang rảnh).
+        Hàng đợi (việc đang chờ, không tính việc đang chạy) đầy -> bỏ việc cũ nhất.
+        """
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            self._lanes[chat_id] = deque([(fn, update, ctx)])
+            return True
+        if len(lane) >= self.queue_max:
+            lane.popleft()
+            self.dropped += 1
+            metrics.incr("shed_dropped")
+        lane.append((fn, update, ctx))
+        return False
+
+    async def drain(self, chat_id: int, on_error: Callable[[Any, BaseException], Awaitable[Any]]) -> None:
+        lane = self._lanes.get(chat_id)
+        try:
+            while lane:
+                fn, update, ctx = lane.popleft()
+                try:
+                    await fn(update, ctx)
+                except Exception as e:
+                    await on_error(update, e)
+        finally:
+            self._lanes.pop(chat_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "shed": self.shed,
+            "dropped": self.dropped,
+            "busy_chats": len(self._lanes),
+            "queued": sum(len(q) for q in self._lanes.values()),
+        }
+
+    # ---- bọc handler PTB ----
+    def guard(self, fn: Handler, cost: float = 1.0, wants: Optional[Callable[[Any, Any], bool]] = None) -> Handler:
+        """
+        Handler PTB: kiểm tra token rồi đẩy vào hàng đợi của chat.
+        wants(update, ctx) False -> update không dành cho bot (vd. chat thường trong group): không tính token,
+        không gửi câu "chậm lại", không xếp hàng. Kết quả tính được có thể gắn vào ctx cho fn dùng lại.
+        Lỗi trong hàng đợi được chuyển cho error handler của Application như handler thường.
+        """
+
+        async def wrapper(update, ctx) -> None:
+            if wants is not None and not wants(update, ctx):
+                return
+            user_id = update.effective_user.id if update.effective_user else None
+            chat_id = update.effective_chat.id if update.effective_chat else None
+            if not self.admit(user_id, chat_id, cost):
+                if chat_id is not None and self.should_notice(chat_id):
+                    try:
+                        await update.effective_chat.send_message(SLOW_DOWN)
+                    except Exception as e:
+                        log.debug("Slow-down notice failed: %s", e)
+                return
+            if chat_id is None or (user_id is not None and user_id in self.exempt):
+                await fn(update, ctx)
+                return
+            if self.submit(chat_id, fn, update, ctx):
+                app = ctx.application
+                app.create_task(self.drain(chat_id, app.process_error), update=update)
+
+        wrapper.__name__ = getattr(fn, "__name__", "handler")
+        return wrapper
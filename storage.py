@@ -0,0 +1,105 @@
+# storage.py
+"""
+Tiện ích SQLite dùng chung cho các state cục bộ (airdrop store, jobs, subscribers, ...).
+"""
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Mở SQLite ở chế độ WAL (nhiều reader + 1 writer, kể cả khác process).
+    Connection dùng chung giữa các thread -> caller tự giữ lock khi ghi.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+class KVCache:
+    """
+    Cache key -> JSON dùng chung giữa nhiều process (shard worker) qua 1 file SQLite.
+    Timestamp là wall clock để các process so tuổi với nhau được.
+    """
+
+    def __init__(self, path: str):
+        self.conn = connect(path)
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, ts REAL NOT NULL)")
+
+    @staticmethod
+    def _key(key: Any) -> str:
+        return key if isinstance(key, str) else json.dumps(key, separators=(",", ":"))
+
+    def get(self, key: Any, max_age: float) -> Optional[Tuple[Any, float]]:
+        """(value, tuổi giây) nếu còn trẻ hơn max_age, ngược lại None."""
+        with self._lock:
+            row = self.conn.execute("SELECT value, ts FROM kv WHERE key = ?", (self._key(key),)).fetchone()
+        if row is None:
+            return None
+        age = time.time() - row[1]
+        if age >= max_age:
+            return None
+        return json.loads(row[0]), age
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO kv VALUES (?, ?, ?)",
+                (self._key(key), json.dumps(value, separators=(",", ":")), time.time()),
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+def iter_json_items(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    Đọc dần từng object từ file JSON array (`[{...}, ...]`) hoặc JSONL, không nạp cả file vào RAM.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size)
+        stripped = buf.lstrip()
+        if not stripped.startswith("["):
+            # JSONL: mỗi dòng 1 object
+            rest = buf + f.readline()
+            for line in rest.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        pos = len(buf) - len(stripped) + 1      # sau dấu "["
+        eof = False
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos >= len(buf):
+                    raise ValueError("need more data")
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise ValueError(f"{path}: JSON array bị cắt ngang")
+                more = f.read(chunk_size)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            if isinstance(obj, dict):
+                yield obj
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
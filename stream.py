@@ -0,0 +1,137 @@
+# stream.py
+"""
+Chế độ streaming giá (push) thay cho poll REST:
+  - subscribe websocket ticker kiểu Binance (miniTicker / combined stream)
+  - giữ bảng giá mới nhất trong RAM: pair -> (price, ts)
+  - tự reconnect với backoff luỹ thừa + jitter
+/prices và job_prices đọc bảng này, không tốn network.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from crypto import PRICE_CACHE, Quote, normalize_to_cg_ids, map_to_binance, _make_quote
+
+log = logging.getLogger("rotchain.stream")
+
+def build_stream_url(base: str, pairs: Iterable[str]) -> str:
+    """
+    base dạng ".../stream" -> combined stream cho từng cặp (<pair>@miniTicker).
+    Nếu base đã có query hoặc là stream "@arr" thì dùng nguyên.
+    """
+    if "?" in base or base.endswith("@arr"):
+        return base
+    streams = "/".join(f"{p.lower()}@miniTicker" for p in sorted(set(pairs)))
+    return f"{base.rstrip('/')}?streams={streams}"
+
+def parse_ticker_message(raw: Any) -> List[Tuple[str, float]]:
+    """
+    Chấp nhận: {"stream":..., "data": {...}} | [{...}, ...] | {...}
+    với mỗi phần tử có "s" (symbol) và "c" (close price).
+    """
+    try:
+        msg = json.loads(raw) if isinstance(raw, (str, bytes, bytearray)) else raw
+    except ValueError:
+        return []
+    if isinstance(msg, dict) and "data" in msg:
+        msg = msg["data"]
+    rows = msg if isinstance(msg, list) else [msg]
+    out: List[Tuple[str, float]] = []
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        try:
+            out.append((str(row["s"]).upper(), float(row["c"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+class PriceStream:
+    def __init__(self, url: str, max_backoff: float = 60.0):
+        self.url = url
+        self.max_backoff = max_backoff
+        self.latest: Dict[str, Tuple[float, float]] = {}
+        self.connected = False
+        self.reconnects = 0
+        self.messages = 0
+        self._task: Optional[asyncio.Task] = None
+
+    # ====== Đọc bảng giá ======
+    def price(self, pair: str, max_age: float = 30.0) -> Optional[float]:
+        hit = self.latest.get(pair.upper())
+        if not hit or time.time() - hit[1] > max_age:
+            return None
+        return hit[0]
+
+    def prices(self, pairs: Iterable[str], max_age: float = 30.0) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        for p in pairs:
+            v = self.price(p, max_age)
+            if v is not None:
+                out[p.upper()] = v
+        return out
+
+    def quotes(self, symbols: List[str], vs: str = "usd", max_age: float = 30.0) -> List[Quote]:
+        """
+        Quote từ bảng stream (Binance) + giá CG nếu đang có sẵn trong PRICE_CACHE.
+        Không gọi network.
+        """
+        syms = [s.strip() for s in symbols if s and s.strip()]
+        cg_ids = normalize_to_cg_ids(syms)
+        cg = PRICE_CACHE.get(("cg", vs, tuple(sorted(set(cg_ids))))) or {}
+        return [
+            _make_quote(sym, cg_id, map_to_binance(sym), cg.get(cg_id), self.price(map_to_binance(sym), max_age))
+            for sym, cg_id in zip(syms, cg_ids)
+        ]
+
+    def is_fresh(self, max_age: float = 30.0) -> bool:
+        now = time.time()
+        return any(now - ts <= max_age for _, ts in self.latest.values())
+
+    # ====== Vòng đời ======
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run(), name="price-stream")
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.connected = False
+
+    async def run(self) -> None:
+        try:
+            import websockets
+        except ImportError:
+            raise RuntimeError("websockets not installed. Add 'websockets' to requirements.txt.")
+
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, open_timeout=10) as ws:
+                    self.connected = True
+                    backoff = 1.0
+                    log.info("Price stream connected: %s", self.url)
+                    async for raw in ws:
+                        now = time.time()
+                        for pair, price in parse_ticker_message(raw):
+                            self.latest[pair] = (price, now)
+                        self.messages += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Price stream error: %s", e)
+            self.connected = False
+            self.reconnects += 1
+            delay = min(self.max_backoff, backoff) * random.uniform(0.5, 1.0)
+            backoff = min(self.max_backoff, backoff * 2)
+            await asyncio.sleep(delay)
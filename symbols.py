@@ -0,0 +1,214 @@
+# symbols.py
+"""
+Chỉ mục symbol: ticker -> coingecko id -> cặp Binance.
+  - build từ danh sách coins kiểu CoinGecko (/coins/list) + bảng ticker Binance
+  - lưu đĩa dạng bảng nhị phân đã sort, nạp qua mmap (load nhanh, không parse JSON)
+  - tra cứu O(1) bằng dict trong RAM
+  - ticker trùng nhau (vd. nhiều coin cùng "eth") được chọn theo luật cố định
+  - refresh tăng dần: chỉ ghi lại file khi danh sách coin thực sự thay đổi
+"""
+from __future__ import annotations
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_MAGIC = b"RSYM"
+_VERSION = 2
+_HEADER = struct.Struct("<4sHId")      # magic, version, count, built_at
+_REC = struct.Struct("<BBB")           # số byte UTF-8 của symbol, id, pair (2 bit cao của pair là cờ)
+_CHOSEN, _CANONICAL = 0x80, 0x40       # coin được chọn cho ticker / id trùng slug tên
+_MAX_SYM, _MAX_ID, _MAX_PAIR = 0xFF, 0xFF, 0x3F
+
+def _nbytes(s: str) -> int:
+    return len(s.encode("utf-8"))
+
+Record = Tuple[str, str, str]          # (symbol, cg_id, binance_pair | "")
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+class SymbolIndex:
+    def __init__(self, path: str, overrides: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.overrides = {k.lower(): v for k, v in (overrides or {}).items()}
+        self.built_at = 0.0
+        self._records: Dict[str, Record] = {}          # cg_id -> record
+        self._canonical: Set[str] = set()              # cg_id trùng slug(name): đầu vào xếp hạng, lưu cùng file
+        self._by_ticker: Dict[str, str] = {}           # ticker -> cg_id đã chọn
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    # ====== Tra cứu ======
+    def cg_id(self, ticker: str) -> Optional[str]:
+        k = ticker.strip().lower()
+        return self.overrides.get(k) or self._by_ticker.get(k)
+
+    def is_cg_id(self, cg_id: str) -> bool:
+        return cg_id in self._records
+
+    def pair_for_id(self, cg_id: str) -> Optional[str]:
+        rec = self._records.get(cg_id)
+        return rec[2] or None if rec else None
+
+    def pair(self, symbol: str) -> Optional[str]:
+        """Ticker hoặc coingecko id -> cặp Binance (USDT) nếu có niêm yết."""
+        k = symbol.strip().lower()
+        cg_id = self.cg_id(k) or (k if k in self._records else None)
+        return self.pair_for_id(cg_id) if cg_id else None
+
+    def listed(self) -> List[Record]:
+        """Mọi ticker (coin đã chọn) có cặp Binance USDT, sort theo ticker."""
+        with self._lock:
+            recs = [self._records.get(cid) for cid in self._by_ticker.values()]
+        return sorted(r for r in recs if r and r[2])
+
+    # ====== Resolve ticker trùng ======
+    def _rank(self, ticker: str, cg_id: str) -> Tuple:
+        rec = self._records[cg_id]
+        return (
+            self.overrides.get(ticker) != cg_id,            # override luôn thắng
+            not rec[2],                                     # có cặp Binance trước
+            cg_id not in self._canonical,                   # id trùng slug tên (coin "gốc")
+            len(cg_id),
+            cg_id,
+        )
+
+    def _resolve(self, tickers: Iterable[str]) -> None:
+        groups: Dict[str, List[str]] = {}
+        wanted = set(tickers)
+        for cg_id, (sym, _, _) in self._records.items():
+            if sym in wanted:
+                groups.setdefault(sym, []).append(cg_id)
+        for t in wanted:
+            ids = groups.get(t)
+            if ids:
+                self._by_ticker[t] = min(ids, key=lambda i: self._rank(t, i))
+            else:
+                self._by_ticker.pop(t, None)
+
+    # ====== Build / refresh ======
+    def update(self, coins: Iterable[Dict[str, str]], binance_pairs: Iterable[str]) -> int:
+        """
+        Áp danh sách coin mới (dict có id/symbol/name) lên index hiện tại.
+        Chỉ resolve lại các ticker bị ảnh hưởng. Trả về số record thay đổi.
+        """
+        pairs = {p.upper() for p in binance_pairs}
+        fresh: Dict[str, Record] = {}
+        canonical: Set[str] = set()
+        for c in coins:
+            cg_id = str(c.get("id") or "").strip()
+            sym = str(c.get("symbol") or "").strip().lower()
+            # Giới hạn theo byte (không phải ký tự): symbol/id unicode dài vẫn phải vừa bản ghi <BBB
+            if not cg_id or not sym or _nbytes(sym) > _MAX_SYM or _nbytes(cg_id) > _MAX_ID:
+                continue
+            pair = f"{sym.upper()}USDT"
+            if pair not in pairs or _nbytes(pair) > _MAX_PAIR:
+                pair = ""
+            fresh[cg_id] = (sym, cg_id, pair)
+            if _slug(str(c.get("name") or "")) == cg_id:
+                canonical.add(cg_id)
+
+        with self._lock:
+            old = self._records
+            touched = {rec[0] for cid, rec in old.items() if fresh.get(cid) != rec}
+            touched |= {rec[0] for cid, rec in fresh.items() if old.get(cid) != rec}
+            changed = sum(1 for cid in old.keys() | fresh.keys() if old.get(cid) != fresh.get(cid))
+            # Coin đổi tên làm đổi hạng -> ticker đó cũng phải resolve lại
+            touched |= {fresh[cid][0] for cid in canonical ^ self._canonical if cid in fresh}
+            self._records = fresh
+            self._canonical = canonical
+            if touched:
+                self._resolve(touched)
+            self.built_at = time.time()
+        return changed
+
+    def refresh(self, timeout: int = 30) -> int:
+        """Tải coins list + bảng ticker Binance, cập nhật index và ghi đĩa nếu có thay đổi."""
+        from crypto import BINANCE, COINS_LIST, _get
+
+        r = _get(COINS_LIST, timeout=timeout)
+        r.raise_for_status()
+        coins = r.json()
+        r = _get(BINANCE, timeout=timeout, cost=4)
+        r.raise_for_status()
+        pairs = [row.get("symbol", "") for row in r.json() if str(row.get("symbol", "")).endswith("USDT")]
+
+        changed = self.update(coins, pairs)
+        if changed or not os.path.exists(self.path):
+            self.save()
+        return changed
+
+    def is_stale(self, max_age_s: float) -> bool:
+        return not self._records or time.time() - self.built_at > max_age_s
+
+    # ====== Lưu / nạp ======
+    def save(self) -> None:
+        with self._lock:
+            recs = sorted(self._records.values())
+            chosen = set(self._by_ticker.values())
+            canonical = set(self._canonical)
+            built_at = self.built_at
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(recs), built_at))
+            for sym, cg_id, pair in recs:
+                b = [x.encode("utf-8") for x in (sym, cg_id, pair)]
+                # 2 bit cao của len(pair): coin được chọn cho ticker / coin "gốc" (để resolve lại sau khi nạp)
+                flags = (_CHOSEN if cg_id in chosen else 0) | (_CANONICAL if cg_id in canonical else 0)
+                f.write(_REC.pack(len(b[0]), len(b[1]), len(b[2]) | flags))
+                f.write(b"".join(b))
+        os.replace(tmp, self.path)
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                parsed = self._parse(buf)
+        except (OSError, ValueError):          # ValueError: file rỗng không mmap được
+            return False
+        if parsed is None:
+            return False
+        records, canonical, by_ticker, built_at = parsed
+        with self._lock:
+            self._records = records
+            self._canonical = canonical
+            self._by_ticker = by_ticker
+            self.built_at = built_at
+        return True
+
+    @staticmethod
+    def _parse(buf: mmap.mmap):
+        records: Dict[str, Record] = {}
+        canonical: Set[str] = set()
+        by_ticker: Dict[str, str] = {}
+        try:
+            magic, version, count, built_at = _HEADER.unpack_from(buf, 0)
+            if magic != _MAGIC or version != _VERSION:
+                return None
+            pos = _HEADER.size
+            for _ in range(count):
+                ls, li, lp = _REC.unpack_from(buf, pos)
+                pos += _REC.size
+                flags, lp = lp & (_CHOSEN | _CANONICAL), lp & _MAX_PAIR
+                end = pos + ls + li + lp
+                if end > len(buf):
+                    return None
+                raw = buf[pos:end]                      # chỉ copy đúng bản ghi này ra khỏi mmap
+                pos = end
+                sym = raw[:ls].decode("utf-8")
+                cg_id = raw[ls:ls + li].decode("utf-8")
+                pair = raw[ls + li:].decode("utf-8")
+                records[cg_id] = (sym, cg_id, pair)
+                if flags & _CANONICAL:
+                    canonical.add(cg_id)
+                if flags & _CHOSEN:
+                    by_ticker[sym] = cg_id
+        except (struct.error, UnicodeDecodeError):
+            return None
+        return records, canonical, by_ticker, built_at
@@ -0,0 +1,107 @@
+# tests/test_broadcast.py
+"""Broadcast qua FakeTelegram: đợt có heartbeat cũ được nhận lại đúng 1 lần và chỉ gửi tiếp những người còn pending."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+
+from broadcast import BLOCKED, CANCELLED, DONE, PENDING, RUNNING, SENT, Broadcaster, SubscriberStore
+from fakes import FakeTelegram
+
+ADMIN = 999
+
+class RecordingTelegram(FakeTelegram):
+    """FakeTelegram ghi lại chat_id của từng sendMessage."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent_to = []
+
+    async def _bot_api(self, req):
+        if req.path.endswith("/sendMessage"):
+            self.sent_to.append(int(self._params(req).get("chat_id", 0) or 0))
+        return await super()._bot_api(req)
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SubscriberStore(os.path.join(self.tmp.name, "subs.db"))
+        for c in range(1, 51):
+            self.store.subscribe(c, c)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def _age_heartbeat(self, bid: int, sec: float) -> None:
+        with self.store.conn:
+            self.store.conn.execute("UPDATE broadcasts SET heartbeat = ? WHERE id = ?", (time.time() - sec, bid))
+
+    def test_stale_job_resumes_pending_only(self):
+        bid, total = self.store.create("hello <b>all</b>", ADMIN)
+        self.assertEqual(total, 50)
+        # process cũ đã gửi 20 người đầu rồi chết giữa chừng
+        self.store.record(bid, [(c, SENT) for c in range(1, 21)])
+        self.assertEqual(self.store.claim(stale_sec=60), [])         # heartbeat còn mới: chưa ai được nhận
+        self._age_heartbeat(bid, 120)
+
+        async def go():
+            tg = await RecordingTelegram().start()
+            tg.blocked = {25, 30}
+            try:
+                jobs = self.store.claim(stale_sec=60)
+                self.assertEqual([j.id for j in jobs], [bid])
+                self.assertEqual(self.store.claim(stale_sec=60), [])   # process thứ 2 không nhận trùng
+                async with Bot("1:x", base_url=tg.api) as bot:
+                    bc = Broadcaster(self.store, bot, db=asyncio.to_thread, rate=1000, concurrency=4, report_sec=0)
+                    await bc.run(jobs[0])
+            finally:
+                await tg.stop()
+            return tg
+
+        tg = asyncio.run(go())
+        to_subs = [c for c in tg.sent_to if c != ADMIN]
+        self.assertEqual(sorted(to_subs), list(range(21, 51)))         # không gửi lại 20 người đã nhận
+        self.assertIn(ADMIN, tg.sent_to)                                 # tin tiến độ cho admin
+        self.assertEqual(self.store.counts(bid), {SENT: 48, BLOCKED: 2})
+        self.assertEqual(self.store.get(bid).status, DONE)
+        self.assertEqual(self.store.count(), 48)                         # người chặn bot bị huỷ đăng ký
+
+    def test_shutdown_releases_job_for_immediate_claim(self):
+        bid, _ = self.store.create("slow", ADMIN)
+
+        async def go():
+            tg = await RecordingTelegram(latency=0.05).start()
+            try:
+                async with Bot("1:x", base_url=tg.api) as bot:
+                    bc = Broadcaster(self.store, bot, db=asyncio.to_thread, rate=1000, concurrency=2, report_sec=60)
+                    self.assertTrue(bc.start(self.store.get(bid)))
+                    await asyncio.sleep(0.3)
+                    await bc.stop()
+            finally:
+                await tg.stop()
+
+        asyncio.run(go())
+        self.assertEqual(self.store.get(bid).status, RUNNING)
+        left = self.store.counts(bid).get(PENDING, 0)
+        self.assertGreater(left, 0)
+        self.assertEqual(self.store.counts(bid).get(SENT, 0) + left, 50)
+        # release() đặt heartbeat = 0: nhận lại ngay, không chờ STALE_SEC
+        self.assertEqual([j.id for j in self.store.claim()], [bid])
+
+    def test_cancelled_job_not_claimed(self):
+        bid, _ = self.store.create("x", ADMIN)
+        self.assertEqual(self.store.cancel(bid), 1)
+        self._age_heartbeat(bid, 120)
+        self.assertEqual(self.store.claim(stale_sec=60), [])
+        self.assertEqual(self.store.get(bid).status, CANCELLED)
+
+if __name__ == "__main__":
+    unittest.main()
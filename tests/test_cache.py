@@ -0,0 +1,60 @@
+# tests/test_cache.py
+"""TTLCache.aget_or_fetch: tầng shared (SQLite) không được chạy trên thread của event loop."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crypto import TTLCache
+from storage import KVCache
+
+class _Recording(KVCache):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.threads = []
+
+    def get(self, key, max_age):
+        self.threads.append(threading.get_ident())
+        return super().get(key, max_age)
+
+    def put(self, key, value):
+        self.threads.append(threading.get_ident())
+        super().put(key, value)
+
+class SharedOffLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.kv = _Recording(os.path.join(self.tmp.name, "kv.db"))
+
+    def tearDown(self):
+        self.kv.close()
+        self.tmp.cleanup()
+
+    def test_async_path_uses_worker_threads(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            return {"btc": 1.0}
+
+        async def go():
+            loop_thread = threading.get_ident()
+            a = TTLCache(60, shared=self.kv)
+            self.assertEqual(await a.aget_or_fetch("k", fetch), {"btc": 1.0})
+            await asyncio.sleep(0.1)                   # put chạy nền
+            b = TTLCache(60, shared=self.kv)           # process khác: lấy từ tầng shared
+            self.assertEqual(await b.aget_or_fetch("k", fetch), {"btc": 1.0})
+            return loop_thread
+
+        loop_thread = asyncio.run(go())
+        self.assertEqual(calls, [1])
+        self.assertEqual(len(self.kv.threads), 3)      # get miss, put, get hit
+        self.assertNotIn(loop_thread, self.kv.threads)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# tests/test_inline.py
+"""InlineIndex: số airdrop được index có trần, answer() không vỡ khi index dựng lại giữa chừng."""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inline import AIRDROP, InlineIndex
+from marketing import Marketing
+
+class InlineIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "airdrops.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _catalog(self, items) -> None:
+        with open(self.src, "w", encoding="utf-8") as f:
+            json.dump(items, f)
+        os.utime(self.src, ns=(0, len(items) * 10**9))   # đổi mtime chắc chắn -> catalog nạp lại
+
+    def test_indexed_airdrops_capped_open_first(self):
+        self._catalog([{"name": f"Quest {i}", "status": "closed" if i < 40 else "open"} for i in range(50)])
+        idx = InlineIndex(Marketing("https://lp", {}, airdrops_path=self.src), max_airdrops=15)
+        idx.rebuild()
+        refs = [r for r in idx.lookup("quest") if r.startswith(AIRDROP)]
+        self.assertEqual(len(refs), 15)
+        self.assertEqual(len(idx._snap.articles), 15)
+        statuses = [idx._snap.rank[r][1] for r in refs]
+        self.assertEqual(statuses.count(0), 10)             # cả 10 open đều có, closed chỉ lấp chỗ trống
+
+    def test_answer_survives_rebuild_during_await(self):
+        self._catalog([{"name": "btc quest", "status": "open"}])
+        idx = InlineIndex(Marketing("https://lp", {}, airdrops_path=self.src), defaults=["btc"], wait=1.0)
+        idx.rebuild()
+
+        async def go():
+            flush = asyncio.get_running_loop().create_future()
+            idx._want = lambda symbols: flush
+
+            async def swap():
+                await asyncio.sleep(0.01)
+                self._catalog([{"name": "other", "status": "open"}])
+                idx.rebuild()                               # airdrop "btc quest" biến mất
+                flush.set_result(None)
+
+            task = asyncio.ensure_future(swap())
+            results, _, _ = await idx.answer("btc")
+            await task
+            return results
+
+        results = asyncio.run(go())
+        self.assertEqual([r.title for r in results], ["btc quest"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# tests/test_log.py
+"""ReportWriter: bản ghi thuộc ngày lúc write(), file ngày cũ còn sót được gzip khi mở lại."""
+from __future__ import annotations
+import datetime
+import gzip
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log import ReportWriter
+
+class _Clock:
+    def __init__(self, day: int):
+        self.now = datetime.datetime(2026, 10, day, 23, 59, 59, tzinfo=datetime.timezone.utc)
+
+    def __call__(self) -> datetime.datetime:
+        return self.now
+
+class DayRolloverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _read(self, name: str):
+        path = os.path.join(self.dir, name)
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            return [json.loads(line)["n"] for line in f]
+
+    def test_buffered_records_keep_their_day(self):
+        clock = _Clock(16)
+        w = ReportWriter(self.dir, flush_bytes=1 << 20, flush_sec=3600, compress=True, clock=clock)
+        w.write({"n": 1})
+        w.write({"n": 2})
+        clock.now += datetime.timedelta(seconds=2)       # qua nửa đêm, buffer chưa flush
+        w.write({"n": 3})
+        w.close()
+        self.assertEqual(self._read("report_20261016.jsonl.gz"), [1, 2])
+        self.assertEqual(self._read("report_20261017.jsonl"), [3])
+
+    def test_leftover_day_compressed_on_restart(self):
+        w = ReportWriter(self.dir, compress=True, clock=_Clock(16))
+        w.write({"n": 1})
+        w.close()                                        # file hôm nay để dạng thường
+        w = ReportWriter(self.dir, compress=True, clock=_Clock(18))
+        w.write({"n": 2})
+        w.close()
+        self.assertEqual(sorted(os.listdir(self.dir)), ["report_20261016.jsonl.gz", "report_20261018.jsonl"])
+        self.assertEqual(self._read("report_20261016.jsonl.gz"), [1])
+
+if __name__ == "__main__":
+    unittest.main()
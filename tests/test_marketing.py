@@ -0,0 +1,70 @@
+# tests/test_marketing.py
+"""Catalog airdrop: duyệt theo trang keyset (sqlite) / index (json), card inline đọc dần."""
+from __future__ import annotations
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marketing import AirdropStore, Marketing
+
+def _items(n: int):
+    for i in range(n):
+        yield {"name": f"Drop {i}", "status": ("open", "closed", "upcoming")[i % 3],
+               "network": "ton" if i % 2 else "bsc", "tags": ["game"] if i % 5 == 0 else [], "desc": "x" * 200}
+
+class CatalogStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _marketing(self, backend: str, n: int) -> Marketing:
+        src = os.path.join(self.tmp.name, "airdrops.json")
+        with open(src, "w", encoding="utf-8") as f:
+            json.dump(list(_items(n)), f)
+        return Marketing("https://lp", {}, airdrops_path=src, backend=backend,
+                         db_path=os.path.join(self.tmp.name, "airdrops.db"))
+
+    def test_iter_rows_pages_match_filters(self):
+        for backend in ("json", "sqlite"):
+            cat = self._marketing(backend, 1003).catalog
+            rows = list(cat.iter_rows(size=100))
+            self.assertEqual(len(rows), 1003, backend)
+            self.assertEqual(len({k for k, _ in rows}), 1003)
+            opened = list(cat.iter_rows("open", "ton", size=7))
+            self.assertTrue(opened and all(it["status"] == "open" and it["network"] == "ton" for _, it in opened))
+            self.assertEqual(len(opened), sum(1 for it in _items(1003) if it["status"] == "open" and it["network"] == "ton"))
+
+    def test_catalog_cards_statuses_limit_and_version(self):
+        m = self._marketing("sqlite", 300)
+        version, cards = m.catalog_cards(statuses=("upcoming", "open"), limit=150)
+        cards = list(cards)
+        self.assertEqual(len(cards), 150)
+        self.assertEqual([it["status"] for _, it, _ in cards[:100]], ["upcoming"] * 100)
+        self.assertTrue(all(it["status"] == "open" for _, it, _ in cards[100:]))
+        self.assertIn("Drop", cards[0][2])
+        self.assertIsNone(m.catalog_cards(version))
+        with self.assertRaises(TypeError):
+            m.load_airdrops()
+
+    def test_sqlite_cards_stream_with_flat_memory(self):
+        m = self._marketing("sqlite", 20000)
+        m.catalog.refresh()
+        tracemalloc.start()
+        try:
+            _, cards = m.catalog_cards()
+            n = sum(1 for _ in cards)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(n, 20000)
+        self.assertLess(peak, 4 << 20)                 # cả catalog ~ chục MB nếu nạp hết
+
+if __name__ == "__main__":
+    unittest.main()
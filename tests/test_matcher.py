@@ -0,0 +1,53 @@
+# tests/test_matcher.py
+"""KeywordMatcher: khớp nguyên từ trên chuỗi đã bỏ dấu, chọn theo priority rồi độ dài rồi vị trí."""
+from __future__ import annotations
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import KeywordMatcher, build_matcher
+
+class WordBoundaryTest(unittest.TestCase):
+    def test_whole_word_only(self):
+        m = KeywordMatcher(word_boundary=True).add("eth", "ETH").compile()
+        self.assertEqual(m.match("giá eth hôm nay"), "ETH")
+        self.assertEqual(m.match("ETH!"), "ETH")
+        self.assertIsNone(m.match("method"))
+        self.assertIsNone(m.match("ethereum"))
+
+    def test_per_keyword_override(self):
+        m = KeywordMatcher(word_boundary=True)
+        m.add("coin", "word")
+        m.add("airdrop", "sub", word_boundary=False)
+        self.assertIsNone(m.match("bitcoins"))
+        self.assertEqual(m.match("#airdrops"), "sub")
+
+    def test_boundary_checked_after_normalize(self):
+        m = KeywordMatcher(word_boundary=True).add("gia", "price").compile()
+        self.assertEqual(m.match("Giá BTC?"), "price")
+        self.assertIsNone(m.match("giàu"))           # "giau": "gia" dính chữ phía sau
+
+class PriorityTest(unittest.TestCase):
+    def test_priority_beats_length_and_position(self):
+        m = KeywordMatcher()
+        m.add("airdrop mới", "long", priority=5)
+        m.add("airdrop", "short", priority=1)
+        self.assertEqual(m.match("có airdrop mới không"), "short")
+
+    def test_longer_then_earlier_on_tie(self):
+        m = KeywordMatcher()
+        m.add("airdrop", "short", priority=1)
+        m.add("airdrop moi", "long", priority=1)
+        self.assertEqual(m.match("co airdrop moi"), "long")
+        m2 = KeywordMatcher().add("btc", "a", priority=0).add("eth", "b", priority=0).compile()
+        self.assertEqual(m2.best("eth rồi btc").keyword, "eth")
+
+    def test_build_matcher_insertion_order_is_default_priority(self):
+        m = build_matcher({"giá": "price", "giá btc": "btc"}, extra=[("btc", "override", -1, True)])
+        self.assertEqual(m.match("giá btc"), "override")
+        self.assertEqual(m.match("giá eth"), "price")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# tests/test_offload.py
+"""Offloader: chỗ trong giới hạn pending chỉ được trả khi thread thật sự chạy xong."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from offload import Offloader, OffloadTimeout, QueueFull
+
+class PendingTest(unittest.TestCase):
+    def setUp(self):
+        self.off = Offloader(max_workers=1, max_pending=1)
+        self.gate = threading.Event()
+
+    def tearDown(self):
+        self.gate.set()
+        self.off.shutdown(wait=True)
+
+    def test_timeout_keeps_slot_until_thread_finishes(self):
+        async def go():
+            with self.assertRaises(OffloadTimeout):
+                await self.off.run(self.gate.wait, 5, timeout=0.05)
+            self.assertEqual(self.off.pending, 1)           # thread vẫn đang chạy
+            with self.assertRaises(QueueFull):
+                await self.off.run(int)
+            self.gate.set()
+            for _ in range(100):
+                if not self.off.pending:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(self.off.pending, 0)
+            self.assertEqual(await self.off.run(int, "7"), 7)
+
+        asyncio.run(go())
+
+    def test_cancelled_caller_keeps_slot(self):
+        async def go():
+            task = asyncio.ensure_future(self.off.run(self.gate.wait, 5))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(self.off.pending, 1)
+            self.gate.set()
+            await asyncio.sleep(0.05)
+            self.assertEqual(self.off.pending, 0)
+
+        asyncio.run(go())
+
+class CounterTest(unittest.TestCase):
+    def test_counters_consistent_across_loops(self):
+        # Nhiều thread, mỗi thread một loop riêng, cùng gọi run() trên một Offloader
+        off = Offloader(max_workers=4, max_pending=3)
+        admitted = []
+
+        def worker():
+            async def go():
+                ok = 0
+                for _ in range(200):
+                    try:
+                        await off.run(time.sleep, 0)
+                        ok += 1
+                    except QueueFull:
+                        pass
+                return ok
+            admitted.append(asyncio.run(go()))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        off.shutdown(wait=True)
+        self.assertEqual(off.pending, 0)
+        self.assertEqual(off.stats()["running"], 0)
+        self.assertEqual(sum(admitted) + off.rejected, 8 * 200)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# tests/test_scheduler.py
+"""Scheduler: guard skip/coalesce, trạng thái job ghi qua `db` (không chạy trên event loop)."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import Scheduler
+
+class GuardTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.threads = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _sched(self) -> Scheduler:
+        async def db(fn, *args):
+            def call():
+                self.threads.append(threading.get_ident())
+                return fn(*args)
+            return await asyncio.to_thread(call)
+
+        return Scheduler(os.path.join(self.tmp.name, "state.db"), db=db)
+
+    def test_state_written_off_loop(self):
+        sched = self._sched()
+        runs = []
+
+        async def job(ctx):
+            runs.append(ctx)
+
+        async def go():
+            await sched._guard("j", job, "skip")("tick")
+            return threading.get_ident()
+
+        loop_thread = asyncio.run(go())
+        st = sched.state.get("j")
+        self.assertEqual((st["runs"], st["last_ok"]), (1, 1))
+        self.assertEqual(len(self.threads), 2)              # started + finished
+        self.assertNotIn(loop_thread, self.threads)
+        self.assertEqual(runs, ["tick"])
+
+    def test_overlap_skip_and_coalesce(self):
+        for policy, expected in (("skip", 1), ("coalesce", 2)):
+            sched = self._sched()
+            gate = asyncio.Event()
+            runs = []
+
+            async def job(ctx):
+                runs.append(ctx)
+                await gate.wait()
+
+            async def go():
+                run = sched._guard(policy, job, policy)
+                first = asyncio.ensure_future(run(1))
+                await asyncio.sleep(0.05)
+                await run(2)
+                await run(3)                                # trong lúc đang chạy
+                gate.set()
+                await first
+
+            asyncio.run(go())
+            self.assertEqual(len(runs), expected, policy)
+            self.assertEqual(sched.state.get(policy)["runs"], expected)
+            sched.state.close()
+
+    def test_failed_job_recorded(self):
+        sched = self._sched()
+
+        async def job(ctx):
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(sched._guard("bad", job, "skip")(None))
+        self.assertEqual(sched.state.get("bad")["last_ok"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
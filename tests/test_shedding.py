@@ -0,0 +1,72 @@
+# tests/test_shedding.py
+"""Shedder: chỉ tính quota cho update dành cho bot, trừ token khi cả 2 bucket đều đủ, quét từ khoá 1 lần."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import unittest
+from types import SimpleNamespace as NS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shedding import SLOW_DOWN, Shedder
+
+class _Chat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+        self.sent = []
+
+    async def send_message(self, text, **kw):
+        self.sent.append(text)
+
+def _update(text: str, chat: _Chat, user_id: int = 5):
+    return NS(message=NS(text=text), effective_chat=chat, effective_user=NS(id=user_id))
+
+class _Ctx:
+    """CallbackContext tối giản: có __dict__ như bản thật, application để chạy drain."""
+
+    def __init__(self):
+        self.application = NS(create_task=lambda coro, update=None: asyncio.ensure_future(coro),
+                              process_error=self._error)
+
+    async def _error(self, update, error):
+        raise error
+
+class GuardTest(unittest.TestCase):
+    def test_admit_checks_both_buckets_before_charging(self):
+        sh = Shedder(user_per_min=0.001, user_burst=1, chat_per_min=0.001, chat_burst=5)
+        self.assertTrue(sh.admit(1, 100))
+        self.assertFalse(sh.admit(1, 100))           # user hết token
+        for _ in range(4):                           # chat còn nguyên 4 token cho user khác
+            self.assertTrue(sh.admit(None, 100))
+        self.assertFalse(sh.admit(None, 100))
+
+    def test_unwanted_updates_are_free_and_reply_computed_once(self):
+        scans = []
+        handled = []
+
+        def wants(update, ctx):
+            scans.append(update.message.text)
+            ctx.quick_reply = "hi" if "airdrop" in update.message.text else None
+            return ctx.quick_reply is not None
+
+        async def on_message(update, ctx):
+            handled.append(ctx.quick_reply)
+
+        async def go(chat):
+            sh = Shedder(user_per_min=0.001, user_burst=1)
+            handler = sh.guard(on_message, wants=wants)
+            for text in ("lol", "hello all", "airdrop?", "airdrop!!", "nice"):
+                await handler(_update(text, chat), _Ctx())
+                await asyncio.sleep(0)
+            return sh
+
+        chat = _Chat(100)
+        sh = asyncio.run(go(chat))
+        self.assertEqual(handled, ["hi"])            # chat thường không tốn quota, tin khớp thứ 2 bị chặn
+        self.assertEqual(len(scans), 5)              # mỗi tin quét đúng 1 lần
+        self.assertEqual(chat.sent, [SLOW_DOWN])
+        self.assertEqual(sh.shed, 1)
+
+if __name__ == "__main__":
+    unittest.main()
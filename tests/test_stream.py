@@ -0,0 +1,80 @@
+# tests/test_stream.py
+"""PriceStream với FakeTickerServer: reconnect sau khi server đóng kết nối, bảng giá mới nhất luôn được cập nhật."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeTickerServer
+from stream import PriceStream, build_stream_url, parse_ticker_message
+
+async def _until(cond, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+class ReconnectTest(unittest.TestCase):
+    def test_reconnects_after_drop_and_keeps_table_fresh(self):
+        async def go():
+            server = await FakeTickerServer(prices={"BTCUSDT": 100.0, "ETHUSDT": 10.0},
+                                            interval=0.01, drop_after=3, seed=1).start()
+            ps = PriceStream(server.url, max_backoff=0.05)
+            ps.start()
+            try:
+                await _until(lambda: ps.reconnects >= 2 and server.connections >= 3)
+                first = ps.latest["BTCUSDT"]
+                await _until(lambda: ps.latest["BTCUSDT"] != first)
+                self.assertEqual(set(ps.latest), {"BTCUSDT", "ETHUSDT"})
+                self.assertEqual(ps.prices(["btcusdt", "ethusdt"]).keys(), {"BTCUSDT", "ETHUSDT"})
+                self.assertTrue(ps.is_fresh(5))
+                self.assertGreaterEqual(ps.messages, 6)
+            finally:
+                await ps.stop()
+                await server.stop()
+            self.assertFalse(ps.connected)
+
+        asyncio.run(go())
+
+    def test_retries_while_server_down(self):
+        async def go():
+            server = await FakeTickerServer(interval=0.01).start()
+            url = server.url
+            await server.stop()                     # cổng đóng: mọi lần connect đều lỗi
+            ps = PriceStream(url, max_backoff=0.02)
+            ps.start()
+            try:
+                await _until(lambda: ps.reconnects >= 3)
+                self.assertFalse(ps.connected)
+                self.assertEqual(ps.latest, {})
+                self.assertIsNone(ps.price("BTCUSDT"))
+            finally:
+                await ps.stop()
+
+        asyncio.run(go())
+
+    def test_stale_entries_ignored(self):
+        ps = PriceStream("ws://unused")
+        ps.latest["BTCUSDT"] = (1.0, time.time() - 120)
+        self.assertIsNone(ps.price("btcusdt", max_age=30))
+        self.assertFalse(ps.is_fresh(30))
+
+class ParseTest(unittest.TestCase):
+    def test_message_shapes(self):
+        row = {"s": "btcusdt", "c": "1.5"}
+        self.assertEqual(parse_ticker_message('[{"s": "BTCUSDT", "c": "2"}, {"s": "X"}]'), [("BTCUSDT", 2.0)])
+        self.assertEqual(parse_ticker_message({"stream": "btcusdt@miniTicker", "data": row}), [("BTCUSDT", 1.5)])
+        self.assertEqual(parse_ticker_message("not json"), [])
+
+    def test_build_url(self):
+        self.assertEqual(build_stream_url("wss://h/stream", ["ETHUSDT", "BTCUSDT", "BTCUSDT"]),
+                         "wss://h/stream?streams=btcusdt@miniTicker/ethusdt@miniTicker")
+        self.assertEqual(build_stream_url("wss://h/ws/!miniTicker@arr", ["BTCUSDT"]), "wss://h/ws/!miniTicker@arr")
+
+if __name__ == "__main__":
+    unittest.main()
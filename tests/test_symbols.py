@@ -0,0 +1,85 @@
+# tests/test_symbols.py
+"""SymbolIndex: giới hạn độ dài tính theo byte UTF-8 để file nhị phân <BBB luôn đọc lại được."""
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from symbols import SymbolIndex
+
+class ByteLengthTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "symbols.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_multibyte_fields_round_trip(self):
+        long_sym = "é" * 100                 # 100 ký tự nhưng 200 byte: vẫn vừa
+        too_long = "ế" * 90                  # 90 ký tự, 270 byte: phải bỏ
+        pair_sym = "ü" * 70                  # pair 144 byte > 63: giữ coin, bỏ pair
+        idx = SymbolIndex(self.path)
+        idx.update(
+            [
+                {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+                {"id": "accent", "symbol": long_sym, "name": "Accent"},
+                {"id": "huge", "symbol": too_long, "name": "Huge"},
+                {"id": "id-" + "đ" * 130, "symbol": "xx", "name": "Long id"},
+                {"id": "umlaut", "symbol": pair_sym, "name": "Umlaut"},
+            ],
+            ["BTCUSDT", pair_sym.upper() + "USDT"],
+        )
+        self.assertTrue(idx.is_cg_id("accent"))
+        self.assertFalse(idx.is_cg_id("huge"))
+        self.assertEqual(len(idx), 3)
+        self.assertIsNone(idx.pair("umlaut"))
+        idx.save()
+
+        again = SymbolIndex(self.path)
+        self.assertTrue(again.load())
+        self.assertEqual(again.pair("btc"), "BTCUSDT")
+        self.assertEqual(again.cg_id(long_sym), "accent")
+        self.assertEqual(again.cg_id(pair_sym), "umlaut")
+
+class TieBreakTest(unittest.TestCase):
+    COINS = [
+        {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+        {"id": "eth", "symbol": "eth", "name": "Ether Token"},      # id ngắn hơn nhưng không phải coin "gốc"
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "symbols.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rank_inputs_survive_reload(self):
+        idx = SymbolIndex(self.path)
+        idx.update(self.COINS, [])
+        self.assertEqual(idx.cg_id("eth"), "ethereum")
+        idx.save()
+
+        again = SymbolIndex(self.path)
+        self.assertTrue(again.load())
+        self.assertEqual(again.cg_id("eth"), "ethereum")
+        again._resolve({"eth"})                 # resolve lại sau khi nạp phải ra cùng kết quả
+        self.assertEqual(again.cg_id("eth"), "ethereum")
+
+    def test_rename_re_resolves_ticker(self):
+        idx = SymbolIndex(self.path)
+        idx.update(self.COINS, [])
+        renamed = [dict(self.COINS[0], name="Ethereum Classic Wrapped"), self.COINS[1]]
+        idx.update(renamed, [])
+        self.assertEqual(idx.cg_id("eth"), "eth")
+
+    def test_empty_or_old_file_is_rejected(self):
+        open(self.path, "wb").close()
+        self.assertFalse(SymbolIndex(self.path).load())
+
+if __name__ == "__main__":
+    unittest.main()
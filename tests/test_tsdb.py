@@ -0,0 +1,66 @@
+# tests/test_tsdb.py
+"""PriceStore: chọn tầng khi query sau compact/retention, không vỡ khi file bị cắt giữa 2 lần đọc."""
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import unittest
+from datetime import timedelta, timezone
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import tsdb
+from tsdb import PriceStore, format_chart
+
+NOW = 1_700_006_400.0                  # chia hết cho 86400: bucket ngày gọn
+DAY = 86400
+
+class QueryTiersTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = PriceStore(self.tmp.name, {"raw": DAY, "1m": 3 * DAY})
+        # 5 ngày, 1 tick / 30s, giá tăng đều -> close của bucket kiểm chứng được
+        for i in range(int(5 * DAY / 30)):
+            t = NOW - 5 * DAY + i * 30
+            self.store.append({"btc": 100.0 + i * 0.01}, ts=t)
+        self.store.compact(now=NOW)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_tier_choice_by_span(self):
+        last_ts, last_px = self.store.last("btc")
+        for span, tier in ((3600, "raw"), (2 * DAY, "1h"), (4.5 * DAY, "1h")):
+            got, ts, px = self.store.query("btc", NOW - span, until=NOW)
+            self.assertEqual(got, tier, span)
+            self.assertLessEqual(len(ts), 1500)
+            self.assertTrue(np.all(np.diff(ts) > 0))
+            self.assertEqual(px[-1], last_px)           # tầng nén vẫn kết thúc bằng giá raw mới nhất
+        got, ts, _ = self.store.query("btc", NOW - 20 * 3600, until=NOW, max_points=2000)
+        self.assertEqual(got, "1m")                     # raw 2400 điểm > max_points, 1m vừa đủ
+
+    def test_retention_pushes_old_spans_to_coarser_tier(self):
+        tier, ts, _ = self.store.query("btc", NOW - 4.5 * DAY, until=NOW, max_points=10_000)
+        self.assertEqual(tier, "1h")                    # raw / 1m đã bị cắt, không phủ được đầu khoảng
+        self.assertLess(ts[0], NOW - 4 * DAY)
+
+    def test_trim_between_count_and_read(self):
+        empty = np.empty(0, dtype=tsdb._dtype(tsdb.BAR))
+        with mock.patch.object(tsdb, "_read_range", return_value=empty):
+            tier, ts, px = self.store.query("btc", NOW - 2 * DAY, until=NOW)
+        self.assertEqual((tier, len(ts), len(px)), ("1h", 0, 0))
+
+class FormatChartTest(unittest.TestCase):
+    def test_uses_given_timezone(self):
+        ts, px = np.array([NOW, NOW + 60]), np.array([1.0, 2.0])
+        utc = format_chart("btc", "1d", "raw", ts, px, timezone.utc)
+        ict = format_chart("btc", "1d", "raw", ts, px, timezone(timedelta(hours=7)))
+        self.assertIn("từ 15/11 00:00", utc)
+        self.assertIn("từ 15/11 07:00", ict)
+
+if __name__ == "__main__":
+    unittest.main()
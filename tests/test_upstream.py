@@ -0,0 +1,114 @@
+# tests/test_upstream.py
+"""Vòng đời lượt thăm dò (half-open) của CircuitBreaker / HostGuard: lượt nào cũng phải được trả lại."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import upstream
+from upstream import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, HostGuard, RateLimited, TokenBucket
+
+def _open_breaker(**kw) -> CircuitBreaker:
+    br = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, **kw)
+    br.record_failure()
+    time.sleep(0.06)                    # hết hạn open -> lần allow() kế tiếp là probe
+    return br
+
+class ProbeLifecycleTest(unittest.TestCase):
+    def test_single_probe_then_success_closes(self):
+        br = _open_breaker()
+        self.assertEqual(br.state, HALF_OPEN)
+        self.assertTrue(br.allow())
+        self.assertFalse(br.allow())    # chỉ 1 probe cùng lúc
+        br.record_success()
+        self.assertEqual(br.state, CLOSED)
+        self.assertTrue(br.allow())
+
+    def test_probe_failure_reopens_with_backoff(self):
+        br = _open_breaker()
+        self.assertTrue(br.allow())
+        br.record_failure()
+        self.assertEqual(br.state, OPEN)
+        self.assertFalse(br.allow())
+        self.assertGreater(br.retry_in(), 0.05)
+
+    def test_rate_limited_probe_is_released(self):
+        br = _open_breaker()
+        guard = HostGuard("h", TokenBucket(rate=1.0, burst=1.0), br, max_wait=0.0)
+        guard.bucket._tokens = 0.0
+        with self.assertRaises(RateLimited):
+            guard.before()
+        self.assertTrue(br.allow())     # lượt thăm dò chưa dùng đã được trả lại
+
+    def test_async_rate_limited_probe_is_released(self):
+        br = _open_breaker()
+        guard = HostGuard("h", TokenBucket(rate=1.0, burst=1.0), br, max_wait=0.0)
+        guard.bucket._tokens = 0.0
+        with self.assertRaises(RateLimited):
+            asyncio.run(guard.abefore())
+        self.assertTrue(br.allow())
+
+    def test_stuck_probe_expires(self):
+        br = _open_breaker(probe_timeout=0.05)
+        self.assertTrue(br.allow())
+        self.assertFalse(br.allow())
+        time.sleep(0.06)
+        self.assertTrue(br.allow())
+
+class AsyncGetTest(unittest.TestCase):
+    """acrypto._get: request bị wait_for huỷ (upstream treo) phải tính là failure và kết thúc probe."""
+
+    def setUp(self):
+        import acrypto
+
+        self.acrypto = acrypto
+        self.url = "http://hang.test/api"
+        self.guard = upstream.guard_for(self.url)
+        self.guard.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+
+    def tearDown(self):
+        upstream._GUARDS.pop("hang.test", None)
+
+    def _run(self, delay: float):
+        async def handler(request):
+            await asyncio.sleep(delay)
+            return httpx.Response(200, json={})
+
+        async def go():
+            self.acrypto._CLIENT = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                return await asyncio.wait_for(self.acrypto._get(self.url, timeout=5), 0.05)
+            finally:
+                await self.acrypto.aclose()
+
+        return asyncio.run(go())
+
+    def test_hanging_upstream_trips_breaker(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self._run(1.0)
+        self.assertEqual(self.guard.breaker.state, OPEN)
+        self.assertEqual(upstream.degraded([self.url]), [self.guard])
+
+    def test_cancelled_probe_is_finished_and_host_recovers(self):
+        br = self.guard.breaker
+        br.record_failure()
+        time.sleep(0.06)
+        with self.assertRaises(asyncio.TimeoutError):
+            self._run(1.0)              # probe bị huỷ -> failure, không kẹt ở half-open
+        self.assertFalse(br._probing)
+        self.assertEqual(br.state, OPEN)
+        time.sleep(br.retry_in() + 0.01)
+        self.assertEqual(br.state, HALF_OPEN)
+        self.assertEqual(upstream.degraded([self.url]), [self.guard])     # half-open vẫn báo degraded
+        self._run(0.0)                  # probe kế tiếp thành công -> closed
+        self.assertEqual(br.state, CLOSED)
+        self.assertEqual(upstream.degraded([self.url]), [])
+
+if __name__ == "__main__":
+    unittest.main()
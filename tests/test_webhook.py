@@ -0,0 +1,54 @@
+# tests/test_webhook.py
+"""MiniHTTPServer: request/header quá lớn -> 400/431 thay vì task kết nối chết lặng lẽ."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook import MiniHTTPServer
+
+async def _ok(req):
+    return 200, "text/plain", b"ok"
+
+class LimitsTest(unittest.TestCase):
+    def _roundtrip(self, raw: bytes, **kw) -> bytes:
+        async def go():
+            server = MiniHTTPServer("127.0.0.1", 0, **kw)
+            server.route("GET", "/", _ok)
+            await server.start()
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+                writer.write(raw)
+                await writer.drain()
+                data = await asyncio.wait_for(reader.read(), 5)
+                writer.close()
+                return data
+            finally:
+                await server.stop(grace=0.1)
+
+        return asyncio.run(go())
+
+    def test_normal_request(self):
+        self.assertTrue(self._roundtrip(b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n").startswith(b"HTTP/1.1 200"))
+
+    def test_header_line_over_stream_limit(self):
+        raw = b"GET / HTTP/1.1\r\nX-Big: " + b"a" * (100 << 10) + b"\r\n\r\n"
+        self.assertTrue(self._roundtrip(raw).startswith(b"HTTP/1.1 431"))
+
+    def test_request_line_over_stream_limit(self):
+        raw = b"GET /" + b"a" * (100 << 10) + b" HTTP/1.1\r\n\r\n"
+        self.assertTrue(self._roundtrip(raw).startswith(b"HTTP/1.1 400"))
+
+    def test_too_many_headers(self):
+        raw = b"GET / HTTP/1.1\r\n" + b"".join(b"X-%d: 1\r\n" % i for i in range(20)) + b"\r\n"
+        self.assertTrue(self._roundtrip(raw, max_headers=10).startswith(b"HTTP/1.1 431"))
+
+    def test_header_bytes_cap(self):
+        raw = b"GET / HTTP/1.1\r\n" + b"X-A: " + b"b" * 3000 + b"\r\n\r\n"
+        self.assertTrue(self._roundtrip(raw, max_header_bytes=1024).startswith(b"HTTP/1.1 431"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,312 @@
+# tsdb.py
+"""
+Lưu lịch sử giá xuống đĩa, gọn và đọc nhanh:
+  - mỗi symbol 1 file raw append-only, bản ghi cố định 16 byte (ts, price) – ghi thẳng, không parse
+  - tầng nén sẵn 1m / 1h / 1d (OHLC, 40 byte / bản ghi) -> /chart 30d chỉ đọc ~720 điểm 1h
+  - đọc qua mmap + NumPy (searchsorted theo ts), không nạp cả file; process khác (shard) đọc chung được
+  - compact(): gộp raw -> 1m -> 1h -> 1d cho các bucket đã đóng + cắt dữ liệu quá hạn giữ;
+    chạy ở thread (offloader), chỉ giữ lock lúc thay file
+"""
+from __future__ import annotations
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime, tzinfo
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+log = logging.getLogger("rotchain.tsdb")
+
+RAW = struct.Struct("<dd")            # ts, price
+BAR = struct.Struct("<ddddd")         # ts (đầu bucket), open, high, low, close
+TIERS: Tuple[Tuple[str, int], ...] = (("1m", 60), ("1h", 3600), ("1d", 86400))
+SPARKS = "▁▂▃▄▅▆▇█"
+
+_SAFE = re.compile(r"[^a-z0-9-]")
+_SPAN = re.compile(r"^([0-9]+)([mhdwy])$")
+
+def parse_span(s: str, max_days: int = 400) -> int:
+    """'90m' | '6h' | '30d' | '2w' | '1y' -> giây."""
+    m = _SPAN.match(s.strip().lower())
+    if not m:
+        raise ValueError(f"không hiểu khoảng thời gian '{s}' (vd 6h, 7d, 30d)")
+    sec = int(m.group(1)) * {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400, "y": 365 * 86400}[m.group(2)]
+    if not 0 < sec <= max_days * 86400:
+        raise ValueError(f"khoảng thời gian tối đa {max_days}d")
+    return sec
+
+def _dtype(rec: struct.Struct):
+    import numpy as np
+
+    if rec is RAW:
+        return np.dtype([("ts", "<f8"), ("close", "<f8")])
+    return np.dtype([("ts", "<f8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8")])
+
+def _map(path: str, rec: struct.Struct) -> Optional["np.ndarray"]:
+    """
+    View NumPy thẳng trên mmap của file (bỏ bản ghi ghi dở ở cuối); None nếu file trống / chưa có.
+    mmap sống theo view (như np.memmap), file đã replace thì view cũ vẫn đọc bản cũ.
+    """
+    import numpy as np
+
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size // rec.size * rec.size
+            if not size:
+                return None
+            mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+    return np.frombuffer(mm, dtype=_dtype(rec), count=size // rec.size)
+
+def _read(path: str, rec: struct.Struct) -> "np.ndarray":
+    """Toàn bộ file (bản sao)."""
+    import numpy as np
+
+    arr = _map(path, rec)
+    return np.empty(0, dtype=_dtype(rec)) if arr is None else arr.copy()
+
+def _bounds(arr: "np.ndarray", since: float, until: float) -> Tuple[int, int]:
+    ts = arr["ts"]
+    return int(ts.searchsorted(since, "left")), int(ts.searchsorted(until, "right"))
+
+def _count(path: str, rec: struct.Struct, since: float, until: float) -> Tuple[int, float]:
+    """Số bản ghi trong [since, until] (chỉ bisect, không copy) + ts bản ghi đầu file (sau retention)."""
+    arr = _map(path, rec)
+    if arr is None:
+        return 0, math.inf
+    lo, hi = _bounds(arr, since, until)
+    return hi - lo, float(arr["ts"][0])
+
+def _read_range(path: str, rec: struct.Struct, since: float, until: float) -> "np.ndarray":
+    """Chỉ copy đoạn [since, until]."""
+    import numpy as np
+
+    arr = _map(path, rec)
+    if arr is None:
+        return np.empty(0, dtype=_dtype(rec))
+    lo, hi = _bounds(arr, since, until)
+    return arr[lo:hi].copy()
+
+class PriceStore:
+    def __init__(
+        self,
+        directory: str,
+        retention: Optional[Dict[str, float]] = None,
+    ):
+        self.directory = directory
+        # số giây giữ lại cho từng tầng; 0 = giữ mãi
+        self.retention = {"raw": 2 * 86400, "1m": 14 * 86400, "1h": 400 * 86400, "1d": 0, **(retention or {})}
+        self._files: Dict[str, object] = {}          # symbol -> file raw đang mở (append, không buffer)
+        self._last: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, symbol: str, tier: str = "raw") -> str:
+        return os.path.join(self.directory, f"{_SAFE.sub('_', symbol.lower())}.{tier}")
+
+    def symbols(self) -> List[str]:
+        return sorted(n[:-4] for n in os.listdir(self.directory) if n.endswith(".raw"))
+
+    # ====== Ghi ======
+    def _last_ts(self, symbol: str) -> float:
+        ts = self._last.get(symbol)
+        if ts is None:
+            ts = 0.0
+            try:
+                with open(self._path(symbol), "rb") as f:
+                    size = os.fstat(f.fileno()).st_size // RAW.size * RAW.size
+                    if size:
+                        f.seek(size - RAW.size)
+                        ts = RAW.unpack(f.read(RAW.size))[0]
+            except FileNotFoundError:
+                pass
+            self._last[symbol] = ts
+        return ts
+
+    def append(self, prices: Dict[str, Optional[float]], ts: Optional[float] = None) -> int:
+        """1 tick: ghi (ts, price) cho mỗi symbol có giá. ts phải tăng dần theo symbol (trùng/lùi thì bỏ)."""
+        ts = time.time() if ts is None else ts
+        n = 0
+        with self._lock:
+            for sym, price in prices.items():
+                if not price or price != price or ts <= self._last_ts(sym):
+                    continue
+                f = self._files.get(sym)
+                if f is None:
+                    f = self._files[sym] = open(self._path(sym), "ab", buffering=0)
+                f.write(RAW.pack(ts, price))
+                self._last[sym] = ts
+                n += 1
+        return n
+
+    # ====== Đọc ======
+    def last(self, symbol: str) -> Optional[Tuple[float, float]]:
+        """Bản ghi raw mới nhất (ts, price)."""
+        arr = _map(self._path(symbol), RAW)
+        return None if arr is None else (float(arr["ts"][-1]), float(arr["close"][-1]))
+
+    def query(
+        self,
+        symbol: str,
+        since: float,
+        until: Optional[float] = None,
+        max_points: int = 1500,
+    ) -> Tuple[str, "np.ndarray", "np.ndarray"]:
+        """
+        Chọn tầng -> (tầng, ts, close). Chỉ đếm (bisect) trên mọi tầng, copy đúng 1 đoạn của tầng được chọn:
+          - trong các tầng có <= max_points điểm, lấy tầng phủ được sớm nhất (raw/1m có thể đã bị cắt
+            bởi retention), bằng nhau thì lấy tầng mịn hơn
+          - tầng nén chỉ có bucket đã đóng: nối thêm giá raw mới nhất để điểm cuối là giá hiện tại
+        """
+        import numpy as np
+
+        until = time.time() if until is None else until
+        tol = max((until - since) * 0.01, 1.0)
+        cands = []
+        for tier, res, rec in (("raw", 0, RAW),) + tuple((t, r, BAR) for t, r in TIERS):
+            n, first = _count(self._path(symbol, tier), rec, since, until)
+            if n:
+                cands.append((tier, res, rec, n, first))
+        if not cands:
+            return "raw", np.empty(0), np.empty(0)
+
+        def key(i: int):
+            return (round((max(cands[i][4], since) - since) / tol), i)
+
+        fit = [i for i, c in enumerate(cands) if c[3] <= max_points]
+        tier, res, rec, n, _ = cands[min(fit or range(len(cands)), key=key)]
+        arr = _read_range(self._path(symbol, tier), rec, since, until)
+        ts, px = arr["ts"], arr["close"]
+        if len(ts) > max_points:                     # chưa compact kịp: lấy thưa
+            step = len(ts) // max_points + 1
+            ts, px = ts[::step], px[::step]
+        last = self.last(symbol) if tier != "raw" else None
+        # _count và _read_range là 2 lần đọc: compact/retention chen giữa có thể cắt hết -> ts rỗng
+        if len(ts) and last and ts[-1] + res <= last[0] <= until:
+            ts, px = np.append(ts, last[0]), np.append(px, last[1])
+        return tier, ts, px
+
+    # ====== Compaction / retention ======
+    @staticmethod
+    def _rollup(src: "np.ndarray", res: int, start: float, closed_before: float) -> "np.ndarray":
+        """Gộp src (raw hoặc bar) thành bar `res` giây cho các bucket trong [start, closed_before)."""
+        import numpy as np
+
+        src = src[(src["ts"] >= start)]
+        bucket = np.floor(src["ts"] / res) * res
+        src, bucket = src[bucket + res <= closed_before], bucket[bucket + res <= closed_before]
+        out = np.empty(0, dtype=_dtype(BAR))
+        if not len(src):
+            return out
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        ends = np.r_[starts[1:], len(src)] - 1
+        hi = src["high"] if "high" in src.dtype.names else src["close"]
+        lo = src["low"] if "low" in src.dtype.names else src["close"]
+        op = src["open"] if "open" in src.dtype.names else src["close"]
+        out = np.empty(len(starts), dtype=_dtype(BAR))
+        out["ts"] = bucket[starts]
+        out["open"] = op[starts]
+        out["high"] = np.maximum.reduceat(hi, starts)
+        out["low"] = np.minimum.reduceat(lo, starts)
+        out["close"] = src["close"][ends]
+        return out
+
+    def _compact_symbol(self, symbol: str, now: float) -> int:
+        """Gộp tăng dần: mỗi tầng chỉ đọc phần nguồn mới hơn bar cuối đã có."""
+        added = 0
+        src_path, src_rec = self._path(symbol), RAW
+        for tier, res in TIERS:
+            path = self._path(symbol, tier)
+            have = _map(path, BAR)
+            start = float(have["ts"][-1]) + res if have is not None else 0.0
+            src = _read_range(src_path, src_rec, start, math.inf)
+            if len(src):
+                # bucket đóng khi nguồn đã có điểm sau nó, hoặc đồng hồ đã qua hẳn thêm 1 bucket
+                new = self._rollup(src, res, start, max(float(src["ts"][-1]), now - res))
+                if len(new):
+                    with open(path, "ab") as f:
+                        f.write(new.tobytes())
+                    added += len(new)
+            src_path, src_rec = path, BAR
+        return added
+
+    def _trim(self, path: str, rec: struct.Struct, keep_after: float, symbol: Optional[str] = None) -> int:
+        """Bỏ bản ghi cũ hơn keep_after: chép phần đuôi ra file tạm rồi os.replace (reader mmap cũ vẫn an toàn)."""
+        import numpy as np
+
+        arr = _read(path, rec)
+        if not len(arr) or arr["ts"][0] >= keep_after:
+            return 0
+        cut = int(np.searchsorted(arr["ts"], keep_after, "left"))
+        tmp = path + ".tmp"
+        with self._lock:
+            if symbol is not None:
+                # raw đang được append: đọc lại dưới lock để không mất bản ghi vừa ghi thêm
+                arr = _read(path, rec)
+                f = self._files.pop(symbol, None)
+                if f is not None:
+                    f.close()
+            with open(tmp, "wb") as f:
+                f.write(arr[cut:].tobytes())
+            os.replace(tmp, path)
+        return cut
+
+    def compact(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Chạy ở thread nền (offloader); trả về số bar mới / bản ghi đã cắt."""
+        now = time.time() if now is None else now
+        added = trimmed = 0
+        for sym in self.symbols():
+            try:
+                added += self._compact_symbol(sym, now)
+                for tier, rec in (("raw", RAW),) + tuple((t, BAR) for t, _ in TIERS):
+                    keep = self.retention.get(tier, 0)
+                    if keep:
+                        trimmed += self._trim(self._path(sym, tier), rec, now - keep, sym if tier == "raw" else None)
+            except Exception as e:
+                log.warning("Compact %s failed: %s", sym, e)
+        return {"bars": added, "trimmed": trimmed}
+
+    def close(self) -> None:
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+# ====== Hiển thị ======
+def sparkline(values: "np.ndarray", width: int = 32) -> str:
+    import numpy as np
+
+    if not len(values):
+        return ""
+    if len(values) > width:
+        values = np.array([c[-1] for c in np.array_split(values, width)])   # close của mỗi cột
+    lo, hi = float(values.min()), float(values.max())
+    if hi <= lo:
+        return SPARKS[len(SPARKS) // 2] * len(values)
+    idx = ((values - lo) / (hi - lo) * (len(SPARKS) - 1)).round().astype(int)
+    return "".join(SPARKS[i] for i in idx)
+
+def format_chart(
+    symbol: str, span_label: str, tier: str, ts: "np.ndarray", px: "np.ndarray", tz: Optional[tzinfo] = None
+) -> str:
+    """tz: múi giờ hiển thị (Settings.TZ), None = giờ local của máy."""
+    if len(px) < 2:
+        return f"Chưa có đủ dữ liệu giá {symbol.upper()} trong {span_label}."
+    first, last = float(px[0]), float(px[-1])
+    chg = (last - first) / first * 100.0 if first else 0.0
+    since = datetime.fromtimestamp(float(ts[0]), tz).strftime("%d/%m %H:%M")
+    return (
+        f"📈 <b>{symbol.upper()}</b> {span_label}: <code>{first:.6g}</code> → <code>{last:.6g}</code> "
+        f"(<b>{chg:+.2f}%</b>)\n"
+        f"<code>{sparkline(px)}</code>\n"
+        f"min <code>{float(px.min()):.6g}</code> · max <code>{float(px.max()):.6g}</code> · "
+        f"{len(px)} điểm ({tier}) từ {since}"
+    )
@@ -0,0 +1,255 @@
+# upstream.py
+"""
+Bảo vệ lời gọi HTTP ra upstream (CoinGecko, Binance, ...) theo từng host:
+  - TokenBucket: giới hạn tốc độ theo hạn mức công bố của từng API
+  - CircuitBreaker: host lỗi liên tục -> fail fast, sau thời gian chờ cho 1 request thăm dò (half-open)
+    request thăm dò luôn kết thúc bằng success / failure (timeout, huỷ cũng là failure),
+    không gửi được (hết quota) thì trả lại lượt thăm dò
+  - tôn trọng Retry-After khi bị 429/418
+Dùng được cho cả code sync (requests) lẫn asyncio (httpx).
+"""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from config import Settings
+
+class UpstreamError(Exception):
+    """Lỗi chung khi upstream từ chối phục vụ (không phải lỗi mạng)."""
+
+class CircuitOpen(UpstreamError):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} circuit open (retry in {retry_in:.0f}s)")
+        self.host = host
+        self.retry_in = retry_in
+
+class RateLimited(UpstreamError):
+    def __init__(self, host: str, wait: float):
+        super().__init__(f"{host} rate limited (need {wait:.1f}s)")
+        self.host = host
+        self.wait = wait
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate            # token / giây
+        self.burst = burst
+        self._tokens = burst
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, cost: float, max_wait: float) -> float:
+        """Giữ chỗ `cost` token. Trả về số giây phải chờ; -1 nếu phải chờ quá `max_wait`."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            wait = 0.0 if self._tokens >= cost else (cost - self._tokens) / self.rate
+            if wait > max_wait:
+                return -1.0
+            self._tokens -= cost    # có thể âm: các caller sau tự xếp hàng phía sau
+            return wait
+
+    def available(self, cost: float = 1.0) -> bool:
+        """Đủ `cost` token ngay bây giờ không (không trừ)."""
+        with self._lock:
+            return min(self.burst, self._tokens + (time.monotonic() - self._ts) * self.rate) >= cost
+
+    def try_acquire(self, cost: float = 1.0) -> bool:
+        return self._reserve(cost, 0.0) == 0.0
+
+    def acquire(self, cost: float = 1.0, max_wait: float = 5.0) -> bool:
+        wait = self._reserve(cost, max_wait)
+        if wait < 0:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, cost: float = 1.0, max_wait: float = 5.0) -> bool:
+        wait = self._reserve(cost, max_wait)
+        if wait < 0:
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        max_timeout: float = 300.0,
+        probe_timeout: float = 60.0,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.probe_timeout = probe_timeout      # lưới an toàn: probe không ai kết thúc quá lâu -> cho probe mới
+        self.failures = 0
+        self._state = CLOSED
+        self._open_until = 0.0
+        self._timeout = reset_timeout
+        self._probing = False
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() >= self._open_until:
+                return HALF_OPEN
+            return self._state
+
+    def retry_in(self) -> float:
+        return max(0.0, self._open_until - time.monotonic())
+
+    def allow(self) -> bool:
+        """Closed: luôn cho qua. Open: chặn. Hết hạn open: cho đúng 1 request thăm dò."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == OPEN and now < self._open_until:
+                return False
+            if self._probing and now - self._probe_at < self.probe_timeout:
+                return False
+            self._state = HALF_OPEN
+            self._probing = True
+            self._probe_at = now
+            return True
+
+    def release(self) -> None:
+        """Lượt vừa allow() không gửi được request nào (hết quota, bị huỷ khi chờ): trả lại lượt thăm dò."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self.failures = 0
+            self._timeout = self.reset_timeout
+            self._probing = False
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self.failures += 1
+            was_probe = self._state == HALF_OPEN
+            self._probing = False
+            if retry_after is None and not was_probe and self.failures < self.failure_threshold:
+                return
+            if was_probe:
+                self._timeout = min(self.max_timeout, self._timeout * 2)
+            self._state = OPEN
+            self._open_until = time.monotonic() + (self._timeout if retry_after is None else retry_after)
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None   # dạng HTTP-date: bỏ qua, dùng reset_timeout mặc định
+
+class HostGuard:
+    RETRY_STATUS = {418, 429, 500, 502, 503, 504}
+
+    def __init__(self, host: str, bucket: TokenBucket, breaker: CircuitBreaker, max_wait: float = 3.0):
+        self.host = host
+        self.bucket = bucket
+        self.breaker = breaker
+        self.max_wait = max_wait
+
+    def _check(self) -> None:
+        if not self.breaker.allow():
+            raise CircuitOpen(self.host, self.breaker.retry_in())
+
+    def before(self, cost: float = 1.0) -> None:
+        """Xin phép gửi. Đã qua thì caller phải kết thúc bằng observe() hoặc failure()."""
+        self._check()
+        if not self.bucket.acquire(cost, self.max_wait):
+            self.breaker.release()
+            raise RateLimited(self.host, cost / self.bucket.rate)
+
+    async def abefore(self, cost: float = 1.0) -> None:
+        self._check()
+        try:
+            ok = await self.bucket.aacquire(cost, self.max_wait)
+        except BaseException:               # bị huỷ lúc đang chờ token: chưa gửi gì
+            self.breaker.release()
+            raise
+        if not ok:
+            self.breaker.release()
+            raise RateLimited(self.host, cost / self.bucket.rate)
+
+    def observe(self, status: int, retry_after: Optional[str] = None) -> None:
+        """Ghi nhận kết quả 1 response HTTP."""
+        if status in self.RETRY_STATUS:
+            ra = _parse_retry_after(retry_after)
+            if ra is None and status in (418, 429):
+                ra = self.breaker.reset_timeout
+            self.breaker.record_failure(ra)
+        else:
+            self.breaker.record_success()
+
+    def failure(self) -> None:
+        """Lỗi mạng / timeout / bị huỷ giữa chừng (không có response)."""
+        self.breaker.record_failure()
+
+# Hạn mức công bố (mặc định bảo thủ): CoinGecko public ~30 call/phút,
+# Binance 6000 weight/phút/IP -> dùng một nửa. Chi phí Binance tính theo weight.
+_LIMITS = {
+    "api.coingecko.com": (Settings.CG_RATE_PER_MIN / 60.0, 5.0),
+    "api.binance.com":   (Settings.BINANCE_WEIGHT_PER_MIN / 60.0, 200.0),
+}
+_DEFAULT_LIMIT = (5.0, 10.0)
+
+_GUARDS: Dict[str, HostGuard] = {}
+_GUARDS_LOCK = threading.Lock()
+_SHARE = 1          # số process cùng chia hạn mức của 1 IP (shard mode)
+
+def set_quota_share(n: int) -> None:
+    """Process này chỉ được dùng 1/n hạn mức mỗi host (áp dụng cho guard tạo sau lời gọi)."""
+    global _SHARE
+    _SHARE = max(1, n)
+
+def host_of(url: str) -> str:
+    return urlsplit(url).hostname or url
+
+def guard_for(url: str) -> HostGuard:
+    host = host_of(url)
+    g = _GUARDS.get(host)
+    if g is None:
+        with _GUARDS_LOCK:
+            g = _GUARDS.get(host)
+            if g is None:
+                rate, burst = _LIMITS.get(host, _DEFAULT_LIMIT)
+                g = _GUARDS[host] = HostGuard(
+                    host,
+                    TokenBucket(rate / _SHARE, max(1.0, burst / _SHARE)),
+                    CircuitBreaker(Settings.BREAKER_FAILURES, Settings.BREAKER_RESET_SEC),
+                )
+    return g
+
+def status() -> Dict[str, str]:
+    return {h: g.breaker.state for h, g in _GUARDS.items()}
+
+def degraded(urls: List[str]) -> List[HostGuard]:
+    """Các host chưa về closed (open: fail fast, half-open: đang / chờ thăm dò) trong danh sách url."""
+    out = []
+    for u in urls:
+        g = _GUARDS.get(host_of(u))
+        if g is not None and g.breaker.state != CLOSED:
+            out.append(g)
+    return out
+
+def format_degraded(guards: List[HostGuard]) -> str:
+    parts = [
+        f"{g.host} (thử lại sau {g.breaker.retry_in():.0f}s)" if g.breaker.retry_in() else f"{g.host} (đang thử lại)"
+        for g in guards
+    ]
+    return "⚠️ Upstream degraded: " + ", ".join(parts)
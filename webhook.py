@@ -0,0 +1,347 @@
+# webhook.py
+"""
+Chế độ webhook: nhận update qua HTTP server asyncio nhúng sẵn (không cần tornado / long-poll).
+  - xác thực header X-Telegram-Bot-Api-Secret-Token (WEBHOOK_SECRET bắt buộc, xem config.ensure_core_env)
+  - update hỏng -> 400/200, không bao giờ 503 (Telegram gửi lại mãi)
+  - trả 200 ngay sau khi đưa update vào application.update_queue
+  - set_webhook chạy nền, không chặn startup
+  - SIGINT/SIGTERM: ngừng nhận request, xử lý nốt update đang chờ rồi mới tắt
+
+Thử local (không cần Telegram):
+  BOT_MODE=webhook WEBHOOK_SECRET=s python main.py
+  python webhook.py replay updates.jsonl --url http://127.0.0.1:8443/telegram --secret s
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import signal
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+
+log = logging.getLogger("rotchain.webhook")
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, path: str, query: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+Response = Tuple[int, str, bytes]          # (status, content-type, body)
+Handler = Callable[[Request], Awaitable[Response]]
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+            503: "Service Unavailable"}
+
+class MiniHTTPServer:
+    """
+    HTTP/1.1 tối giản trên asyncio.start_server: đủ cho webhook Telegram và endpoint nội bộ.
+    Hỗ trợ keep-alive, giới hạn kích thước body / số header / tổng byte header, route theo (method, path).
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8443,
+        max_body: int = 1 << 20,
+        max_headers: int = 100,
+        max_header_bytes: int = 16 << 10,
+    ):
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.max_headers = max_headers
+        self.max_header_bytes = max_header_bytes
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self.fallback: Optional[Handler] = None      # nhận mọi request không khớp route nào
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._conns: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._busy: set = set()                  # kết nối đang xử lý dở 1 request
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self) -> "MiniHTTPServer":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        log.info("HTTP server listening on %s:%s", self.host, self.port)
+        return self
+
+    async def stop(self, grace: float = 5.0) -> None:
+        if self._server is None:
+            return
+        self._server.close()                     # ngừng accept kết nối mới
+        if self._busy:
+            await asyncio.wait(list(self._busy), timeout=grace)
+        # Đóng socket thay vì cancel task: readline() trả EOF, _serve tự thoát gọn
+        for w in list(self._conns.values()):
+            w.close()
+        if self._conns:
+            await asyncio.wait(list(self._conns), timeout=1.0)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._conns[task] = writer
+        try:
+            while True:
+                req = await self._read_request(reader)
+                if req is None:
+                    break
+                if isinstance(req, int):
+                    await self._write(writer, (req, "text/plain", _REASONS.get(req, "").encode()), False)
+                    break
+                self._busy.add(task)
+                keep_alive = req.headers.get("connection", "").lower() != "close"
+                handler = self.routes.get((req.method, req.path)) or self.fallback
+                if handler is None:
+                    known = any(p == req.path for _, p in self.routes)
+                    resp: Response = (405 if known else 404, "text/plain", b"")
+                else:
+                    try:
+                        resp = await handler(req)
+                    except Exception as e:
+                        log.warning("Handler error %s %s: %s", req.method, req.path, e)
+                        resp = (503, "text/plain", b"")
+                await self._write(writer, resp, keep_alive and self._server is not None)
+                self._busy.discard(task)
+                if not keep_alive or self._server is None or not self._server.is_serving():
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self._busy.discard(task)
+            self._conns.pop(task, None)
+            writer.close()
+
+    @staticmethod
+    async def _readline(reader: asyncio.StreamReader) -> Optional[bytes]:
+        """None nếu dòng vượt limit của StreamReader (readline() báo ValueError, không phải LimitOverrunError)."""
+        try:
+            return await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            return None
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        line = await self._readline(reader)
+        if line is None:
+            return 400
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            return 400
+        headers: Dict[str, str] = {}
+        used = 0
+        while True:
+            h = await self._readline(reader)
+            if h is None:
+                return 431
+            if h in (b"\r\n", b"\n", b""):
+                break
+            used += len(h)
+            if len(headers) >= self.max_headers or used > self.max_header_bytes:
+                return 431
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            return 400
+        if length > self.max_body:
+            return 413
+        body = await reader.readexactly(length) if length else b""
+        path, _, query = target.partition("?")
+        return Request(method.upper(), path, query, headers, body)
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, resp: Response, keep_alive: bool) -> None:
+        status, ctype, body = resp
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {ctype}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+def require_bearer(token: str, handler: Handler) -> Handler:
+    """Route nhạy cảm trên listener public: cần `Authorization: Bearer <token>`, token rỗng thì luôn 403."""
+    expected = f"Bearer {token}"
+
+    async def _guarded(req: Request) -> Response:
+        if not token or not hmac.compare_digest(req.headers.get("authorization", ""), expected):
+            return 403, "text/plain", b""
+        return await handler(req)
+
+    return _guarded
+
+def webhook_handler(application, secret: str) -> Handler:
+    from telegram import Update
+
+    async def _handle(req: Request) -> Response:
+        if req.method != "POST":
+            return 405, "text/plain", b""
+        if secret and not hmac.compare_digest(req.headers.get(SECRET_HEADER, ""), secret):
+            return 403, "text/plain", b""
+        try:
+            data = json.loads(req.body or b"{}")
+        except ValueError:
+            return 400, "text/plain", b""
+        # Body sai cấu trúc: trả 4xx/2xx, đừng để thành 503 (Telegram sẽ gửi lại mãi)
+        if not isinstance(data, dict) or "update_id" not in data:
+            return 400, "text/plain", b""
+        try:
+            update = Update.de_json(data, application.bot)
+        except Exception as e:
+            # Đã qua secret -> là update thật từ Telegram mà ta không đọc được: bỏ qua, nhận 200
+            metrics.incr("webhook_bad_update")
+            log.warning("Dropping unparsable update %s: %r", data.get("update_id"), e)
+            return 200, "application/json", b"{}"
+        if update is None:
+            return 400, "text/plain", b""
+        await application.update_queue.put(update)
+        return 200, "application/json", b"{}"
+
+    return _handle
+
+async def _register_webhook(bot, url: str, secret: str) -> None:
+    for attempt in range(5):
+        try:
+            await bot.set_webhook(url=url, secret_token=secret or None, drop_pending_updates=False)
+            log.info("Webhook registered: %s", url)
+            return
+        except Exception as e:
+            log.warning("set_webhook failed (%d/5): %s", attempt + 1, e)
+            await asyncio.sleep(2 ** attempt)
+
+async def run_webhook(
+    application,
+    listen: str,
+    port: int,
+    path: str,
+    secret: str,
+    public_url: str = "",
+    extra_routes: Optional[Dict[Tuple[str, str], Handler]] = None,
+) -> None:
+    """Chạy bot ở chế độ webhook tới khi nhận SIGINT/SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    server = MiniHTTPServer(listen, port)
+    server.route("POST", path, webhook_handler(application, secret))
+    for (method, p), h in (extra_routes or {}).items():
+        server.route(method, p, h)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    await server.start()
+    register = None
+    if public_url:
+        register = asyncio.create_task(_register_webhook(application.bot, public_url.rstrip("/") + path, secret))
+    log.info("Bot running in webhook mode on %s:%s%s", listen, server.port, path)
+
+    try:
+        await stop.wait()
+    finally:
+        log.info("Shutting down webhook mode…")
+        if register and not register.done():
+            register.cancel()
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+# ====== Replay update đã ghi (test local) ======
+def load_updates(path: str, chat_id: int = 1, user_id: int = 1) -> Iterator[Dict[str, Any]]:
+    """
+    Đọc JSONL: dòng có "update_id" dùng nguyên; dòng khác (vd. requests.jsonl)
+    được dựng thành message update với text = "text" | "title" | "body".
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = {"text": line}
+            if isinstance(row, dict) and "update_id" in row:
+                yield row
+                continue
+            text = str(row.get("text") or row.get("title") or row.get("body") or "") if isinstance(row, dict) else str(row)
+            yield synth_update(i, text, chat_id, user_id)
+
+def synth_update(update_id: int, text: str, chat_id: int = 1, user_id: int = 1) -> Dict[str, Any]:
+    msg: Dict[str, Any] = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": msg}
+
+def replay(path: str, url: str, secret: str = "", chat_id: int = 1, user_id: int = 1) -> List[int]:
+    statuses: List[int] = []
+    for upd in load_updates(path, chat_id, user_id):
+        req = urllib.request.Request(
+            url,
+            data=json.dumps(upd).encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=10) as r:
+                statuses.append(r.status)
+        except urllib.error.HTTPError as e:
+            statuses.append(e.code)
+    return statuses
+
+def main():
+    ap = argparse.ArgumentParser(description="Webhook tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("replay", help="POST update đã ghi (JSONL) tới webhook local")
+    r.add_argument("path")
+    r.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    r.add_argument("--secret", default="")
+    r.add_argument("--chat-id", type=int, default=1)
+    r.add_argument("--user-id", type=int, default=1)
+    args = ap.parse_args()
+
+    if args.cmd == "replay":
+        statuses = replay(args.path, args.url, args.secret, args.chat_id, args.user_id)
+        ok = sum(1 for s in statuses if s == 200)
+        print(f"[webhook] replayed {len(statuses)} updates: {ok} OK, {len(statuses) - ok} failed")
+
+if __name__ == "__main__":
+    main()